@@ -1,43 +1,60 @@
+from __future__ import annotations
+
 import os
 import argparse
-from typing import Tuple
-from tqdm import tqdm
-
-from controllers.InitializationController import InitializationController
-from controllers.QuestionController import QuestionController
-from models.PDFProcessor import PDFTextImageExtractor
-from models.JsonProcessor import JsonProcessor
-from models.DocumentManager import DocumentManager
-from models.FAISSIndexManager import FAISSIndexManager
-from models.LangChainModel import LangChainModel
+from typing import Tuple, TYPE_CHECKING
 
 import json
 
-def initialize_components(source_path:str, category:str) -> Tuple[PDFTextImageExtractor, JsonProcessor, DocumentManager, FAISSIndexManager]:
-    pdf_processor = PDFTextImageExtractor(category, source_path)
+# 模型與索引相關模組載入較慢，解析完參數後才匯入，讓 --help 與參數錯誤能立即回應
+if TYPE_CHECKING:
+    from models.PDFProcessor import PDFTextImageExtractor
+    from models.JsonProcessor import JsonProcessor
+    from models.DocumentManager import DocumentManager
+    from models.FAISSIndexManager import FAISSIndexManager
+    from models.LangChainModel import LangChainModel
+    from models.SemanticAnswerCache import SemanticAnswerCache
+
+def initialize_components(source_path:str, category:str, pdf_workers:int=1, pdf_backend:str='pdfplumber', index_types:dict=None, metric:str='cosine', index_specs:dict=None, ocr_dpi:int=300, adaptive_ocr:bool=True) -> Tuple[PDFTextImageExtractor, JsonProcessor, DocumentManager, FAISSIndexManager]:
+    from models.PDFProcessor import PDFTextImageExtractor
+    from models.JsonProcessor import JsonProcessor
+    from models.DocumentManager import DocumentManager
+    from models.FAISSIndexManager import FAISSIndexManager
+
+    pdf_processor = PDFTextImageExtractor(category, source_path, workers=pdf_workers, backend=pdf_backend, ocr_dpi=ocr_dpi, adaptive_ocr=adaptive_ocr)
     json_processor = JsonProcessor(category, source_path)
     document_manager = DocumentManager(category)
-    faiss_index_manager = FAISSIndexManager(category)
+    faiss_index_manager = FAISSIndexManager(category, index_types=index_types, metric=metric, index_specs=index_specs)
     return pdf_processor, json_processor, document_manager, faiss_index_manager
 
-def run_initialization(category:str, pdf_processor:PDFTextImageExtractor, json_processor:JsonProcessor, document_manager:DocumentManager, faiss_index_manager:FAISSIndexManager):
+def run_initialization(category:str, pdf_processor:PDFTextImageExtractor, json_processor:JsonProcessor, document_manager:DocumentManager, faiss_index_manager:FAISSIndexManager, ingestion_mode:str='streaming', ocr_workers:int=None):
+    from controllers.InitializationController import InitializationController
+
     # try:
-    init_controller = InitializationController(category, pdf_processor, json_processor, document_manager, faiss_index_manager)
+    init_controller = InitializationController(category, pdf_processor, json_processor, document_manager, faiss_index_manager, streaming=ingestion_mode == 'streaming', ocr_workers=ocr_workers)
     init_controller.initialize_data_and_index()
     # except Exception as e:
     #     print(f"Error during initialization: {e}")
 
-def answer_question(human_question:str, category:str, faiss_index_manager:FAISSIndexManager, llm_model:LangChainModel):
+def answer_question(human_question:str, category:str, faiss_index_manager:FAISSIndexManager, llm_model:LangChainModel, sources:list=None):
+    from controllers.QuestionController import QuestionController
+
     question_controller = QuestionController(faiss_index_manager, llm_model)
-    response, sources_num = question_controller.handle_question(human_question, category)
+    response, sources_num = question_controller.handle_question(human_question, category, sources)
     return response, sources_num
 
-def calculate_accuracy():
+def answer_questions(human_questions:list[str], categories:list[str], faiss_index_manager:FAISSIndexManager, llm_model:LangChainModel, sources_list:list[list]=None, answer_cache:SemanticAnswerCache=None):
+    from controllers.QuestionController import QuestionController
+
+    question_controller = QuestionController(faiss_index_manager, llm_model, answer_cache)
+    return question_controller.handle_questions(human_questions, categories, sources_list)
+
+def calculate_accuracy(ground_truths_path:str='data/dataset/preliminary/ground_truths_example.json', model_output_path:str='data/model_output/model_output.json') -> float:
     print('calculate_accuracy')
-    with open('data/dataset/preliminary/ground_truths_example.json', 'r', encoding = 'utf-8') as f:
+    with open(ground_truths_path, 'r', encoding = 'utf-8') as f:
         ground_truths = json.load(f)
 
-    with open('data/model_output/model_output.json', 'r', encoding = 'utf-8') as f:
+    with open(model_output_path, 'r', encoding = 'utf-8') as f:
         model_output = json.load(f)
 
     ground_truths_dict = {}
@@ -58,29 +75,59 @@ def calculate_accuracy():
         if qid in ground_truths_dict and model_output_dict[qid] == ground_truths_dict[qid]:
             matching_count += 1
     
+    matching_ratio = 0.0
     if total_count > 0:
         matching_ratio = round(matching_count/total_count, 2)
     
     print("總數量:", total_count)
     print("相同的 retrieve 數量:", matching_count)
     print(f"相同的比例: {matching_ratio}")
+    return matching_ratio
     
 def main():
     parser = argparse.ArgumentParser(description='Process some paths and files.')
     parser.add_argument('--question_path', type=str, required=True, help='讀取發布題目路徑')
     parser.add_argument('--source_path', type=str, required=True, help='讀取參考資料路徑')
     parser.add_argument('--output_path', type=str, required=True, help='輸出符合參賽格式的答案路徑')
+    parser.add_argument('--pdf_workers', type=int, default=1, help='PDF 文字擷取與 OCR 的平行程序數')
+    parser.add_argument('--ingestion_mode', type=str, default='streaming', choices=['streaming', 'barrier'], help='逐檔串流經過擷取、OCR、摘要、嵌入與索引，或每個步驟處理完所有檔案才進行下一步')
+    parser.add_argument('--ocr_workers', type=int, default=None, help='串流建置時 OCR 的執行緒數，預設為 CPU 數')
+    parser.add_argument('--ocr_mode', type=str, default='adaptive', choices=['adaptive', 'all'], help='只 OCR 文字層未涵蓋的圖片區域，或 OCR 所有夠大的圖片')
+    parser.add_argument('--ocr_dpi', type=int, default=300, help='OCR 圖片區域的渲染解析度，0 表示使用圖片本身的像素')
+    parser.add_argument('--pdf_backend', type=str, default='pdfplumber', choices=['pymupdf', 'pdfplumber'], help='PDF 文字擷取後端')
+    parser.add_argument('--chunk_categories', type=str, nargs='*', default=[], help='改用切塊索引（不需 LLM 摘要）的類別')
+    parser.add_argument('--retrieval_mode', type=str, default='dense', choices=['dense', 'sparse', 'hybrid'], help='檢索模式：向量、BM25 或兩者融合')
+    parser.add_argument('--metric', type=str, default='cosine', choices=['cosine', 'l2'], help='向量索引的相似度量')
+    parser.add_argument('--index_specs', type=json.loads, default={}, help='各類別的向量索引結構，例如 \'{"finance": {"type": "hnsw", "M": 32}}\'')
+    parser.add_argument('--score_threshold', type=float, default=None, help='cosine 相似度門檻，達門檻的文件全部回傳')
+    parser.add_argument('--rerank_k', type=int, default=0, help='以 cross-encoder 重排序的候選文件數，0 表示不重排序')
+    parser.add_argument('--rerank_budget_ms', type=float, default=None, help='每題重排序的延遲預算（毫秒），超過時沿用向量檢索排序')
+    parser.add_argument('--answer_cache_threshold', type=float, default=None, help='相近問題沿用快取答案的 cosine 相似度門檻，未設定時不使用答案快取')
+    parser.add_argument('--trace', action='store_true', help='記錄各階段的計時與 LLM token 用量，結束時輸出摘要')
+    parser.add_argument('--trace_output', type=str, default=None, help='追蹤結果的輸出路徑，.prom 為 Prometheus 文字格式，其他為 JSON；指定時同時開啟追蹤')
     args = parser.parse_args()
+    index_types = {category: 'chunk' for category in args.chunk_categories}
+
+    from tqdm import tqdm
+    from config.Config import get_config
+    from models.Tracer import shared_tracer
+    from models.FAISSIndexManager import FAISSIndexManager
+    from models.CrossEncoderReranker import CrossEncoderReranker
+    from models.LangChainModel import get_shared_langchain_model
 
+    if args.trace or args.trace_output or get_config().TRACING_ENABLED:
+        shared_tracer.enable()
 
     # 第一步:初始化
     if True:
-        question_categories = ['finance', 'insurance']
-        faiss_index_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        # 搜尋時不會自動建立索引，faq 也需在此建立
+        question_categories = ['finance', 'insurance', 'faq']
+        faiss_index_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
         for category in tqdm(question_categories, desc="Building FAISS Indexes for Each Category"):
-            if not os.path.exists(os.path.join(faiss_index_file_path, f"{category}_faiss_index")):
-                pdf_processor, json_processor, document_manager, faiss_index_manager = initialize_components(args.source_path, category)
-                run_initialization(category, pdf_processor, json_processor, document_manager, faiss_index_manager)
+            # 有參考資料時一律執行初始化，manifest 會略過未變更的檔案，只更新差異
+            if os.path.exists(os.path.join(args.source_path, category)) or not os.path.exists(os.path.join(faiss_index_file_path, f"{category}_faiss_index")):
+                pdf_processor, json_processor, document_manager, faiss_index_manager = initialize_components(args.source_path, category, args.pdf_workers, args.pdf_backend, index_types, args.metric, args.index_specs, args.ocr_dpi or None, args.ocr_mode == 'adaptive')
+                run_initialization(category, pdf_processor, json_processor, document_manager, faiss_index_manager, args.ingestion_mode, args.ocr_workers)
                 # print(f'The {category} FAISS index has been created.')
             else:
                 # print(f'The {category} FAISS index already exists.')
@@ -94,19 +141,27 @@ def main():
             question_file = json.load(f)
         
         output = []
-        faiss_index_manager = FAISSIndexManager()
-        llm_model = LangChainModel()
+        reranker = CrossEncoderReranker(latency_budget_ms=args.rerank_budget_ms) if args.rerank_k > 0 else None
+        faiss_index_manager = FAISSIndexManager(retrieval_mode=args.retrieval_mode, index_types=index_types, reranker=reranker, rerank_k=args.rerank_k, metric=args.metric, score_threshold=args.score_threshold)
+        llm_model = get_shared_langchain_model()
+        answer_cache = None
+        if args.answer_cache_threshold is not None:
+            from models.SemanticAnswerCache import SemanticAnswerCache
+            answer_cache = SemanticAnswerCache(faiss_index_manager.embedding_model, threshold=args.answer_cache_threshold)
         
         final_result = {}
         
-        for question in tqdm(question_file['questions'], desc="Loading questions: Finding nearest document and LLM response"):
+        questions = question_file['questions']
+        print('Loading questions: Finding nearest document and LLM response')
+        # 每題只在其 source 列出的候選文件中檢索
+        answers = answer_questions([question.get('query') for question in questions], [question.get('category') for question in questions], faiss_index_manager, llm_model, [question.get('source') for question in questions], answer_cache)
+
+        for question, (response, sources_num) in zip(questions, answers):
             result = {}
             qid = question.get('qid')
             query = question.get('query')
             query_category = question.get('category')
 
-            response, sources_num = answer_question(query, query_category, faiss_index_manager, llm_model)
-
             result['qid'] = qid
             result['retrieve'] = int(sources_num[0])
             result['query'] = query
@@ -128,6 +183,13 @@ def main():
     if True:
         calculate_accuracy()
 
+    if shared_tracer.enabled:
+        print(shared_tracer.format_summary())
+        if args.trace_output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.trace_output)), exist_ok=True)
+            shared_tracer.export(args.trace_output)
+            print(f'***Trace written to {args.trace_output}.***')
+
         #python app.py --question_path "data/dataset/preliminary/questions_example.json" --source_path "data/reference" --output_path "data/model_output/model_output.json"
         #長requirement、readme檔案、改檔名class駝峰、snake
 if __name__ == "__main__":
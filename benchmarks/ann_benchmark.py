@@ -0,0 +1,82 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from models.FAISSIndexManager import FAISSIndexManager
+from models.IndexSpec import build_index, normalize_index_spec
+
+
+DEFAULT_SPECS = [
+    {'type': 'hnsw', 'M': 16, 'efSearch': 32},
+    {'type': 'hnsw', 'M': 32, 'efSearch': 64},
+    {'type': 'hnsw', 'M': 32, 'efSearch': 128},
+    {'type': 'ivfpq', 'nlist': 64, 'nprobe': 8, 'code_size': 64},
+    {'type': 'ivfpq', 'nlist': 64, 'nprobe': 16, 'code_size': 128},
+]
+
+
+def search_latency(index:faiss.Index, queries:np.ndarray, k:int) -> tuple[np.ndarray, float]:
+    """Searches one query at a time, like the service does, and returns the ids with the mean latency in ms."""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    start_time = time.perf_counter()
+    for row in range(len(queries)):
+        _, ids[row:row + 1] = index.search(queries[row:row + 1], k)
+    return ids, (time.perf_counter() - start_time) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare recall@k and latency of ANN index specs against the flat index of a category.')
+    parser.add_argument('--category', type=str, required=True, help='要測試的類別')
+    parser.add_argument('--question_path', type=str, default=None, help='以題目作為查詢；未提供時以索引中的向量作為查詢')
+    parser.add_argument('--specs', type=json.loads, default=DEFAULT_SPECS, help='要比較的索引設定（JSON 陣列）')
+    parser.add_argument('--k', type=int, default=5, help='recall@k 的 k')
+    parser.add_argument('--limit', type=int, default=200, help='最多使用的查詢數')
+    parser.add_argument('--output', type=str, default=None, help='將結果寫入 JSON 檔')
+    args = parser.parse_args()
+
+    faiss_index_manager = FAISSIndexManager(args.category)
+    if not faiss_index_manager.index_exists(args.category):
+        parser.error(f"The {args.category} FAISS index does not exist; build it with app.py first.")
+    vectors, faiss_ids, metric_type = faiss_index_manager.export_vectors(args.category)
+    dimension = vectors.shape[1]
+
+    if args.question_path:
+        with open(args.question_path, 'r', encoding='utf-8') as f:
+            questions = [question['query'] for question in json.load(f)['questions'] if question['category'] == args.category]
+        queries = faiss_index_manager.embed_queries(questions[:args.limit])
+    else:
+        queries = vectors[np.random.default_rng(0).permutation(len(vectors))[:args.limit]]
+
+    k = min(args.k, len(vectors))
+    flat_index, _ = build_index(normalize_index_spec(), dimension, metric_type, vectors, faiss_ids)
+    ground_truth, flat_latency = search_latency(flat_index, queries, k)
+
+    results = [{'spec': normalize_index_spec(), 'recall': 1.0, 'latency_ms': flat_latency, 'build_seconds': 0.0, 'bytes': faiss.serialize_index(flat_index).size}]
+    for spec in args.specs:
+        start_time = time.perf_counter()
+        index, effective_spec = build_index(spec, dimension, metric_type, vectors, faiss_ids)
+        build_seconds = time.perf_counter() - start_time
+
+        ids, latency = search_latency(index, queries, k)
+        recall = np.mean([len(set(row) & set(truth)) / k for row, truth in zip(ids, ground_truth)])
+        results.append({'spec': effective_spec, 'recall': float(recall), 'latency_ms': latency, 'build_seconds': build_seconds, 'bytes': faiss.serialize_index(index).size})
+
+    print(f"Category: {args.category}, vectors: {len(vectors)}, queries: {len(queries)}, k: {k}")
+    for result in results:
+        print(f"{json.dumps(result['spec'], sort_keys=True):<90} recall@{k}: {result['recall']:.3f}  "
+              f"latency: {result['latency_ms']:.3f} ms  build: {result['build_seconds']:.2f}s  size: {result['bytes'] / 1e6:.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'category': args.category, 'k': k, 'results': results}, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import json
+import time
+
+from models.FAISSIndexManager import FAISSIndexManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-question embedding latency with a cold and a warm query-embedding cache.')
+    parser.add_argument('--question_path', type=str, required=True, help='讀取發布題目路徑')
+    parser.add_argument('--query_disk_cache', action='store_true', help='啟用磁碟上的 float16 問題嵌入快取')
+    args = parser.parse_args()
+
+    with open(args.question_path, 'r', encoding='utf-8') as f:
+        queries = [question['query'] for question in json.load(f)['questions']]
+
+    faiss_index_manager = FAISSIndexManager(query_disk_cache=args.query_disk_cache)
+    embedding_model = faiss_index_manager.embedding_model
+    # 先載入模型，避免把冷啟動時間算進比較
+    embedding_model.embeddings.embed_documents(['warm up'])
+
+    for label in ('cold', 'warm'):
+        start_time = time.perf_counter()
+        for query in queries:
+            embedding_model.embed_query(query)
+        seconds = time.perf_counter() - start_time
+        print(f"{label}: {seconds / len(queries) * 1000:.3f} ms/question ({seconds:.2f}s)")
+
+    print(f"Embedding cache: {json.dumps(faiss_index_manager.get_embedding_cache_stats(), indent=4)}")
+
+
+if __name__ == '__main__':
+    main()
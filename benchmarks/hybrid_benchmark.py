@@ -0,0 +1,69 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import json
+import tempfile
+import time
+
+from app import calculate_accuracy
+from models.FAISSIndexManager import FAISSIndexManager
+from models.CrossEncoderReranker import CrossEncoderReranker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare retrieval accuracy and latency of dense, sparse (BM25) and hybrid retrieval.')
+    parser.add_argument('--question_path', type=str, required=True, help='讀取發布題目路徑')
+    parser.add_argument('--ground_truths_path', type=str, default='data/dataset/preliminary/ground_truths_example.json', help='正確答案路徑')
+    parser.add_argument('--modes', type=str, nargs='+', default=['dense', 'sparse', 'hybrid'], choices=['dense', 'sparse', 'hybrid'], help='要比較的檢索模式')
+    parser.add_argument('--fusion_k', type=int, default=20, help='融合時每個檢索器取回的候選數')
+    parser.add_argument('--dense_weight', type=float, default=1.0, help='向量檢索在 RRF 中的權重')
+    parser.add_argument('--sparse_weight', type=float, default=1.0, help='BM25 在 RRF 中的權重')
+    parser.add_argument('--rerank_k', type=int, default=0, help='以 cross-encoder 重排序的候選文件數，0 表示不重排序')
+    parser.add_argument('--rerank_budget_ms', type=float, default=None, help='每題重排序的延遲預算（毫秒）')
+    args = parser.parse_args()
+
+    with open(args.question_path, 'r', encoding='utf-8') as f:
+        questions = json.load(f)['questions']
+
+    queries = [question['query'] for question in questions]
+    categories = [question['category'] for question in questions]
+    sources_list = [question.get('source') for question in questions]
+
+    reranker = CrossEncoderReranker(latency_budget_ms=args.rerank_budget_ms) if args.rerank_k > 0 else None
+    faiss_index_manager = FAISSIndexManager(fusion_k=args.fusion_k, dense_weight=args.dense_weight, sparse_weight=args.sparse_weight, reranker=reranker, rerank_k=args.rerank_k)
+
+    # 只計 BM25 本身的查詢延遲
+    bm25_seconds = 0.0
+    for query, category, sources in zip(queries, categories, sources_list):
+        bm25_index = faiss_index_manager.index_registry.get_bm25_index(category)
+        start_time = time.perf_counter()
+        bm25_index.search(query, args.fusion_k, sources)
+        bm25_seconds += time.perf_counter() - start_time
+    print(f"BM25 search: {bm25_seconds / len(queries) * 1000:.3f} ms/question")
+
+    for mode in args.modes:
+        faiss_index_manager.retrieval_mode = mode
+        # 先載入模型、索引與語料，避免把冷啟動時間算進比較
+        faiss_index_manager.search_many(queries[:1], categories[:1], sources_list[:1])
+
+        start_time = time.perf_counter()
+        results = faiss_index_manager.search_many(queries, categories, sources_list)
+        seconds = time.perf_counter() - start_time
+
+        answers = [{'qid': question['qid'], 'retrieve': int(sources[0]) if sources else -1} for question, (_, sources) in zip(questions, results)]
+        with tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8', delete=False) as f:
+            json.dump({'ansewers': answers}, f, ensure_ascii=False)
+
+        print(f"\n[{mode}] {seconds / len(queries) * 1000:.3f} ms/question ({seconds:.2f}s)")
+        try:
+            calculate_accuracy(args.ground_truths_path, f.name)
+        finally:
+            os.remove(f.name)
+        if reranker is not None:
+            print(f"Rerank: {faiss_index_manager.get_rerank_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import time
+from difflib import SequenceMatcher
+
+import pymupdf
+
+from models.PDFProcessor import PDF_EXTRACTION_BACKENDS, get_extraction_backend
+
+
+def normalize_text(text:str) -> str:
+    return ''.join(text.split())
+
+def extract_texts(backend_name:str, file_names:list[str]) -> tuple[dict, int, float]:
+    backend = get_extraction_backend(backend_name)
+    texts = {}
+    page_count = 0
+    start_time = time.perf_counter()
+    for file_name in file_names:
+        with pymupdf.open(file_name) as pdf:
+            pages = backend.extract_pages(file_name, pdf)
+        page_count += len(pages)
+        texts[file_name] = ''.join(page_text for page_text, _ in pages)
+    return texts, page_count, time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare throughput and text similarity of the PDF extraction backends.')
+    parser.add_argument('--source_path', type=str, required=True, help='PDF 檔案所在的資料夾')
+    parser.add_argument('--reference_backend', type=str, default='pdfplumber', choices=list(PDF_EXTRACTION_BACKENDS), help='作為相似度基準的後端')
+    parser.add_argument('--limit', type=int, default=None, help='最多處理的檔案數量')
+    args = parser.parse_args()
+
+    file_names = sorted(os.path.join(args.source_path, f) for f in os.listdir(args.source_path) if f.endswith('.pdf'))
+    if args.limit:
+        file_names = file_names[:args.limit]
+
+    results = {backend_name: extract_texts(backend_name, file_names) for backend_name in PDF_EXTRACTION_BACKENDS}
+    reference_texts = results[args.reference_backend][0]
+
+    for backend_name, (texts, page_count, seconds) in results.items():
+        # 以去除空白後的字元序列比較，忽略換行與排版差異
+        similarities = [
+            SequenceMatcher(None, normalize_text(reference_texts[file_name]), normalize_text(texts[file_name])).ratio()
+            for file_name in file_names
+        ]
+        mean_similarity = sum(similarities) / len(similarities) if similarities else 0
+        print(f"{backend_name:<11} pages={page_count} {page_count / seconds:.2f} pages/sec  "
+              f"similarity to {args.reference_backend}: mean={mean_similarity:.4f} min={min(similarities, default=0):.4f}")
+
+
+if __name__ == '__main__':
+    main()
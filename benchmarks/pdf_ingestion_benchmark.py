@@ -0,0 +1,36 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import time
+
+from models.PDFProcessor import iter_raw_pdf_content
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report PDF text extraction and OCR throughput (pages/sec) against worker count.')
+    parser.add_argument('--source_path', type=str, required=True, help='PDF 檔案所在的資料夾')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='要比較的平行程序數')
+    parser.add_argument('--backend', type=str, default='pdfplumber', choices=['pymupdf', 'pdfplumber'], help='PDF 文字擷取後端')
+    parser.add_argument('--limit', type=int, default=None, help='最多處理的檔案數量')
+    args = parser.parse_args()
+
+    file_names = sorted(os.path.join(args.source_path, f) for f in os.listdir(args.source_path) if f.endswith('.pdf'))
+    if args.limit:
+        file_names = file_names[:args.limit]
+
+    # 只量測 CPU 階段（文字擷取與 OCR），不呼叫 LLM
+    baseline = None
+    for workers in args.workers:
+        start_time = time.perf_counter()
+        page_count = sum(len(raw_pages) for _, raw_pages in iter_raw_pdf_content(file_names, workers=workers, backend=args.backend))
+        seconds = time.perf_counter() - start_time
+
+        pages_per_second = page_count / seconds
+        baseline = baseline or pages_per_second
+        print(f"workers={workers:<3} files={len(file_names)} pages={page_count} {pages_per_second:.2f} pages/sec ({pages_per_second / baseline:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+DEFAULT_CONFIGS = [
+    {'name': 'dense', 'retrieval_mode': 'dense'},
+    {'name': 'hybrid', 'retrieval_mode': 'hybrid'},
+    {'name': 'dense+rerank', 'retrieval_mode': 'dense', 'rerank_k': 10},
+]
+
+# 影響索引建置的設定；指定任一項時在 index_directory 下另建索引，不覆寫服務使用的索引
+INDEX_KEYS = ('index_type', 'metric', 'index_spec')
+SEARCH_KEYS = ('retrieval_mode', 'fusion_k', 'rrf_k', 'dense_weight', 'sparse_weight', 'chunk_k', 'chunk_aggregation', 'chunk_top_k', 'rerank_k')
+
+
+def load_questions(question_path:str, ground_truths_path:str) -> list[dict]:
+    """Questions that have a ground truth, each with its `truth` source as a string."""
+    with open(question_path, 'r', encoding='utf-8') as f:
+        questions = json.load(f)['questions']
+    with open(ground_truths_path, 'r', encoding='utf-8') as f:
+        ground_truths = {item['qid']: str(item['retrieve']) for item in json.load(f)['ground_truths']}
+    return [dict(question, truth=ground_truths[question['qid']]) for question in questions if question['qid'] in ground_truths]
+
+def build_faiss_index_manager(config:dict, categories:list[str], index_directory:str, rebuild:bool=False):
+    from models.FAISSIndexManager import FAISSIndexManager
+    from models.CrossEncoderReranker import CrossEncoderReranker
+
+    rerank_k = config.get('rerank_k', 0)
+    reranker = CrossEncoderReranker(latency_budget_ms=config.get('rerank_budget_ms')) if rerank_k > 0 else None
+    kwargs = {key: config[key] for key in SEARCH_KEYS if key in config}
+    kwargs.update(reranker=reranker, rerank_k=rerank_k or 10, metric=config.get('metric', 'cosine'))
+    if 'index_type' in config:
+        kwargs['index_types'] = {category: config['index_type'] for category in categories}
+    if 'index_spec' in config:
+        kwargs['index_specs'] = {category: config['index_spec'] for category in categories}
+
+    index_settings = {key: config[key] for key in INDEX_KEYS if key in config}
+    if not index_settings:
+        # 使用服務的索引，只評測不建置，避免改動服務使用的索引
+        faiss_index_manager = FAISSIndexManager(**kwargs)
+        missing_categories = [category for category in categories if not faiss_index_manager.index_exists(category)]
+        if missing_categories:
+            raise RuntimeError(f"The FAISS indexes of {missing_categories} do not exist; build them with app.py before benchmarking.")
+        return faiss_index_manager
+
+    # 同一組索引設定共用一個目錄，之後的執行直接沿用
+    settings_key = hashlib.sha256(json.dumps(index_settings, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    directory = os.path.join(index_directory, settings_key)
+    os.makedirs(directory, exist_ok=True)
+    faiss_index_manager = FAISSIndexManager(index_directory=directory, **kwargs)
+
+    for category in categories:
+        if faiss_index_manager.index_exists(category) and not rebuild:
+            continue
+        if faiss_index_manager.get_index_type(category) == 'summary':
+            from models.DocumentManager import DocumentManager
+            # 摘要索引只使用已存在的摘要，不呼叫 LLM
+            if not DocumentManager(category).exists():
+                raise RuntimeError(f"The {category} summaries do not exist; build them with app.py before benchmarking a summary index.")
+        print(f"Building the {category} index for {index_settings} in {directory}.")
+        faiss_index_manager.rebuild_index(category)
+    return faiss_index_manager
+
+def evaluate_rankings(questions:list[dict], rankings:list[list[str]], ks:list[int]) -> dict:
+    """accuracy@1, recall@k and MRR (over the ranked candidates) per category and overall."""
+    groups = {}
+    for question, ranked_sources in zip(questions, rankings):
+        ranked_sources = [str(source) for source in ranked_sources or []]
+        rank = ranked_sources.index(question['truth']) + 1 if question['truth'] in ranked_sources else None
+        for group in (question['category'], 'overall'):
+            groups.setdefault(group, []).append(rank)
+
+    metrics = {}
+    for group, ranks in groups.items():
+        metrics[group] = {
+            'questions': len(ranks),
+            'accuracy@1': sum(rank == 1 for rank in ranks) / len(ranks),
+            **{f'recall@{k}': sum(rank is not None and rank <= k for rank in ranks) / len(ranks) for k in ks},
+            'mrr': sum(1 / rank for rank in ranks if rank is not None) / len(ranks),
+        }
+    return metrics
+
+def run_config(config:dict, questions:list[dict], ks:list[int], batch_size:int, index_directory:str, rebuild:bool=False) -> dict:
+    categories = sorted({question['category'] for question in questions})
+    queries = [question['query'] for question in questions]
+    question_categories = [question['category'] for question in questions]
+    sources_list = [question.get('source') for question in questions]
+    depth = max(ks)
+
+    start_time = time.perf_counter()
+    faiss_index_manager = build_faiss_index_manager(config, categories, index_directory, rebuild)
+    # 先載入模型、索引與語料，避免把冷啟動時間算進延遲
+    faiss_index_manager.preload(categories)
+    faiss_index_manager.rank_many(queries[:1], question_categories[:1], sources_list[:1], depth=depth)
+    setup_seconds = time.perf_counter() - start_time
+
+    # 逐題檢索量測延遲，與服務一次處理一題的情況相同
+    latencies = []
+    rankings = []
+    for query, category, sources in zip(queries, question_categories, sources_list):
+        start_time = time.perf_counter()
+        rankings.extend(faiss_index_manager.rank_many([query], [category], [sources], depth=depth))
+        latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    faiss_index_manager.rank_many(queries, question_categories, sources_list, batch_size, depth)
+    batched_seconds = time.perf_counter() - start_time
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'config': config,
+        'metrics': evaluate_rankings(questions, rankings, ks),
+        'latency_ms': {
+            'mean': float(latencies_ms.mean()),
+            'p50': float(np.percentile(latencies_ms, 50)),
+            'p95': float(np.percentile(latencies_ms, 95)),
+            'p99': float(np.percentile(latencies_ms, 99)),
+        },
+        'throughput_qps': {
+            'sequential': len(questions) / sum(latencies),
+            'batched': len(questions) / batched_seconds,
+        },
+        # Linux 的 ru_maxrss 單位為 KB
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'setup_seconds': setup_seconds,
+        'rerank': faiss_index_manager.get_rerank_stats(),
+    }
+
+def compare_with_baseline(results:list[dict], baseline_path:str, tolerance:float) -> list[str]:
+    """Regressions of accuracy@1 and MRR beyond `tolerance` against the configs of the same name in a previous run."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result['config']['name']: result for result in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['config']['name'])
+        if previous is None:
+            continue
+        for group, metrics in result['metrics'].items():
+            for metric in ('accuracy@1', 'mrr'):
+                previous_value = previous['metrics'].get(group, {}).get(metric)
+                if previous_value is not None and metrics[metric] < previous_value - tolerance:
+                    regressions.append(f"{result['config']['name']} {group} {metric}: {previous_value:.4f} -> {metrics[metric]:.4f}")
+    return regressions
+
+def format_result(result:dict) -> str:
+    lines = [f"[{result['config']['name']}] p50={result['latency_ms']['p50']:.2f}ms p95={result['latency_ms']['p95']:.2f}ms "
+             f"p99={result['latency_ms']['p99']:.2f}ms  {result['throughput_qps']['sequential']:.1f} q/s sequential, "
+             f"{result['throughput_qps']['batched']:.1f} q/s batched  peak RSS {result['peak_rss_mb']:.0f} MB"]
+    for group, metrics in result['metrics'].items():
+        values = '  '.join(f"{name}={value:.4f}" for name, value in metrics.items() if name != 'questions')
+        lines.append(f"  {group:<10} n={metrics['questions']:<5} {values}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate retrieval alone (no LLM calls): accuracy@1, recall@k and MRR per category, latency, throughput and peak RSS for a sweep of configurations.')
+    parser.add_argument('--question_path', type=str, required=True, help='讀取發布題目路徑')
+    parser.add_argument('--ground_truths_path', type=str, default='data/dataset/preliminary/ground_truths_example.json', help='正確答案路徑')
+    parser.add_argument('--configs', type=json.loads, default=DEFAULT_CONFIGS,
+                        help='要比較的設定（JSON 陣列），可用鍵：name、index_type、metric、index_spec、rerank_k、rerank_budget_ms 及 ' + '、'.join(SEARCH_KEYS))
+    parser.add_argument('--ks', type=int, nargs='+', default=[1, 3, 5], help='recall@k 的 k，最大值同時是 MRR 的排名深度')
+    parser.add_argument('--batch_size', type=int, default=32, help='批次檢索時每批嵌入的問題數')
+    parser.add_argument('--index_directory', type=str, default='data/benchmark_indexes', help='依索引設定另建索引的目錄')
+    parser.add_argument('--rebuild', action='store_true', help='重新建置 index_directory 中已存在的索引')
+    parser.add_argument('--in_process', action='store_true', help='在同一個程序中依序執行所有設定（peak RSS 為累計值）')
+    parser.add_argument('--output', type=str, default=None, help='結果 JSON 路徑，預設寫入 data/benchmark_results/')
+    parser.add_argument('--baseline', type=str, default=None, help='與先前的結果 JSON 比較，準確率下降時以非零狀態結束')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='允許的 accuracy@1 與 MRR 下降幅度')
+    args = parser.parse_args()
+
+    questions = load_questions(args.question_path, args.ground_truths_path)
+    configs = [dict(config, name=config.get('name') or json.dumps(config, sort_keys=True)) for config in args.configs]
+
+    results = []
+    for config in configs:
+        if args.in_process:
+            result = run_config(config, questions, args.ks, args.batch_size, args.index_directory, args.rebuild)
+        else:
+            # 每個設定在獨立的程序中執行，peak RSS 只反映該設定
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = executor.submit(run_config, config, questions, args.ks, args.batch_size, args.index_directory, args.rebuild).result()
+        results.append(result)
+        print(format_result(result))
+
+    output_path = args.output or os.path.join('data', 'benchmark_results', f"retrieval_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'question_path': args.question_path,
+            'ground_truths_path': args.ground_truths_path,
+            'questions': len(questions),
+            'ks': args.ks,
+            'results': results,
+        }, f, ensure_ascii=False, indent=4)
+    print(f"Results written to {output_path}.")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import json
+import time
+
+from models.FAISSIndexManager import FAISSIndexManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare questions/sec of per-question search against search_many.')
+    parser.add_argument('--question_path', type=str, required=True, help='讀取發布題目路徑')
+    parser.add_argument('--batch_size', type=int, default=32, help='每次嵌入的問題數量')
+    args = parser.parse_args()
+
+    with open(args.question_path, 'r', encoding='utf-8') as f:
+        questions = json.load(f)['questions']
+
+    queries = [question['query'] for question in questions]
+    categories = [question['category'] for question in questions]
+
+    # 關閉問題嵌入快取，兩種方式都需實際嵌入每個問題
+    faiss_index_manager = FAISSIndexManager(query_batch_size=args.batch_size, query_cache_size=0)
+
+    # 先載入模型、索引與語料，避免把冷啟動時間算進比較
+    faiss_index_manager.search_many(queries[:1], categories[:1])
+    for category in set(categories):
+        faiss_index_manager.search(queries[categories.index(category)], category)
+
+    start_time = time.perf_counter()
+    single_results = [faiss_index_manager.search(query, category) for query, category in zip(queries, categories)]
+    single_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    batch_results = faiss_index_manager.search_many(queries, categories)
+    batch_seconds = time.perf_counter() - start_time
+
+    mismatches = sum(1 for single, batch in zip(single_results, batch_results) if single[1] != batch[1])
+
+    print(f"Questions: {len(queries)}, batch size: {args.batch_size}")
+    print(f"search      : {len(queries) / single_seconds:.2f} questions/sec ({single_seconds:.2f}s)")
+    print(f"search_many : {len(queries) / batch_seconds:.2f} questions/sec ({batch_seconds:.2f}s)")
+    print(f"Speedup     : {single_seconds / batch_seconds:.2f}x")
+    print(f"Retrieved sources that differ: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
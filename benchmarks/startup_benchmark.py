@@ -0,0 +1,78 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import json
+import subprocess
+import time
+
+
+ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+DEFAULT_MODULES = [
+    'app',
+    'models.FAISSIndexManager',
+    'models.LangChainModel',
+    'models.PDFProcessor',
+    'models.DocumentManager',
+]
+
+
+def import_times(module:str) -> list[tuple[str, int, int]]:
+    """Imports the module in a fresh interpreter and returns (module, self_us, cumulative_us) from -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT_PATH, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def command_seconds(command:list[str], repeat:int) -> float:
+    """Runs the command `repeat` times and returns the fastest wall time."""
+    env = dict(os.environ)
+    # --help 不應需要 API 金鑰
+    env.pop('OPENAI_API_KEY', None)
+    seconds = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run(command, cwd=ROOT_PATH, env=env, capture_output=True, check=True)
+        seconds.append(time.perf_counter() - start_time)
+    return min(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import times of the project modules and the startup time of the CLI.')
+    parser.add_argument('--modules', type=str, nargs='*', default=DEFAULT_MODULES, help='要測量匯入時間的模組')
+    parser.add_argument('--top', type=int, default=10, help='每個模組列出累計匯入時間最長的子模組數')
+    parser.add_argument('--repeat', type=int, default=3, help='CLI 啟動時間的重複次數，取最快一次')
+    parser.add_argument('--output', type=str, default=None, help='將結果寫入 JSON 檔')
+    args = parser.parse_args()
+
+    results = {'modules': {}}
+    for module in args.modules:
+        times = import_times(module)
+        total_us = next((cumulative_us for name, _, cumulative_us in times if name == module), 0)
+        slowest = sorted((entry for entry in times if entry[0] != module), key=lambda entry: entry[2], reverse=True)[:args.top]
+        results['modules'][module] = {'seconds': total_us / 1e6, 'slowest': [{'module': name, 'seconds': cumulative_us / 1e6} for name, _, cumulative_us in slowest]}
+
+        print(f"import {module}: {total_us / 1e6:.3f}s")
+        for name, _, cumulative_us in slowest:
+            print(f"    {name:<60} {cumulative_us / 1e6:.3f}s")
+
+    results['app_help_seconds'] = command_seconds([sys.executable, 'app.py', '--help'], args.repeat)
+    print(f"python app.py --help: {results['app_help_seconds']:.3f}s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import threading
 from dotenv import load_dotenv
 
 class Config:
@@ -11,10 +12,50 @@ class Config:
         
         load_dotenv(dotenv_path)
 
+        # 只有實際建立 OpenAI 客戶端時才需要金鑰，見 SharedModels.get_chat_model
         self.OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-        if not self.OPENAI_API_KEY:
-            raise ValueError("Missing OPENAI_API_KEY environment variable.")
-            
+
+        # LLM 併發數與速率限制，未設定 RPM/TPM 時不限制
+        self.LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+        self.LLM_REQUESTS_PER_MINUTE = self._get_optional_int('LLM_REQUESTS_PER_MINUTE')
+        self.LLM_TOKENS_PER_MINUTE = self._get_optional_int('LLM_TOKENS_PER_MINUTE')
+        self.LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '5'))
+
+        # LLM 輸出快取，設定 LLM_CACHE_ENABLED=0 可略過快取
+        self.LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1') not in ('0', 'false', 'False')
+        self.LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '100000'))
+        self.LLM_CACHE_MAX_BYTES = self._get_optional_int('LLM_CACHE_MAX_BYTES')
+
+        # OCR 結果快取；預設 -1 只沿用內容完全相同的圖片，設為 0 以上時感知雜湊相差不超過此位元數、且像素逐區塊比對相符的同尺寸圖片也沿用
+        self.OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', '1') not in ('0', 'false', 'False')
+        self.OCR_CACHE_MAX_DISTANCE = int(os.getenv('OCR_CACHE_MAX_DISTANCE', '-1'))
+        self.OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', '100000'))
+        # OCR 常駐執行緒數，未設定時為 CPU 數
+        self.OCR_WORKERS = self._get_optional_int('OCR_WORKERS')
+
+        # 各階段的計時與 token 統計，也可用 app.py / server.py 的 --trace 開啟
+        self.TRACING_ENABLED = os.getenv('TRACING_ENABLED', '0') not in ('0', 'false', 'False')
+        # 每百萬 token 的美元價格，預設為 gpt-4o-mini 的定價，用於估算 LLM 成本
+        self.LLM_INPUT_COST_PER_MILLION = float(os.getenv('LLM_INPUT_COST_PER_MILLION', '0.15'))
+        self.LLM_OUTPUT_COST_PER_MILLION = float(os.getenv('LLM_OUTPUT_COST_PER_MILLION', '0.60'))
+
+    @staticmethod
+    def _get_optional_int(name:str):
+        value = os.getenv(name)
+        return int(value) if value else None
+
+
+_config = None
+_config_lock = threading.Lock()
+
+def get_config() -> Config:
+    """Returns the process-wide Config, reading .env on first use."""
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = Config()
+        return _config
+
 
 if __name__ == '__main__':
     config = Config()
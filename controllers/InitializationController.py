@@ -1,25 +1,198 @@
 import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config.Config import get_config
+from models.PDFProcessor import extract_pdf_pages, ocr_pdf_pages
+from models.StreamingPipeline import PipelineStage, StreamingPipeline
 
 class InitializationController:
-    def __init__(self, category, pdf_processor, json_processor, document_manager, faiss_index_manager):
+    """
+    Builds or updates the corpus, the summaries and the FAISS index of a category.
+
+    With `streaming` enabled, PDF files flow one by one through extraction, OCR, LLM formatting, corpus storage,
+    summarization (or chunking), embedding and indexing, each stage running concurrently on its own workers and
+    bounded queues. The index is published as soon as the first documents are embedded and then every
+    `publish_interval` seconds, so they become searchable while the rest of the corpus is still being processed.
+    These intermediate publishes only write what changed since the previous one: a flat index, a BM25 update and
+    appended summaries. The final publish builds the configured ANN structure and merges the summaries file.
+    Files are only marked done, and deleted files only dropped, in the manifest once their changes are published,
+    so an interrupted build resumes from the first unpublished file.
+
+    FAQ data, indexes that must be rebuilt from the whole corpus and `streaming=False` use the stage-by-stage
+    build, where each step finishes for all files before the next one starts.
+    """
+    def __init__(self, category, pdf_processor, json_processor, document_manager, faiss_index_manager, streaming:bool=True, ocr_workers:int=None, llm_workers:int=None, embed_batch_size:int=32, queue_size:int=8, publish_interval:float=30.0, report_interval:float=None):
         self.category = category
         self.pdf_processor = pdf_processor
         self.json_processor = json_processor
         self.document_manager = document_manager
         self.faiss_index_manager = faiss_index_manager
 
+        self.streaming = streaming
+        # OCR 以 Tesseract 子程序執行，執行緒數可接近 CPU 數；LLM 階段沿用 LLM 的並行上限
+        self.ocr_workers = ocr_workers or os.cpu_count() or 1
+        self.llm_workers = llm_workers or get_config().LLM_MAX_CONCURRENCY
+        self.embed_batch_size = embed_batch_size
+        self.queue_size = queue_size
+        self.publish_interval = publish_interval
+        self.report_interval = report_interval
+        self.pipeline_metrics = None
+
     def initialize_data_and_index(self):
         # try:
+        if self.streaming and self._can_stream():
+            self._initialize_streaming()
+            return
+
+        # 只處理新增、變更或刪除的檔案，後續摘要與索引也只接收這些差異
         if self.category == 'faq':
-            self.json_processor.create_and_save_json_content()
+            processor = self.json_processor
+            processor.create_and_save_json_content()
+
+        else:
+            processor = self.pdf_processor
+            processor.create_and_save_pdf_content()
+        delta = processor.delta
 
+        # 切塊索引直接嵌入語料切塊，不需要 LLM 摘要
+        if self.faiss_index_manager.get_index_type(self.category) == 'chunk':
+            updated_documents = self.document_manager.update_chunked_documents(delta['updated'])
         else:
-            self.pdf_processor.create_and_save_pdf_content()
-            
-        self.document_manager.create_summarized_documents()
-        self.faiss_index_manager.create_index()
+            updated_documents = self.document_manager.update_summarized_documents(delta['updated'], delta['deleted'])
+        self.faiss_index_manager.update_index(updated_documents, delta['deleted'])
+        # 索引更新後才將檔案標記為完成，中斷時下次執行會再次套用這次的差異；摘要失敗的檔案留待下次重試
+        processor.commit_delta(self.document_manager.failed_sources)
 
         # except Exception as e:
         #     print(f"Error during initialization: {e}")
+
+    def _can_stream(self) -> bool:
+        if self.category == 'faq' or self.faiss_index_manager.needs_rebuild(self.category):
+            return False
+
+        index_exists = os.path.exists(os.path.join(self.faiss_index_manager.index_directory, f"{self.category}_faiss_index"))
+        if not index_exists:
+            # 已有語料卻沒有索引時，未變更的檔案不會再流經管線，需由整份語料建置索引
+            return not self.pdf_processor.corpusmanager.exists()
+        # 摘要索引逐批追加摘要，摘要遺失時需重新摘要整份語料
+        return self.faiss_index_manager.get_index_type(self.category) == 'chunk' or self.document_manager.exists()
+
+    def _initialize_streaming(self):
+        self._vector_store = self.faiss_index_manager.load_for_update(self.category)
+        files_to_process, stored_files, deleted_sources = self.pdf_processor.prepare_delta()
+        # 已寫入語料但尚未建立索引的檔案重新流經管線，OCR 與 LLM 快取讓重新擷取的成本很低
+        files_to_process = stored_files + files_to_process
+        if self._vector_store is not None and deleted_sources:
+            self.faiss_index_manager.remove_sources(self._vector_store, deleted_sources)
+
+        # 尚未發布的變更；刪除的 source 隨第一次發布生效
+        self._pending = {'files': [], 'sources': [], 'documents': [], 'deleted': list(deleted_sources), 'deleted_files': list(self.pdf_processor.deleted_files)}
+        self._last_publish_time = None
+        self._published_partially = False
+        self._stored_sources = []
+        self._extract_executor = ProcessPoolExecutor(self.pdf_processor.workers) if self.pdf_processor.workers > 1 else None
+
+        is_chunk_index = self.faiss_index_manager.get_index_type(self.category) == 'chunk'
+        pipeline = StreamingPipeline([
+            PipelineStage('extract', self._extract, workers=self.pdf_processor.workers, queue_size=self.queue_size),
+            PipelineStage('ocr', self._ocr, workers=self.ocr_workers, queue_size=self.queue_size),
+            PipelineStage('format', self._format, workers=self.llm_workers, queue_size=self.queue_size),
+            PipelineStage('store', self._store, workers=1, queue_size=self.queue_size),
+            PipelineStage('chunk' if is_chunk_index else 'summarize', self._chunk if is_chunk_index else self._summarize, workers=1 if is_chunk_index else self.llm_workers, queue_size=self.queue_size),
+            PipelineStage('embed', self._embed, workers=1, queue_size=self.queue_size, batch_size=self.embed_batch_size),
+            PipelineStage('index', self._index, workers=1, queue_size=self.queue_size),
+        ], report_interval=self.report_interval)
+
+        try:
+            self.pipeline_metrics = pipeline.run(files_to_process)
+        finally:
+            if self._extract_executor is not None:
+                self._extract_executor.shutdown()
+
+        if self._pending['files'] or self._pending['deleted'] or self._published_partially:
+            self._publish(final=True)
+        elif self._vector_store is not None and not files_to_process:
+            # 沒有檔案變更時仍套用相似度量或索引結構的設定變更
+            self.faiss_index_manager.update_index([], [], self.category)
+        self.pdf_processor.corpusmanager.export_json()
+        self.pdf_processor.delta = {'updated': self._stored_sources, 'deleted': deleted_sources}
+        print(pipeline.format_metrics())
+        self.pdf_processor.report_ocr()
+
+    def _extract(self, file:str):
+        file_name = os.path.join(self.pdf_processor.category_source_path, file)
+        args = (file_name, self.pdf_processor.min_width, self.pdf_processor.min_height, self.pdf_processor.backend, self.pdf_processor.ocr_dpi, self.pdf_processor.adaptive_ocr)
+        if self._extract_executor is not None:
+            # 文字擷取受 GIL 限制，多個 worker 時交給子程序
+            pages = self._extract_executor.submit(extract_pdf_pages, *args).result()
+        else:
+            pages = extract_pdf_pages(*args)
+        return [(file, pages)]
+
+    def _ocr(self, item):
+        file, pages = item
+        return [(file, ocr_pdf_pages(pages, self.pdf_processor.ocr_cache, self.pdf_processor.ocr_report))]
+
+    def _format(self, item):
+        file, raw_pages = item
+        return [(file, self.pdf_processor.format_raw_pages(raw_pages))]
+
+    def _store(self, item):
+        file, page_texts = item
+        source = self.pdf_processor.store_document(file, page_texts)
+        self._stored_sources.append(source)
+        return [(file, source, "\n---\n".join(page_texts))]
+
+    def _summarize(self, item):
+        file, source, content = item
+        return [(file, source, self.document_manager.summarize_document(source, content))]
+
+    def _chunk(self, item):
+        file, source, content = item
+        return [(file, source, self.document_manager.chunk_document(source, content))]
+
+    def _embed(self, items:list):
+        # 一批檔案的文件合併成一次嵌入呼叫，再依檔案切回
+        documents = [document for _, _, file_documents in items for document in file_documents]
+        vectors = self.faiss_index_manager.embed_documents(documents) if documents else []
+
+        outputs = []
+        position = 0
+        for file, source, file_documents in items:
+            outputs.append((file, source, file_documents, vectors[position:position + len(file_documents)]))
+            position += len(file_documents)
+        return outputs
+
+    def _index(self, item):
+        file, source, documents, vectors = item
+        if documents:
+            self._vector_store = self.faiss_index_manager.add_embedded_documents(self._vector_store, documents, vectors)
+        elif self._vector_store is not None:
+            # 內容變為空白的檔案不再有文件，移除舊的向量
+            self.faiss_index_manager.remove_sources(self._vector_store, [source])
+        self._pending['files'].append(file)
+        self._pending['sources'].append(source)
+        self._pending['documents'].extend(documents)
+
+        # 第一批文件立即發布，之後每 publish_interval 秒發布一次
+        if self._last_publish_time is None or time.perf_counter() - self._last_publish_time >= self.publish_interval:
+            self._publish(final=False)
+        return [source]
+
+    def _publish(self, final:bool):
+        if self._vector_store is not None:
+            if self.faiss_index_manager.get_index_type(self.category) != 'chunk':
+                # 摘要先追加到待合併的紀錄，最後一次發布才合併成摘要檔
+                self.document_manager.append_summarized_documents(self._pending['documents'], self._pending['deleted'])
+                if final:
+                    self.document_manager.compact_summarized_documents()
+            self.faiss_index_manager.publish(self._vector_store, self.category, self._pending['sources'], self._pending['deleted'], final=final)
+        # 索引發布後才將檔案標記為完成、移除已刪除的檔案，中斷後未發布的變更會再次套用
+        self.pdf_processor.mark_done(self._pending['files'])
+        self.pdf_processor.mark_deleted(self._pending['deleted_files'])
+        self._pending = {'files': [], 'sources': [], 'documents': [], 'deleted': [], 'deleted_files': []}
+        self._last_publish_time = time.perf_counter()
+        self._published_partially = not final
@@ -1,25 +1,158 @@
 import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
-from typing import Tuple, List
+import time
+import json
+import hashlib
+from typing import Tuple, List, Iterator
+
+from models.Tracer import shared_tracer
+from models.LangChainModel import FAILED_RESPONSE, INVALID_INPUT_RESPONSE
 
 class QuestionController:
-    def __init__(self, faiss_index_manager, llm_model):
+    def __init__(self, faiss_index_manager, llm_model, answer_cache=None):
         self.faiss_index_manager = faiss_index_manager
         self.llm_model = llm_model
+        # 選用的 SemanticAnswerCache，相近問題且檢索到相同文件時沿用先前的答案
+        self.answer_cache = answer_cache
+
+    @staticmethod
+    def is_valid_question(human_question:str) -> bool:
+        return bool(human_question.strip()) and len(human_question) >= 3
 
-    def handle_question(self, human_question:str, category:str) -> Tuple[str, List[str]]:
-        if not human_question.strip() or len(human_question) < 3:
+    @shared_tracer.traced('question.handle')
+    def handle_question(self, human_question:str, category:str, sources:List = None) -> Tuple[str, List[str]]:
+        if not self.is_valid_question(human_question):
             print("Received empty or invalid question.")
             return "Invalid input.", []
         
         # try:
-        documents_context, sources = self.faiss_index_manager.search(human_question, category)
-        response = self.llm_model.get_response(documents_context, human_question)
-        return response, sources
+        documents_context, retrieved_sources = self.faiss_index_manager.search(human_question, category, sources)
+        response = self.answer(human_question, category, sources, documents_context, retrieved_sources)
+        return response, retrieved_sources
         # except Exception as e:
         #     print(f"Error handling question '{human_question}': {e}")
         #     return "An error occurred while processing the question.", []
 
+    def stream_question(self, human_question:str, category:str, sources:List = None) -> Iterator[dict]:
+        """
+        Streaming counterpart of `handle_question`.
+
+        Yields {'type': 'sources', 'sources': [...]} as soon as retrieval is done, then one {'type': 'token',
+        'content': ...} per chunk of the answer, and finally {'type': 'done', 'ttft_ms': ..., 'total_ms': ...} with
+        the time to the first answer chunk and the total time, both measured from the call.
+        """
+        start_time = time.perf_counter()
+        if not self.is_valid_question(human_question):
+            print("Received empty or invalid question.")
+            yield {'type': 'sources', 'sources': []}
+            yield {'type': 'token', 'content': "Invalid input."}
+            yield {'type': 'done', 'ttft_ms': 0.0, 'total_ms': 0.0}
+            return
+
+        documents_context, retrieved_sources = self.faiss_index_manager.search(human_question, category, sources)
+        yield from self.stream_answer(human_question, category, sources, documents_context, retrieved_sources, start_time)
+
+    @shared_tracer.traced('question.answer')
+    def answer(self, human_question:str, category:str, candidate_sources:List, documents_context:str, sources:List) -> str:
+        """Answers a question whose documents are already retrieved, reusing the answer cache when one is set."""
+        cached_response = self._get_cached_answer(human_question, category, candidate_sources, documents_context, sources)
+        if cached_response is not None:
+            return cached_response
+
+        start_time = time.perf_counter()
+        response = self.llm_model.get_response(documents_context, human_question)
+        self._cache_answer(human_question, category, candidate_sources, documents_context, sources, response, time.perf_counter() - start_time)
+        return response
+
+    def stream_answer(self, human_question:str, category:str, candidate_sources:List, documents_context:str, sources:List, start_time:float=None) -> Iterator[dict]:
+        """Streams the events of `stream_question` for a question whose documents are already retrieved."""
+        start_time = start_time or time.perf_counter()
+        # 先送出來源，呼叫端不必等回覆產生就能顯示
+        yield {'type': 'sources', 'sources': sources}
+
+        cached_response = self._get_cached_answer(human_question, category, candidate_sources, documents_context, sources)
+        if cached_response is not None:
+            chunks = [cached_response]
+        else:
+            chunks = self.llm_model.stream_response(documents_context, human_question)
+
+        llm_start_time = time.perf_counter()
+        ttft_ms = None
+        response_chunks = []
+        # 串流中途失敗時例外直接傳給呼叫端，不會執行到下方的快取
+        for chunk in chunks:
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start_time) * 1000
+            response_chunks.append(chunk)
+            yield {'type': 'token', 'content': chunk}
+
+        if cached_response is None:
+            self._cache_answer(human_question, category, candidate_sources, documents_context, sources, ''.join(response_chunks), time.perf_counter() - llm_start_time)
+        yield {'type': 'done', 'ttft_ms': ttft_ms, 'total_ms': (time.perf_counter() - start_time) * 1000}
+
+    @shared_tracer.traced('question.handle_batch')
+    def handle_questions(self, human_questions:List[str], categories:List[str], sources_list:List[List] = None) -> List[Tuple[str, List[str]]]:
+        if sources_list is None:
+            sources_list = [None] * len(human_questions)
+
+        results = [("Invalid input.", [])] * len(human_questions)
+
+        valid_positions = []
+        for position, human_question in enumerate(human_questions):
+            if not self.is_valid_question(human_question):
+                print("Received empty or invalid question.")
+                continue
+            valid_positions.append(position)
+
+        # 同類別的問題一次批次嵌入並搜尋
+        search_results = self.faiss_index_manager.search_many(
+            [human_questions[position] for position in valid_positions],
+            [categories[position] for position in valid_positions],
+            [sources_list[position] for position in valid_positions]
+        )
+
+        responses = [
+            self._get_cached_answer(human_questions[position], categories[position], sources_list[position], documents_context, sources)
+            for position, (documents_context, sources) in zip(valid_positions, search_results)
+        ]
+        missing = [index for index, response in enumerate(responses) if response is None]
+
+        # 所有未命中快取問題的 LLM 回覆併發產生，結果依輸入順序回傳
+        start_time = time.perf_counter()
+        generated_responses = self.llm_model.get_responses(
+            [search_results[index][0] for index in missing],
+            [human_questions[valid_positions[index]] for index in missing]
+        )
+        # 併發產生時以整批的時間作為每題節省的時間
+        seconds = time.perf_counter() - start_time
+
+        for index, response in zip(missing, generated_responses):
+            position = valid_positions[index]
+            documents_context, sources = search_results[index]
+            self._cache_answer(human_questions[position], categories[position], sources_list[position], documents_context, sources, response, seconds)
+            responses[index] = response
+
+        for position, (_, sources), response in zip(valid_positions, search_results, responses):
+            results[position] = (response, sources)
+        return results
+
+    def get_answer_version(self, documents_context:str) -> str:
+        """Identifies what an answer was generated from: the chat model and the retrieved document text."""
+        # 語料或索引更新後檢索到的內容不同，舊答案不再沿用
+        key = json.dumps([self.llm_model.model_identity, documents_context], ensure_ascii=False)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _get_cached_answer(self, human_question:str, category:str, candidate_sources:List, documents_context:str, sources:List):
+        if self.answer_cache is None or not documents_context:
+            return None
+        return self.answer_cache.get(human_question, category, candidate_sources, sources, self.get_answer_version(documents_context))
+
+    def _cache_answer(self, human_question:str, category:str, candidate_sources:List, documents_context:str, sources:List, response:str, seconds:float):
+        # 只快取有檢索結果且成功產生的回覆
+        if self.answer_cache is None or not documents_context or response in (FAILED_RESPONSE, INVALID_INPUT_RESPONSE):
+            return
+        self.answer_cache.set(human_question, category, candidate_sources, sources, response, seconds, self.get_answer_version(documents_context))
+
 
 
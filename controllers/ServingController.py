@@ -0,0 +1,214 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Tuple, List, Iterator
+
+from models.LatencyHistogram import LatencyHistogram
+from models.Tracer import shared_tracer
+
+
+class ServingController:
+    """
+    Answers questions for a long-running server on top of a QuestionController.
+
+    Questions submitted concurrently are collected for up to `max_wait_ms` (or until `max_batch_size` of them are
+    waiting) and retrieved together with one `search_many` call, so they share embedding batches and index
+    searches. Their LLM answers are then generated independently on a worker pool, so a slow answer does not
+    hold back the rest of its batch. End-to-end, retrieval and LLM latencies are recorded in histograms.
+
+    `stream_question` joins the same retrieval batches and then streams the answer on the caller's thread; its
+    time to first token is recorded as well.
+    """
+    def __init__(self, question_controller, max_batch_size:int=32, max_wait_ms:float=5.0, llm_workers:int=None):
+        self.question_controller = question_controller
+        self.faiss_index_manager = question_controller.faiss_index_manager
+        self.llm_model = question_controller.llm_model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self.started_at = time.time()
+        self.loaded_categories = []
+        self.latency = {'total': LatencyHistogram(), 'retrieval': LatencyHistogram(), 'llm': LatencyHistogram(), 'ttft': LatencyHistogram()}
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'errors': 0, 'batches': 0, 'batched_questions': 0, 'max_batch_size': 0}
+
+        self._queue = queue.Queue()
+        self._llm_executor = ThreadPoolExecutor(max_workers=llm_workers or getattr(self.llm_model, 'max_concurrency', 8))
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='serving-batcher', daemon=True)
+        self._worker.start()
+
+    def preload(self, categories:list[str]) -> list[str]:
+        """Loads the embedding model and the category indexes before the first request."""
+        start_time = time.perf_counter()
+        self.loaded_categories = self.faiss_index_manager.preload(categories)
+        print(f"Preloaded {self.loaded_categories} in {time.perf_counter() - start_time:.2f}s.")
+        return self.loaded_categories
+
+    def submit(self, human_question:str, category:str, sources:List = None) -> Future:
+        """Queues a question and returns a Future of its (response, sources_num) tuple."""
+        future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("The serving controller is closed."))
+            return future
+
+        with self._stats_lock:
+            self._stats['requests'] += 1
+
+        if not self.question_controller.is_valid_question(human_question):
+            print("Received empty or invalid question.")
+            future.set_result(("Invalid input.", []))
+            return future
+
+        self._queue.put((human_question, category, sources, future, time.perf_counter(), False))
+        return future
+
+    def stream_question(self, human_question:str, category:str, sources:List = None, timeout:float=None) -> Iterator[dict]:
+        """
+        Queues a question for retrieval right away and returns an iterator of the events of
+        `QuestionController.stream_question`: its sources first, then the answer chunks, then a 'done' event.
+        """
+        if self._closed:
+            raise RuntimeError("The serving controller is closed.")
+
+        with self._stats_lock:
+            self._stats['requests'] += 1
+
+        if not self.question_controller.is_valid_question(human_question):
+            return self.question_controller.stream_question(human_question, category, sources)
+
+        # 檢索與其他問題合併成批，回覆在呼叫端的執行緒上串流
+        future = Future()
+        submitted_at = time.perf_counter()
+        self._queue.put((human_question, category, sources, future, submitted_at, True))
+        return self._stream_events(human_question, category, sources, future, submitted_at, timeout)
+
+    def handle_question(self, human_question:str, category:str, sources:List = None, timeout:float=None) -> Tuple[str, List[str]]:
+        return self.submit(human_question, category, sources).result(timeout)
+
+    def _stream_events(self, human_question:str, category:str, candidate_sources:List, future:Future, submitted_at:float, timeout:float=None) -> Iterator[dict]:
+        documents_context, sources = future.result(timeout)
+        try:
+            for event in self.question_controller.stream_answer(human_question, category, candidate_sources, documents_context, sources, submitted_at):
+                if event['type'] == 'done':
+                    if event['ttft_ms'] is not None:
+                        self.latency['ttft'].observe(event['ttft_ms'] / 1000)
+                    self.latency['total'].observe(event['total_ms'] / 1000)
+                yield event
+        except Exception:
+            # 串流中途失敗時由 server 送出 error 事件
+            with self._stats_lock:
+                self._stats['errors'] += 1
+            raise
+
+    def get_health(self) -> dict:
+        return {
+            'status': 'ok' if self._worker.is_alive() and not self._closed else 'unavailable',
+            'uptime_seconds': time.time() - self.started_at,
+            'categories': self.loaded_categories,
+            'pending': self._queue.qsize(),
+        }
+
+    def get_metrics(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['mean_batch_size'] = stats['batched_questions'] / stats['batches'] if stats['batches'] else 0.0
+
+        llm_cache_stats = self.llm_model.get_cache_stats() if hasattr(self.llm_model, 'get_cache_stats') else {}
+        stream_stats = self.llm_model.get_stream_stats() if hasattr(self.llm_model, 'get_stream_stats') else {}
+        answer_cache = self.question_controller.answer_cache
+        return {
+            'requests': stats,
+            'latency': {stage: histogram.snapshot() for stage, histogram in self.latency.items()},
+            'embedding_cache': self.faiss_index_manager.get_embedding_cache_stats(),
+            'registry': self.faiss_index_manager.get_registry_stats(),
+            'llm_cache': llm_cache_stats,
+            'llm_stream': stream_stats,
+            'answer_cache': answer_cache.get_stats() if answer_cache is not None else {},
+            'trace': shared_tracer.get_summary() if shared_tracer.enabled else {},
+        }
+
+    def close(self):
+        """Stops taking questions, answers the ones already queued and waits for their LLM calls."""
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+        self._llm_executor.shutdown(wait=True)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._retrieve(batch)
+
+    def _next_batch(self) -> list:
+        item = self._queue.get()
+        if item is None:
+            return None
+
+        # 等待最多 max_wait_ms，讓同時到達的問題合併成一批
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # 關閉前仍處理已收到的問題
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _retrieve(self, batch:list):
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['batched_questions'] += len(batch)
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(batch))
+
+        start_time = time.perf_counter()
+        try:
+            search_results = self.faiss_index_manager.search_many(
+                [human_question for human_question, _, _, _, _, _ in batch],
+                [category for _, category, _, _, _, _ in batch],
+                [sources for _, _, sources, _, _, _ in batch]
+            )
+        except Exception as e:
+            print(f"Error retrieving documents: {e}")
+            for _, _, _, future, _, _ in batch:
+                self._fail(future, e)
+            return
+        self.latency['retrieval'].observe(time.perf_counter() - start_time)
+
+        for (human_question, category, candidate_sources, future, submitted_at, stream), (documents_context, sources) in zip(batch, search_results):
+            if stream:
+                # 串流的回覆由 _stream_events 在呼叫端產生
+                future.set_result((documents_context, sources))
+            else:
+                self._llm_executor.submit(self._answer, human_question, category, candidate_sources, documents_context, sources, future, submitted_at)
+
+    def _answer(self, human_question:str, category:str, candidate_sources:list, documents_context:str, sources:list, future:Future, submitted_at:float):
+        start_time = time.perf_counter()
+        try:
+            response = self.question_controller.answer(human_question, category, candidate_sources, documents_context, sources)
+        except Exception as e:
+            print(f"Error answering question '{human_question}': {e}")
+            self._fail(future, e)
+            return
+        self.latency['llm'].observe(time.perf_counter() - start_time)
+        self.latency['total'].observe(time.perf_counter() - submitted_at)
+        future.set_result((response, sources))
+
+    def _fail(self, future:Future, error:Exception):
+        with self._stats_lock:
+            self._stats['errors'] += 1
+        future.set_exception(error)
@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+
+# 中文以字元 bigram 切詞，英數字（保單名稱、金額、日期）保留為完整詞彙
+_TOKEN_PATTERN = re.compile(r'[㐀-䶿一-鿿]+|[a-z0-9]+(?:[.,/-][a-z0-9]+)*')
+
+def tokenize(text:str) -> list[str]:
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(unicodedata.normalize('NFKC', text).lower()):
+        run = match.group()
+        if run[0].isascii():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    Sparse lexical index over the full corpus text, scored with BM25.
+
+    The inverted index is stored in CSR form: for each term, a slice of document ids and the precomputed BM25
+    weight of the term in each document. A query is scored by adding the weight slices of its terms, which keeps
+    lexical search well under a millisecond at our corpus size.
+
+    The raw term frequencies and document lengths are kept alongside the weights, so `update` only tokenizes the
+    changed documents and recomputes the weights from the stored postings instead of scanning the whole corpus.
+    """
+    def __init__(self, sources:list[str], terms:list[str], indptr:np.ndarray, doc_ids:np.ndarray, weights:np.ndarray, term_frequencies:np.ndarray=None, doc_lengths:np.ndarray=None, k1:float=1.2, b:float=0.75):
+        self.sources = sources
+        self.source_positions = {source: position for position, source in enumerate(sources)}
+        self.terms = terms
+        self.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        # 舊版索引只保存權重，無法增量更新
+        self.term_frequencies = term_frequencies
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, corpus_items, k1:float=1.2, b:float=0.75) -> 'BM25Index':
+        """Builds the index from (source, text) pairs."""
+        sources, terms, term_ids, doc_ids, term_frequencies, doc_lengths = [], [], [], [], [], []
+        cls._add_documents(corpus_items, sources, terms, {}, term_ids, doc_ids, term_frequencies, doc_lengths)
+        return cls._from_postings(
+            sources, terms, np.array(term_ids, dtype=np.int64), np.array(doc_ids, dtype=np.int32),
+            np.array(term_frequencies, dtype=np.float32), np.array(doc_lengths, dtype=np.float32), k1, b
+        )
+
+    def can_update(self) -> bool:
+        return self.term_frequencies is not None and self.doc_lengths is not None
+
+    def update(self, changed_items, deleted_sources:list[str]) -> 'BM25Index':
+        """
+        Returns a new index with the (source, text) pairs of `changed_items` added or replaced and the deleted
+        sources removed. Only the changed documents are tokenized; the weights of the other documents are
+        recomputed from their stored term frequencies, since the idf and average length change with the corpus.
+        """
+        if not self.can_update():
+            raise ValueError("This BM25 index was saved without term frequencies; build it from the corpus instead.")
+
+        changed_items = [(str(source), text) for source, text in changed_items]
+        removed_sources = {str(source) for source in deleted_sources} | {source for source, _ in changed_items}
+
+        # 保留未變更的文件並重新編號
+        kept = np.array([source not in removed_sources for source in self.sources], dtype=bool)
+        new_doc_ids = np.cumsum(kept, dtype=np.int64) - 1
+        term_ids = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.indptr))
+        keep_postings = kept[self.doc_ids]
+
+        sources = [source for source, keep in zip(self.sources, kept) if keep]
+        terms = list(self.terms)
+        added_term_ids, added_doc_ids, added_term_frequencies, doc_lengths = [], [], [], list(self.doc_lengths[kept])
+        self._add_documents(changed_items, sources, terms, dict(self.vocabulary), added_term_ids, added_doc_ids, added_term_frequencies, doc_lengths)
+
+        term_ids = np.concatenate([term_ids[keep_postings], np.array(added_term_ids, dtype=np.int64)])
+        doc_ids = np.concatenate([new_doc_ids[self.doc_ids[keep_postings]], np.array(added_doc_ids, dtype=np.int64)]).astype(np.int32)
+        term_frequencies = np.concatenate([self.term_frequencies[keep_postings], np.array(added_term_frequencies, dtype=np.float32)])
+
+        # 移除已不出現在任何文件中的詞彙，避免詞彙表隨更新無限增長
+        used_term_ids, term_ids = np.unique(term_ids, return_inverse=True)
+        terms = [terms[term_id] for term_id in used_term_ids]
+        return self._from_postings(sources, terms, term_ids.astype(np.int64), doc_ids, term_frequencies, np.array(doc_lengths, dtype=np.float32), self.k1, self.b)
+
+    @staticmethod
+    def _add_documents(corpus_items, sources:list, terms:list, vocabulary:dict, term_ids:list, doc_ids:list, term_frequencies:list, doc_lengths:list):
+        # 將文件的詞頻追加到 postings，文件 id 接在既有文件之後
+        for source, text in corpus_items:
+            doc_id = len(sources)
+            sources.append(str(source))
+            counts = Counter(tokenize(text))
+            for term, term_frequency in counts.items():
+                term_id = vocabulary.get(term)
+                if term_id is None:
+                    term_id = vocabulary[term] = len(terms)
+                    terms.append(term)
+                term_ids.append(term_id)
+                doc_ids.append(doc_id)
+                term_frequencies.append(term_frequency)
+            doc_lengths.append(sum(counts.values()))
+
+    @classmethod
+    def _from_postings(cls, sources:list[str], terms:list[str], term_ids:np.ndarray, doc_ids:np.ndarray, term_frequencies:np.ndarray, doc_lengths:np.ndarray, k1:float, b:float) -> 'BM25Index':
+        average_length = doc_lengths.mean() if len(doc_lengths) else 1.0
+        document_frequencies = np.bincount(term_ids, minlength=len(terms)).astype(np.float32)
+        idf = np.log(1 + (len(sources) - document_frequencies + 0.5) / (document_frequencies + 0.5))
+
+        length_norm = k1 * (1 - b + b * doc_lengths[doc_ids] / max(average_length, 1e-9))
+        weights = (idf[term_ids] * term_frequencies * (k1 + 1) / (term_frequencies + length_norm)).astype(np.float32)
+
+        order = np.argsort(term_ids, kind='stable')
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(document_frequencies.astype(np.int64))
+        return cls(sources, terms, indptr, doc_ids[order], weights[order], term_frequencies[order], doc_lengths, k1, b)
+
+    def search(self, query:str, k:int=5, allowed_sources:list=None) -> list[tuple[str, float]]:
+        """Returns up to k (source, score) pairs, best first, optionally restricted to the allowed sources."""
+        scores = np.zeros(len(self.sources), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # 同一詞彙的文件 id 不重複，可直接以索引相加
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+
+        if allowed_sources is not None:
+            candidates = np.array([self.source_positions[str(source)] for source in allowed_sources if str(source) in self.source_positions], dtype=np.int64)
+        else:
+            candidates = np.flatnonzero(scores)
+
+        if len(candidates) == 0:
+            return []
+
+        candidate_scores = scores[candidates]
+        k = min(k, len(candidates))
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = top[np.argsort(-candidate_scores[top], kind='stable')]
+        return [(self.sources[candidates[i]], float(candidate_scores[i])) for i in top]
+
+    def save(self, directory:str):
+        arrays = {'indptr': self.indptr, 'doc_ids': self.doc_ids, 'weights': self.weights}
+        if self.can_update():
+            arrays.update(term_frequencies=self.term_frequencies, doc_lengths=self.doc_lengths)
+        np.savez(os.path.join(directory, 'bm25.npz'), **arrays)
+        with open(os.path.join(directory, 'bm25_vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump({'sources': self.sources, 'terms': self.terms, 'k1': self.k1, 'b': self.b}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory:str) -> 'BM25Index':
+        with open(os.path.join(directory, 'bm25_vocabulary.json'), 'r', encoding='utf-8') as f:
+            vocabulary = json.load(f)
+        arrays = np.load(os.path.join(directory, 'bm25.npz'))
+        return cls(
+            vocabulary['sources'], vocabulary['terms'], arrays['indptr'], arrays['doc_ids'], arrays['weights'],
+            arrays['term_frequencies'] if 'term_frequencies' in arrays else None,
+            arrays['doc_lengths'] if 'doc_lengths' in arrays else None,
+            vocabulary.get('k1', 1.2), vocabulary.get('b', 0.75)
+        )
+
+    @staticmethod
+    def exists(directory:str) -> bool:
+        return os.path.exists(os.path.join(directory, 'bm25.npz')) and os.path.exists(os.path.join(directory, 'bm25_vocabulary.json'))
@@ -1,53 +1,123 @@
 import json
 import os
 
+from models.Tracer import shared_tracer
+
 
 class CorpusManager:
+    """
+    Append-only corpus store of one category.
+
+    Documents are appended to `{category}_corpus.jsonl` as one JSON record per line; a newer record of the same
+    source supersedes the older one and a tombstone record deletes it. An offset index maps each source to the
+    position of its latest record, so a single document is read with one seek and the corpus can be iterated
+    lazily. The index is persisted next to the records and only the records appended after it are rescanned.
+    `export_json` writes the `{category}_all_text.json` format used before this store existed.
+    """
     def __init__(self, category:str):
         self.file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'formatted_data')
         self.category = category
+        self.records_file_name = os.path.join(self.file_path, f'{category}_corpus.jsonl')
+        self.offsets_file_name = os.path.join(self.file_path, f'{category}_corpus.idx.json')
+        self.json_file_name = os.path.join(self.file_path, f'{category}_all_text.json')
+
+        self._offsets = None
+        self._indexed_size = 0
+        self._dead_records = 0
+        self._records_inode = None
 
+    @shared_tracer.traced('corpus.save')
     def save_corpus(self, corpus_dict:dict) -> bool:
+        """Appends the documents of `corpus_dict`; only the given documents are written, never the whole corpus."""
         # try:
-        os.makedirs(self.file_path, exist_ok=True)
-        file_name = os.path.join(self.file_path, f'{self.category}_all_text.json')
-
-        if os.path.exists(file_name):
-            with open(file_name, 'r', encoding='utf-8') as file:
-                try:
-                    corpus_dict_all = json.load(file)
-                except json.JSONDecodeError:
-                    print(f"Warning: {file_name} is not properly formatted and has been reset to an empty dictionary.")
-                    corpus_dict_all = {}
-                    return False
-        
-            corpus_dict_all.update(corpus_dict)
-        
-        else:
-            corpus_dict_all = corpus_dict
-
-        with open(file_name, 'w', encoding='utf-8') as f:
-            json.dump(corpus_dict_all, f, ensure_ascii=False, indent=4)
-        
+        self._load_offsets()
+        self._append_records([{'source': source, 'content': content} for source, content in corpus_dict.items()])
         return True
-    
+
         # except Exception as e:
             # print(f"Error saving corpus: {e}")
-            
+
             # return False
-            
+
+    @shared_tracer.traced('corpus.delete')
+    def delete_documents(self, sources:list[str]) -> bool:
+        self._load_offsets()
+        sources = [source for source in sources if source in self._offsets]
+        if not sources:
+            return True
+
+        self._append_records([{'source': source, 'deleted': True} for source in sources])
+        return True
+
+    @shared_tracer.traced('corpus.read')
+    def get_document(self, source:str):
+        """Returns the content of one document, or None when the source is not in the corpus."""
+        self._load_offsets()
+        position = self._offsets.get(source)
+        if position is None:
+            return None
+
+        with open(self.records_file_name, 'rb') as f:
+            return self._read_record(f, position)['content']
+
+    def iter_corpus(self):
+        """Lazily yields (source, content) for every document, reading one record at a time."""
+        self._load_offsets()
+        if not self._offsets:
+            return
+
+        with open(self.records_file_name, 'rb') as f:
+            for source, position in list(self._offsets.items()):
+                yield source, self._read_record(f, position)['content']
+
+    def get_sources(self) -> list[str]:
+        self._load_offsets()
+        return list(self._offsets.keys())
+
+    def exists(self) -> bool:
+        return os.path.exists(self.records_file_name) or os.path.exists(self.json_file_name)
+
+    def get_storage_files(self) -> list[str]:
+        """Files whose change means the corpus changed."""
+        return [self.records_file_name]
+
+    @shared_tracer.traced('corpus.export_json')
+    def export_json(self):
+        """Writes the whole corpus to `{category}_all_text.json` for tools that read the previous format."""
+        self._load_offsets()
+        if self._dead_records > len(self._offsets):
+            self.compact()
+
+        os.makedirs(self.file_path, exist_ok=True)
+        with open(self.json_file_name, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.iter_corpus()), f, ensure_ascii=False, indent=4)
+        self._save_offsets()
+
+    @shared_tracer.traced('corpus.compact')
+    def compact(self):
+        """Rewrites the records file without superseded and deleted records."""
+        self._load_offsets()
+        temp_file_name = f'{self.records_file_name}.tmp'
+        with open(temp_file_name, 'wb') as f:
+            for source, content in self.iter_corpus():
+                f.write(self._encode_record({'source': source, 'content': content}))
+        os.replace(temp_file_name, self.records_file_name)
+
+        self._offsets = None
+        self._indexed_size = 0
+        if os.path.exists(self.offsets_file_name):
+            os.remove(self.offsets_file_name)
+        self._load_offsets()
+        self._save_offsets()
+
+    @shared_tracer.traced('corpus.load')
     def load_corpus(self, category:str = None) -> dict:
-        if category is None:
-            category = self.category
-
-        file_name = os.path.join(self.file_path, f'{category}_all_text.json')
-        if os.path.exists(file_name):
-            try:
-                with open(file_name, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                print(f"Warning: {file_name} is not properly formatted.")
-                return {}
+        if category is not None and category != self.category:
+            return CorpusManager(category).load_corpus()
+
+        category = self.category
+        if self.exists():
+            return dict(self.iter_corpus())
         else:
             source_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'reference')
             if category == 'faq':
@@ -60,4 +130,109 @@ class CorpusManager:
                 corpus_dict = json_processor.create_and_save_json_content()
             return corpus_dict
 
-    
\ No newline at end of file
+    def _append_records(self, records:list[dict]):
+        os.makedirs(self.file_path, exist_ok=True)
+        needs_newline = False
+        if os.path.exists(self.records_file_name) and os.path.getsize(self.records_file_name) > 0:
+            with open(self.records_file_name, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                # 上次寫入中斷時補上換行，避免新紀錄接在不完整的紀錄後面
+                needs_newline = f.read(1) != b'\n'
+
+        with open(self.records_file_name, 'ab') as f:
+            if needs_newline:
+                f.write(b'\n')
+            for record in records:
+                offset = f.tell()
+                line = self._encode_record(record)
+                f.write(line)
+
+                self._index_record(record, offset, len(line))
+            self._indexed_size = f.tell()
+        self._records_inode = os.stat(self.records_file_name).st_ino
+
+    def _load_offsets(self):
+        records_inode = os.stat(self.records_file_name).st_ino if os.path.exists(self.records_file_name) else None
+        if self._offsets is not None and records_inode == self._records_inode:
+            self._scan_records()
+            return
+
+        # 第一次載入，或紀錄檔已被另一個實例壓縮替換
+        self._offsets = {}
+        self._indexed_size = 0
+        self._dead_records = 0
+        self._records_inode = records_inode
+
+        if not os.path.exists(self.records_file_name) and os.path.exists(self.json_file_name):
+            self._import_json()
+            return
+
+        if os.path.exists(self.offsets_file_name) and os.path.exists(self.records_file_name):
+            with open(self.offsets_file_name, 'r', encoding='utf-8') as f:
+                saved_offsets = json.load(f)
+            # 紀錄檔被替換過時捨棄索引，重新掃描
+            if saved_offsets.get('inode') == records_inode and saved_offsets['size'] <= os.path.getsize(self.records_file_name):
+                self._offsets = {source: tuple(position) for source, position in saved_offsets['offsets'].items()}
+                self._indexed_size = saved_offsets['size']
+                self._dead_records = saved_offsets['dead_records']
+
+        self._scan_records()
+
+    def _scan_records(self):
+        """Indexes the records appended after the last indexed position."""
+        if not os.path.exists(self.records_file_name) or os.path.getsize(self.records_file_name) <= self._indexed_size:
+            return
+
+        with open(self.records_file_name, 'rb') as f:
+            f.seek(self._indexed_size)
+            offset = self._indexed_size
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # 寫入中斷留下的不完整紀錄，忽略
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Warning: skipping a malformed record in {self.records_file_name} at offset {offset}.")
+                    offset += len(line)
+                    continue
+
+                self._index_record(record, offset, len(line))
+                offset += len(line)
+            self._indexed_size = offset
+
+    def _index_record(self, record:dict, offset:int, length:int):
+        if record['source'] in self._offsets:
+            self._dead_records += 1
+        if record.get('deleted'):
+            self._offsets.pop(record['source'], None)
+            self._dead_records += 1
+        else:
+            self._offsets[record['source']] = (offset, length)
+
+    def _save_offsets(self):
+        temp_file_name = f'{self.offsets_file_name}.tmp'
+        with open(temp_file_name, 'w', encoding='utf-8') as f:
+            json.dump({'inode': self._records_inode, 'size': self._indexed_size, 'dead_records': self._dead_records, 'offsets': self._offsets}, f, ensure_ascii=False)
+        os.replace(temp_file_name, self.offsets_file_name)
+
+    def _import_json(self):
+        # 由舊版 {category}_all_text.json 建立紀錄檔
+        try:
+            with open(self.json_file_name, 'r', encoding='utf-8') as f:
+                corpus_dict = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: {self.json_file_name} is not properly formatted.")
+            corpus_dict = {}
+        self._append_records([{'source': source, 'content': content} for source, content in corpus_dict.items()])
+        self._save_offsets()
+
+    @staticmethod
+    def _encode_record(record:dict) -> bytes:
+        return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+    @staticmethod
+    def _read_record(f, position:tuple) -> dict:
+        offset, length = position
+        f.seek(offset)
+        return json.loads(f.read(length))
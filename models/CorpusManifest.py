@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+
+
+class CorpusManifest:
+    """
+    Per-file manifest of the sources that make up a category's corpus.
+
+    Each entry records the source file's path, size, mtime and SHA-256 along with its processing status and the
+    corpus keys it produced. Comparing the manifest against the source directory yields the files that were
+    added, changed or deleted since the last build, and files left 'pending' by an interrupted build.
+
+    A file is 'stored' once its documents are in the corpus and 'done' once they are also summarized and indexed;
+    deleted files keep their entry until the index no longer has their documents. A build interrupted between
+    the corpus write and the index update therefore hands the same delta to the index on the next run.
+    """
+    def __init__(self, category:str):
+        self.file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'formatted_data')
+        self.category = category
+        self.file_name = os.path.join(self.file_path, f'{category}_manifest.json')
+        self.entries = self._load()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.file_name)
+
+    def get_delta(self, source_path:str, file_ls:list[str]) -> dict:
+        """
+        Compares the files in the source directory with the manifest.
+
+        Returns:
+            dict: 'to_process' lists the added, changed and pending files; 'stored' lists the unchanged files whose
+                documents are in the corpus but not indexed yet; 'deleted' lists the manifest files that are no
+                longer in the source directory, each with the corpus keys they produced.
+        """
+        to_process = []
+        stored = []
+        for file in file_ls:
+            entry = self.entries.get(file)
+            file_info = self._get_file_info(os.path.join(source_path, file), entry)
+
+            if entry is not None and entry['status'] == 'stored' and entry['sha256'] == file_info['sha256']:
+                entry.update(file_info)
+                stored.append(file)
+            elif entry is None or entry['status'] != 'done' or entry['sha256'] != file_info['sha256']:
+                self.entries[file] = dict(entry or {'sources': []}, **file_info, status='pending')
+                to_process.append(file)
+            else:
+                # 內容未變更，只更新 mtime 以免下次重新計算雜湊
+                entry.update(file_info)
+
+        file_set = set(file_ls)
+        deleted = {file: self._get_all_sources(file) for file in self.entries if file not in file_set}
+        return {'to_process': to_process, 'stored': stored, 'deleted': deleted}
+
+    def adopt(self, source_path:str, file_ls:list[str], sources_by_file:dict):
+        """Marks files that are already in an existing corpus as done, so a manifest can be added to an older build."""
+        for file in file_ls:
+            if file in sources_by_file and file not in self.entries:
+                self.entries[file] = dict(self._get_file_info(os.path.join(source_path, file)), sources=sources_by_file[file], status='done')
+
+    def mark_stored(self, file:str, sources:list[str]):
+        """Records the corpus keys written for a file; `sources` keeps the indexed keys until `mark_done`."""
+        self.entries[file]['stored_sources'] = sources
+        self.entries[file]['status'] = 'stored'
+
+    def mark_done(self, file:str, sources:list[str]=None):
+        entry = self.entries[file]
+        stored_sources = entry.pop('stored_sources', None)
+        entry['sources'] = sources if sources is not None else stored_sources if stored_sources is not None else entry['sources']
+        entry['status'] = 'done'
+
+    def _get_all_sources(self, file:str) -> list[str]:
+        # 已寫入語料但尚未建立索引的 key 也需要刪除
+        entry = self.entries[file]
+        return list(dict.fromkeys(entry['sources'] + entry.get('stored_sources', [])))
+
+    def remove(self, file:str):
+        self.entries.pop(file, None)
+
+    def save(self):
+        os.makedirs(self.file_path, exist_ok=True)
+        # 先寫入暫存檔再取代，中斷時不會留下寫到一半的 manifest
+        temp_file_name = f'{self.file_name}.tmp'
+        with open(temp_file_name, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=4)
+        os.replace(temp_file_name, self.file_name)
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.file_name):
+            return {}
+        try:
+            with open(self.file_name, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: {self.file_name} is not properly formatted, every file will be processed again.")
+            return {}
+
+    @staticmethod
+    def _get_file_info(file_name:str, entry:dict=None) -> dict:
+        stat = os.stat(file_name)
+        if entry is not None and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            sha256 = entry['sha256']
+        else:
+            with open(file_name, 'rb') as f:
+                sha256 = hashlib.sha256(f.read()).hexdigest()
+        return {'path': file_name, 'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256}
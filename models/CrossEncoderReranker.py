@@ -0,0 +1,92 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CrossEncoderReranker:
+    """
+    Reranks retrieval candidates with a local cross-encoder that scores (query, passage) pairs on CPU.
+
+    Pairs are scored in batches of `batch_size`. When scoring one query takes longer than `latency_budget_ms`,
+    the remaining batches are skipped and `rerank` returns None so the caller keeps the dense order; the pairs
+    scored so far stay cached. Pair scores are kept in an LRU cache of `cache_size` entries, keyed by a hash of
+    the query and the passage.
+    """
+    def __init__(self, model_name:str='BAAI/bge-reranker-base', batch_size:int=16, max_length:int=512, latency_budget_ms:float=None, cache_size:int=10000):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.latency_budget_ms = latency_budget_ms
+        self.cache_size = cache_size
+
+        self._model = None
+        self._lock = threading.Lock()
+        self._scores = OrderedDict()
+        self._stats = {'queries': 0, 'fallbacks': 0, 'cache_hits': 0, 'cache_misses': 0, 'rerank_seconds': 0.0}
+
+    def rerank(self, query:str, candidates:list[tuple[str, str]]) -> list[str]:
+        """
+        Orders candidate sources by their best cross-encoder score.
+
+        Args:
+            query (str): The question text.
+            candidates (list[tuple[str, str]]): (source, passage) pairs; a source may have several passages.
+
+        Returns:
+            list[str]: The sources, best first, or None when the latency budget ran out.
+        """
+        start_time = time.perf_counter()
+        keys = [self._make_key(query, passage) for _, passage in candidates]
+
+        with self._lock:
+            pair_scores = {}
+            for key in keys:
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    pair_scores[key] = self._scores[key]
+            self._stats['queries'] += 1
+            self._stats['cache_hits'] += len(pair_scores)
+            self._stats['cache_misses'] += len(set(keys)) - len(pair_scores)
+
+        pending = list({key: passage for key, (_, passage) in zip(keys, candidates) if key not in pair_scores}.items())
+        for start in range(0, len(pending), self.batch_size):
+            if self._over_budget(start_time):
+                with self._lock:
+                    self._stats['fallbacks'] += 1
+                    self._stats['rerank_seconds'] += time.perf_counter() - start_time
+                return None
+
+            batch = pending[start:start + self.batch_size]
+            batch_scores = self._get_model().predict([(query, passage) for _, passage in batch], batch_size=self.batch_size, show_progress_bar=False)
+            with self._lock:
+                for (key, _), score in zip(batch, batch_scores):
+                    pair_scores[key] = float(score)
+                    self._scores[key] = float(score)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+
+        source_scores = {}
+        for (source, _), key in zip(candidates, keys):
+            source_scores[source] = max(source_scores.get(source, float('-inf')), pair_scores[key])
+
+        with self._lock:
+            self._stats['rerank_seconds'] += time.perf_counter() - start_time
+        return sorted(source_scores, key=source_scores.get, reverse=True)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, cached_pairs=len(self._scores))
+
+    def _over_budget(self, start_time:float) -> bool:
+        return self.latency_budget_ms is not None and (time.perf_counter() - start_time) * 1000 > self.latency_budget_ms
+
+    def _get_model(self):
+        # 第一次重排序時才載入模型，未啟用重排序時不需要 sentence-transformers
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, max_length=self.max_length, device='cpu')
+        return self._model
+
+    def _make_key(self, query:str, passage:str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{query}\0{passage}".encode('utf-8')).hexdigest()
@@ -0,0 +1,46 @@
+import re
+from langchain_core.documents import Document
+
+
+# 與 BERT 類分詞器的粒度相近：中文一字一詞，英數字連續視為一詞，其餘非空白字元各為一詞
+_TOKEN_PATTERN = re.compile(r'[A-Za-z0-9]+|\S')
+
+
+class DocumentChunker:
+    """
+    Splits corpus text into overlapping, token-bounded chunks, one page at a time.
+
+    Pages are separated by `page_separator` (the separator PDFTextImageExtractor joins pages with), so a chunk
+    never spans two pages. Chunks hold at most `chunk_size` tokens and consecutive chunks of a page share
+    `chunk_overlap` tokens; the chunk text is sliced from the original page, keeping its whitespace.
+    """
+    def __init__(self, chunk_size:int=256, chunk_overlap:int=64, page_separator:str='\n---\n'):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size.")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.page_separator = page_separator
+
+    def split_text(self, text:str) -> list[tuple[int, str]]:
+        """Returns (page number, chunk text) pairs, in page order."""
+        chunks = []
+        for page_number, page in enumerate(text.split(self.page_separator)):
+            spans = [match.span() for match in _TOKEN_PATTERN.finditer(page)]
+            step = self.chunk_size - self.chunk_overlap
+            for start in range(0, len(spans), step):
+                end = min(start + self.chunk_size, len(spans))
+                chunks.append((page_number, page[spans[start][0]:spans[end - 1][1]]))
+                if end == len(spans):
+                    break
+        return chunks
+
+    def split_documents(self, corpus_items, category:str) -> list[Document]:
+        """Chunks (source, text) pairs into Documents whose metadata keeps the parent source."""
+        documents = []
+        for source, text in corpus_items:
+            for chunk_number, (page_number, chunk_text) in enumerate(self.split_text(text or '')):
+                documents.append(Document(
+                    page_content=chunk_text,
+                    metadata={"source": source, "qa_category": category, "page": page_number, "chunk": chunk_number}
+                ))
+        return documents
@@ -1,33 +1,53 @@
 import os
 import json
 from langchain_core.documents import Document
-from models.LangChainModel import LangChainModel
+from models.LangChainModel import FAILED_RESPONSE, LangChainModel, get_shared_langchain_model
 from models.CorpusManager import CorpusManager
+from models.DocumentChunker import DocumentChunker
 
 
 class DocumentManager:
-    def __init__(self, category: str):
+    def __init__(self, category: str, chunk_size:int=256, chunk_overlap:int=64, llm_model:LangChainModel=None):
         self.category = category
         self.file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'formatted_data')
         self.file_name = f"{self.file_path}/{self.category}_summarized_documents.json"
-        self.llm_model = LangChainModel()
+        # 串流建置時新的摘要先追加到這個紀錄檔，建置結束才合併進摘要檔
+        self.pending_file_name = f"{self.file_path}/{self.category}_summarized_documents.pending.jsonl"
+        self._llm_model = llm_model
         self.corpusmanager = CorpusManager(self.category)
+        self.chunker = DocumentChunker(chunk_size, chunk_overlap)
+        # 上次摘要失敗的 source，不寫入摘要檔也不建立索引，呼叫端據此保留檔案待下次重試
+        self.failed_sources = []
+
+    @property
+    def llm_model(self) -> LangChainModel:
+        # 未指定時共用同一個 LangChainModel，只有需要摘要時才建立
+        if self._llm_model is None:
+            self._llm_model = get_shared_langchain_model()
+        return self._llm_model
+
+    def exists(self) -> bool:
+        return os.path.exists(self.file_name) or os.path.exists(self.pending_file_name)
 
     def create_summarized_documents(self) -> list[Document]:
-        if not os.path.exists(self.file_name):
+        if not self.exists():
             """Creates and saves summarized documents based on the category."""
             corpus_dict = self.corpusmanager.load_corpus()
             
             documents = []
             json_documents = []
+            self.failed_sources = []
+
+            #faq資料很短，不需要進行摘要
+            if self.category == 'faq':
+                summarized_contexts = list(corpus_dict.values())
+            else:
+                summarized_contexts = self.llm_model.get_document_summaries(list(corpus_dict.values()))
 
-            for filename, content in corpus_dict.items():
-                #faq資料很短，不需要進行摘要
-                if self.category == 'faq':
-                    summarized_context = content
-                else:
-                    summarized_context = self.llm_model.get_document_summary(content)
-                    
+            for filename, summarized_context in zip(corpus_dict.keys(), summarized_contexts):
+                if summarized_context == FAILED_RESPONSE:
+                    self._add_failed_source(filename)
+                    continue
                 document = Document(page_content=summarized_context, metadata={"source": filename, "qa_category": self.category})
                 documents.append(document)
                 
@@ -45,13 +65,125 @@ class DocumentManager:
             return self.get_summarized_documents()
     
 
+    def update_summarized_documents(self, updated_sources:list[str], deleted_sources:list[str]) -> list[Document]:
+        """Summarizes only the updated sources, drops the deleted ones and returns the newly summarized documents."""
+        if not self.exists():
+            return self.create_summarized_documents()
+
+        self.failed_sources = []
+        if not updated_sources and not deleted_sources:
+            return []
+
+        contents = [self.corpusmanager.get_document(source) or '' for source in updated_sources]
+
+        #faq資料很短，不需要進行摘要
+        if self.category == 'faq':
+            summarized_contexts = contents
+        else:
+            summarized_contexts = self.llm_model.get_document_summaries(contents)
+
+        documents = []
+        for filename, summarized_context in zip(updated_sources, summarized_contexts):
+            if summarized_context == FAILED_RESPONSE:
+                # 保留舊的摘要與向量，下次執行再重新摘要
+                self._add_failed_source(filename)
+                continue
+            documents.append(Document(page_content=summarized_context, metadata={"source": filename, "qa_category": self.category}))
+        self.merge_summarized_documents(documents, deleted_sources)
+        return documents
+
+    def summarize_document(self, source:str, content:str) -> list[Document]:
+        """Summarizes one document as it arrives from a streaming ingestion pipeline."""
+        #faq資料很短，不需要進行摘要
+        summarized_context = content if self.category == 'faq' else self.llm_model.get_document_summary(content)
+        if summarized_context == FAILED_RESPONSE:
+            # 由管線記為錯誤並略過，檔案不會標記為完成
+            raise RuntimeError(f"Summarizing {source} failed.")
+        return [Document(page_content=summarized_context, metadata={"source": source, "qa_category": self.category})]
+
+    def _add_failed_source(self, source:str):
+        print(f"Warning: summarizing {source} failed, it will be retried on the next run.")
+        self.failed_sources.append(source)
+
+    def merge_summarized_documents(self, documents:list[Document], deleted_sources:list[str]):
+        """Replaces the saved summaries of the given documents' sources and drops those of the deleted sources."""
+        json_documents = self._apply_changes(self._load_json_documents(), documents, deleted_sources)
+        self.save_summarized_documents_to_json(json_documents)
+        # 待合併的紀錄已寫入摘要檔
+        if os.path.exists(self.pending_file_name):
+            os.remove(self.pending_file_name)
+
+    def append_summarized_documents(self, documents:list[Document], deleted_sources:list[str]):
+        """
+        Records summary changes without rewriting the summaries file, so each publish of a streaming build costs
+        only its own documents. Reads include the recorded changes; `compact_summarized_documents` merges them.
+        """
+        if not documents and not deleted_sources:
+            return
+        os.makedirs(self.file_path, exist_ok=True)
+        with open(self.pending_file_name, 'a', encoding='utf-8') as f:
+            for source in deleted_sources:
+                f.write(json.dumps({"deleted": source}, ensure_ascii=False) + '\n')
+            for document in documents:
+                f.write(json.dumps({"page_content": document.page_content, "metadata": document.metadata}, ensure_ascii=False) + '\n')
+
+    def compact_summarized_documents(self):
+        """Merges the changes recorded by `append_summarized_documents` into the summaries file."""
+        if os.path.exists(self.pending_file_name):
+            self.merge_summarized_documents([], [])
+
+    def _load_json_documents(self) -> list[dict]:
+        json_documents = []
+        if os.path.exists(self.file_name):
+            with open(self.file_name, 'r', encoding='utf-8') as f:
+                json_documents = json.load(f)
+
+        if os.path.exists(self.pending_file_name):
+            # 依紀錄順序套用；更新的摘要移到最後，與 merge_summarized_documents 的順序相同
+            documents_by_source = {doc["metadata"]["source"]: doc for doc in json_documents}
+            with open(self.pending_file_name, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 寫入中斷留下的不完整紀錄，對應的檔案會重新處理
+                        continue
+                    if "deleted" in record:
+                        documents_by_source.pop(record["deleted"], None)
+                    else:
+                        documents_by_source.pop(record["metadata"]["source"], None)
+                        documents_by_source[record["metadata"]["source"]] = record
+            json_documents = list(documents_by_source.values())
+        return json_documents
+
+    @staticmethod
+    def _apply_changes(json_documents:list[dict], documents:list[Document], deleted_sources:list[str]) -> list[dict]:
+        removed_sources = {document.metadata["source"] for document in documents} | set(deleted_sources)
+        json_documents = [doc for doc in json_documents if doc["metadata"]["source"] not in removed_sources]
+        json_documents.extend({"page_content": document.page_content, "metadata": document.metadata} for document in documents)
+        return json_documents
+
+    def create_chunked_documents(self) -> list[Document]:
+        """Chunks the whole corpus for a chunk-level index; no LLM call is made."""
+        if not self.corpusmanager.exists():
+            self.corpusmanager.load_corpus()
+        return self.chunker.split_documents(self.corpusmanager.iter_corpus(), self.category)
+
+    def update_chunked_documents(self, updated_sources:list[str]) -> list[Document]:
+        """Chunks only the updated sources; the index drops the old chunks of each of them."""
+        contents = [(source, self.corpusmanager.get_document(source) or '') for source in updated_sources]
+        return self.chunker.split_documents(contents, self.category)
+
+    def chunk_document(self, source:str, content:str) -> list[Document]:
+        """Chunks one document as it arrives from a streaming ingestion pipeline."""
+        return self.chunker.split_documents([(source, content)], self.category)
+
     def get_summarized_documents(self) -> list[Document]:
         """Loads summarized documents if they exist, otherwise returns None."""
-        if os.path.exists(self.file_name):
+        if self.exists():
             try:
-                with open(self.file_name, 'r', encoding='utf-8') as f:
-                    json_documents = json.load(f)
-                    documents = [
+                json_documents = self._load_json_documents()
+                documents = [
                     Document(
                         page_content=doc["page_content"],
                         metadata=doc["metadata"]
@@ -0,0 +1,261 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk embedding table backed by a memory-mapped array.
+
+    Vectors are written to `{file_name}.vectors` as rows of a (capacity, dimension) array of `dtype`; the file
+    grows by doubling its capacity. Each stored key is then appended to `{file_name}.keys.jsonl` with its row,
+    so a row only becomes visible once its vector is on disk and an interrupted write leaves no broken entry.
+    Once `max_entries` rows are stored, new vectors are no longer added.
+
+    Several processes may share the files: writes hold an exclusive lock on `{file_name}.lock` and first read the
+    keys other processes appended, so rows are allocated after every row already in the key log.
+    """
+    def __init__(self, file_name:str, dtype=np.float16, max_entries:int=1000000):
+        self.file_name = file_name
+        self.vectors_file_name = f'{file_name}.vectors'
+        self.keys_file_name = f'{file_name}.keys.jsonl'
+        self.lock_file_name = f'{file_name}.lock'
+        self.dtype = np.dtype(dtype)
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._next_row = 0
+        self._keys_offset = 0
+        self._dimension = None
+        self._vectors = None
+        self._load()
+
+    def get(self, key:str):
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            return np.asarray(self._vectors[row], dtype=np.float32)
+
+    def set_many(self, items:list[tuple[str, list[float]]]):
+        with self._lock, open(self.lock_file_name, 'a') as lock_file:
+            # 跨程序的寫入鎖；取得鎖後先讀入其他程序追加的 key，列號接在所有已配置的列之後
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._read_keys()
+
+                items = [(key, vector) for key, vector in dict(items).items() if key not in self._rows]
+                items = items[:max(self.max_entries - self._next_row, 0)]
+                if not items:
+                    return
+
+                if self._dimension is None:
+                    self._dimension = len(items[0][1])
+                self._reserve(self._next_row + len(items))
+
+                first_row = self._next_row
+                for offset, (_, vector) in enumerate(items):
+                    self._vectors[first_row + offset] = np.asarray(vector, dtype=self.dtype)
+                self._vectors.flush()
+
+                # 中斷的寫入留下沒有換行的紀錄時先補上換行，以免新紀錄接在後面而無法解析
+                partial_record = os.path.exists(self.keys_file_name) and os.path.getsize(self.keys_file_name) > self._keys_offset
+                with open(self.keys_file_name, 'a', encoding='utf-8') as f:
+                    f.write('\n' * partial_record + ''.join(json.dumps({'key': key, 'row': first_row + offset, 'dimension': self._dimension}) + '\n' for offset, (key, _) in enumerate(items)))
+                    self._keys_offset = f.tell()
+                for offset, (key, _) in enumerate(items):
+                    self._rows[key] = first_row + offset
+                self._next_row = first_row + len(items)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_name)), exist_ok=True)
+        self._read_keys()
+
+    def _read_keys(self):
+        """Reads the key records appended since the last read, including those of other processes."""
+        if not os.path.exists(self.keys_file_name) or not os.path.exists(self.vectors_file_name):
+            return
+
+        with open(self.keys_file_name, 'rb') as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # 另一個程序寫到一半的紀錄，下次再讀
+                    break
+                self._keys_offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 寫入中斷留下的不完整紀錄，忽略
+                    continue
+                self._rows[record['key']] = record['row']
+                self._next_row = max(self._next_row, record['row'] + 1)
+                self._dimension = record['dimension']
+
+        # 其他程序可能已擴充向量檔，重新映射以讀到新的列
+        if self._dimension is not None:
+            capacity = os.path.getsize(self.vectors_file_name) // (self._dimension * self.dtype.itemsize)
+            if self._vectors is None or len(self._vectors) != capacity:
+                self._vectors = None
+                self._map(capacity)
+
+    def _reserve(self, rows:int):
+        capacity = len(self._vectors) if self._vectors is not None else 0
+        if rows <= capacity:
+            return
+
+        capacity = max(rows, capacity * 2, 1024)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self.vectors_file_name, 'ab') as f:
+            f.truncate(capacity * self._dimension * self.dtype.itemsize)
+        self._map(capacity)
+
+    def _map(self, capacity:int):
+        self._vectors = np.memmap(self.vectors_file_name, dtype=self.dtype, mode='r+', shape=(capacity, self._dimension))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_embedding_store(file_name:str, dtype) -> EmbeddingStore:
+    """Returns the process-wide store of a file, so two caches never append to the same file independently."""
+    file_name = os.path.abspath(file_name)
+    with _stores_lock:
+        if file_name not in _stores:
+            _stores[file_name] = EmbeddingStore(file_name, dtype=dtype)
+        return _stores[file_name]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches query and document embeddings of the wrapped model.
+
+    Queries are keyed by their normalized text (NFKC, whitespace collapsed) and the normalized text is what gets
+    embedded, so variants that normalize alike share one vector. They are kept in an in-memory LRU of
+    `query_cache_size` entries, optionally backed by a float16 memory-mapped store on disk. Documents are keyed
+    by a SHA-256 of their content and kept in a float32 store on disk, so rebuilding an index only embeds
+    content that has not been embedded before.
+
+    When `embeddings` is not given, the shared model of `model_name` is loaded on the first cache miss.
+    """
+    def __init__(self, model_name:str, embeddings:Embeddings=None, cache_directory:str=None, query_cache_size:int=10000, query_disk_cache:bool=False, document_disk_cache:bool=True):
+        if cache_directory is None:
+            cache_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'cache')
+        file_prefix = os.path.join(cache_directory, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+
+        self._embeddings = embeddings
+        self.model_name = model_name
+        self.query_cache_size = query_cache_size
+        self.query_store = get_embedding_store(f'{file_prefix}_query', np.float16) if query_disk_cache else None
+        self.document_store = get_embedding_store(f'{file_prefix}_document', np.float32) if document_disk_cache else None
+
+        self._lock = threading.Lock()
+        self._queries = OrderedDict()
+        self._stats = {
+            'query': {'memory_hits': 0, 'disk_hits': 0, 'misses': 0},
+            'document': {'disk_hits': 0, 'misses': 0},
+        }
+
+    @property
+    def embeddings(self) -> Embeddings:
+        if self._embeddings is None:
+            from models.SharedModels import get_embedding_model
+            self._embeddings = get_embedding_model(self.model_name)
+        return self._embeddings
+
+    @staticmethod
+    def normalize_query(text:str) -> str:
+        return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+    def embed_query(self, text:str) -> list[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts:list[str]) -> list[list[float]]:
+        """Embeds a batch of queries, sending only the uncached ones to the model in one call."""
+        keys = [self.normalize_query(text) for text in texts]
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                if key in self._queries:
+                    self._queries.move_to_end(key)
+                    vectors[key] = self._queries[key]
+                    self._stats['query']['memory_hits'] += 1
+
+        misses = []
+        for key in dict.fromkeys(keys):
+            if key in vectors:
+                continue
+            vector = self.query_store.get(key) if self.query_store is not None else None
+            if vector is not None:
+                vectors[key] = vector.tolist()
+                self._count('query', 'disk_hits')
+            else:
+                misses.append(key)
+
+        if misses:
+            embedded = self.embeddings.embed_documents(misses)
+            vectors.update(zip(misses, embedded))
+            self._count('query', 'misses', len(misses))
+            if self.query_store is not None:
+                self.query_store.set_many(list(zip(misses, embedded)))
+
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                self._queries[key] = vectors[key]
+                self._queries.move_to_end(key)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts:list[str]) -> list[list[float]]:
+        if self.document_store is None:
+            return self.embeddings.embed_documents(texts)
+
+        keys = [hashlib.sha256(text.encode('utf-8')).hexdigest() for text in texts]
+        vectors = {}
+        for key in dict.fromkeys(keys):
+            vector = self.document_store.get(key)
+            if vector is not None:
+                vectors[key] = vector.tolist()
+
+        # 只嵌入內容沒有嵌入過的文件
+        misses = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        self._count('document', 'disk_hits', len(keys) - len(misses))
+        if misses:
+            embedded = self.embeddings.embed_documents(list(misses.values()))
+            vectors.update(zip(misses, embedded))
+            self._count('document', 'misses', len(misses))
+            self.document_store.set_many(list(zip(misses, embedded)))
+        return [vectors[key] for key in keys]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = {kind: dict(counters) for kind, counters in self._stats.items()}
+            stats['query']['entries'] = len(self._queries)
+        stats['query']['disk_entries'] = len(self.query_store) if self.query_store is not None else 0
+        stats['document']['disk_entries'] = len(self.document_store) if self.document_store is not None else 0
+
+        for counters in stats.values():
+            lookups = sum(value for name, value in counters.items() if name.endswith('hits') or name == 'misses')
+            counters['hit_rate'] = (lookups - counters['misses']) / lookups if lookups else 0.0
+        return stats
+
+    def _count(self, kind:str, name:str, amount:int=1):
+        with self._lock:
+            self._stats[kind][name] += amount
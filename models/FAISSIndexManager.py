@@ -1,21 +1,73 @@
-from langchain_huggingface import HuggingFaceEmbeddings
 from models.DocumentManager import DocumentManager
+from models.IndexRegistry import IndexRegistry, shared_index_registry
 from models.CorpusManager import CorpusManager
+from models.BM25Index import BM25Index
+from models.CrossEncoderReranker import CrossEncoderReranker
+from models.EmbeddingCache import CachedEmbeddings
+from models.IndexSpec import normalize_index_spec, build_index, make_search_parameters, is_flat_index
+from models.Tracer import shared_tracer
 
 import os
+import glob
+import json
+import time
+import shutil
+import hashlib
 
 import faiss
+import numpy as np
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
 from uuid import uuid4
-from operator import itemgetter
 
 class FAISSIndexManager:
-    def __init__(self, create_index_category:str=None):
-        self.embedding_model = HuggingFaceEmbeddings(model_name="moka-ai/m3e-large")
-        self.index_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)))
+    def __init__(self, create_index_category:str=None, index_registry:IndexRegistry=None, index_directory:str=None, query_batch_size:int=32, retrieval_mode:str='dense', fusion_k:int=20, rrf_k:int=60, dense_weight:float=1.0, sparse_weight:float=1.0, index_types:dict=None, chunk_k:int=50, chunk_aggregation:str='max', chunk_top_k:int=3, reranker:CrossEncoderReranker=None, rerank_k:int=10, metric:str='cosine', score_threshold:float=None, index_specs:dict=None, query_cache_size:int=10000, query_disk_cache:bool=False):
+        # 問題依正規化文字、文件依內容雜湊快取嵌入向量，重複的問題與未變更的文件不需重新嵌入
+        # m3e-large 由所有 FAISSIndexManager 共用，第一次需要嵌入時才載入
+        self.embedding_model = CachedEmbeddings("moka-ai/m3e-large", query_cache_size=query_cache_size, query_disk_cache=query_disk_cache)
+        # 索引預設位於 models/ 下；指定 index_directory 時（例如評測另建的索引）使用該目錄自己的 registry
+        self.index_directory = index_directory or os.path.dirname(os.path.abspath(__file__))
         self.create_index_category = create_index_category
+        # 索引與語料在行程內常駐，所有 FAISSIndexManager 預設共用同一個 registry
+        self.index_registry = index_registry or (IndexRegistry(index_directory=index_directory) if index_directory else shared_index_registry)
+        self.query_batch_size = query_batch_size
 
+        # 檢索模式：dense（向量）、sparse（BM25）或 hybrid（以 RRF 融合兩者）
+        if retrieval_mode not in ('dense', 'sparse', 'hybrid'):
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}', expected 'dense', 'sparse' or 'hybrid'.")
+        self.retrieval_mode = retrieval_mode
+        self.fusion_k = fusion_k
+        self.rrf_k = rrf_k
+        self.dense_weight = dense_weight
+        self.sparse_weight = sparse_weight
+
+        # 各類別的索引類型：summary（每份文件一個摘要向量）或 chunk（語料切塊，查詢時彙整回文件）
+        self.index_types = index_types or {}
+        for index_type in self.index_types.values():
+            if index_type not in ('summary', 'chunk'):
+                raise ValueError(f"Unknown index type '{index_type}', expected 'summary' or 'chunk'.")
+        if chunk_aggregation not in ('max', 'sum'):
+            raise ValueError(f"Unknown chunk aggregation '{chunk_aggregation}', expected 'max' or 'sum'.")
+        self.chunk_k = chunk_k
+        self.chunk_aggregation = chunk_aggregation
+        self.chunk_top_k = chunk_top_k
+
+        # 選用的 cross-encoder 重排序，只重排前 rerank_k 個候選文件
+        self.reranker = reranker
+        self.rerank_k = rerank_k
+
+        # 新建索引的相似度量：cosine（正規化向量的內積，越大越相近）或 l2（距離，越小越相近）
+        if metric not in ('cosine', 'l2'):
+            raise ValueError(f"Unknown metric '{metric}', expected 'cosine' or 'l2'.")
+        self.metric = metric
+        # cosine 相似度達門檻的文件全部回傳，未設定時只回傳最相近的一份
+        self.score_threshold = score_threshold
+
+        # 各類別的向量索引結構：flat（暴力搜尋）、hnsw 或 ivfpq，參數見 IndexSpec
+        self.index_specs = {category: normalize_index_spec(index_spec) for category, index_spec in (index_specs or {}).items()}
+
+    @shared_tracer.traced('faiss.create_index')
     def create_index(self, category:str=None):
         if category is None:
             if self.create_index_category is None:
@@ -26,7 +78,7 @@ class FAISSIndexManager:
         
         # 載入或創建 FAISS 索引
         # 檢查是否已存在本地索引
-        index_path = os.path.join(self.index_directory, f"{category}_faiss_index")
+        index_path = self.get_index_path(category)
 
         if os.path.exists(index_path):
             # 從本地載入 FAISS 索引
@@ -36,71 +88,673 @@ class FAISSIndexManager:
         else:
             # 如果不存在索引，則創建新的 FAISS 索引
             # print(f"Creating a new {category} FAISS index...")
-            document_manager = DocumentManager(category)
+            self._build_index(category)
 
-            # 設置索引的維度
-            summarized_documents = document_manager.get_summarized_documents()
-            
-            if not summarized_documents:
-                summarized_documents = document_manager.create_summarized_documents()
+            # print(f"Completed creating the {category} FAISS index.")
 
-            #給範例讓 FAISS 知道索引的維度
-            dimension = len(self.embedding_model.embed_query(summarized_documents[0].page_content))  # 確定向量的維度
-            index = faiss.IndexFlatL2(dimension)
-            
-            # 創建向量存儲
-            vector_store = FAISS(
-                embedding_function=self.embedding_model,
-                index=index,
-                docstore=InMemoryDocstore({}),  # 基於內存的文檔儲存
-                index_to_docstore_id={}  # 空字典初始化，保存向量索引到文檔的映射
-            )
+    def get_index_path(self, category:str) -> str:
+        return os.path.join(self.index_directory, f"{category}_faiss_index")
 
-            #加載文檔並生成唯一 ID
-            uuids = [str(uuid4()) for _ in range(len(summarized_documents))]
+    def index_exists(self, category:str) -> bool:
+        return os.path.exists(self.get_index_path(category))
 
-            # 添加文檔到向量存儲
-            vector_store.add_documents(documents=summarized_documents, ids=uuids)
+    def rebuild_index(self, category:str=None):
+        """Builds the category's index from its corpus (or saved summaries) and replaces the existing one."""
+        self._build_index(self._get_category(category))
 
-            #將 FAISS 索引保存到本地
-            vector_store.save_local(f"{self.index_directory}/{category}_faiss_index")
+    def export_vectors(self, category:str) -> tuple[np.ndarray, np.ndarray, int]:
+        """
+        Returns the raw vectors of the category's index with their FAISS ids and the FAISS metric type, e.g. to
+        compare index structures on the same vectors.
+        """
+        if not self.index_exists(category):
+            raise FileNotFoundError(f"The {category} FAISS index does not exist at {self.get_index_path(category)}.")
+        vector_store = self._load_writable_vector_store(category)
+        vectors, faiss_ids = self._get_vectors(vector_store.index)
+        return vectors, faiss_ids, vector_store.index.metric_type
 
-            # print(f"Completed creating the {category} FAISS index.")
- 
+    def embed_queries(self, queries:list[str], batch_size:int=None) -> np.ndarray:
+        """Embeds questions the way searches do, normalized for cosine indexes."""
+        vectors = self._embed_queries(queries, batch_size or self.query_batch_size)
+        if self.metric == 'cosine':
+            faiss.normalize_L2(vectors)
+        return vectors
 
-    def search(self, query:str, question_category:str) -> tuple[str, list]:
-        if not os.path.exists(f"{self.index_directory}/{question_category}_faiss_index"):
-            # 從本地載入 FAISS 索引
-            # print(f"The {question_category} FAISS index does not exist. Creating now, please wait.")
-            self.create_index(question_category)
+    def get_index_type(self, category:str) -> str:
+        return self.index_types.get(category, 'summary')
+
+    def get_index_spec(self, category:str) -> dict:
+        return self.index_specs.get(category, normalize_index_spec())
+
+    @shared_tracer.traced('faiss.build_index')
+    def _build_index(self, category:str):
+        document_manager = DocumentManager(category)
+        index_type = self.get_index_type(category)
+
+        if index_type == 'chunk':
+            # 直接嵌入語料切塊，不需要 LLM 摘要
+            documents = document_manager.create_chunked_documents()
+        else:
+            documents = document_manager.get_summarized_documents()
+
+            if not documents:
+                documents = document_manager.create_summarized_documents()
+
+        #給範例讓 FAISS 知道索引的維度
+        dimension = len(self.embedding_model.embed_documents([documents[0].page_content])[0])  # 確定向量的維度
+        vector_store = self._new_vector_store(dimension)
+
+        # 添加文檔到向量存儲
+        self._upsert_documents(vector_store, documents)
+
+        #將 FAISS 索引保存到本地
+        self._save_vector_store(vector_store, category, index_type)
+
+    def _new_vector_store(self, dimension:int) -> FAISS:
+        # 以 IndexIDMap 保存由 source 推導的固定 int64 ID，之後可依 source 更新或刪除
+        return FAISS(
+            embedding_function=self.embedding_model,
+            index=self._new_index(dimension),
+            docstore=InMemoryDocstore({}),  # 基於內存的文檔儲存
+            index_to_docstore_id={}  # 空字典初始化，保存向量索引到文檔的映射
+        )
+
+    def _new_index(self, dimension:int) -> faiss.Index:
+        if self.metric == 'cosine':
+            return faiss.IndexIDMap(faiss.IndexFlatIP(dimension))
+        return faiss.IndexIDMap(faiss.IndexFlatL2(dimension))
+
+    @shared_tracer.traced('faiss.update_index')
+    def update_index(self, updated_documents:list[Document], deleted_sources:list[str], category:str=None):
+        """
+        Applies a corpus delta to an existing index instead of rebuilding it.
+
+        Updated documents are upserted and deleted sources removed, keyed by the document `source`; the index is
+        saved once, atomically. Creates the index when it does not exist yet.
+        """
+        category = self._get_category(category)
+
+        if not self.index_exists(category):
+            self.create_index(category)
+            return
+
+        index_type = self.get_index_type(category)
+        if self.needs_rebuild(category):
+            print(f"Rebuilding the {category} FAISS index as a {index_type} index.")
+            self._build_index(category)
+            return
+
+        index_meta = self.index_registry.get_index_meta(category)
+        saved_metric = index_meta.get('metric', 'l2')
+        saved_index_spec = index_meta.get('requested_index_spec', normalize_index_spec())
+        if not updated_documents and not deleted_sources and saved_metric == self.metric and saved_index_spec == self.get_index_spec(category):
+            return
+
+        vector_store = self._load_writable_vector_store(category)
+        self._remove_sources(vector_store, deleted_sources)
+        self._upsert_documents(vector_store, updated_documents)
+        corpus_delta = {'updated': [document.metadata['source'] for document in updated_documents], 'deleted': deleted_sources}
+        self._save_vector_store(vector_store, category, index_type, corpus_delta)
+
+    def needs_rebuild(self, category:str) -> bool:
+        """Whether the existing index of the category cannot be updated in place and has to be built from the corpus."""
+        if not self.index_exists(category):
+            return False
+
+        index_meta = self.index_registry.get_index_meta(category)
+        # 沒有 index_meta.json 的舊版索引皆為 IndexFlatL2
+        saved_metric = index_meta.get('metric', 'l2')
+        # 類別改用另一種索引類型，或 cosine 改回 l2（正規化後已無原始向量長度），需整個重建
+        return index_meta.get('index_type', 'summary') != self.get_index_type(category) or (saved_metric, self.metric) == ('cosine', 'l2')
+
+    def load_for_update(self, category:str):
+        """
+        Returns a writable copy of the category's index for streaming updates, or None when there is no index yet.
+
+        Use `add_embedded_documents` and `remove_sources` on it and `publish` to make the changes searchable.
+        """
+        if not self.index_exists(category):
+            return None
+        return self._load_writable_vector_store(category)
+
+    @shared_tracer.traced('faiss.embed_documents')
+    def embed_documents(self, documents:list[Document]) -> list[list[float]]:
+        return self.embedding_model.embed_documents([document.page_content for document in documents])
+
+    def add_embedded_documents(self, vector_store:FAISS, documents:list[Document], vectors:list[list[float]]) -> FAISS:
+        """Upserts documents with vectors from `embed_documents`, creating the vector store when it is None."""
+        if vector_store is None:
+            vector_store = self._new_vector_store(len(vectors[0]))
+        self._upsert_documents(vector_store, documents, vectors)
+        return vector_store
+
+    def remove_sources(self, vector_store:FAISS, sources:list[str]):
+        self._remove_sources(vector_store, sources)
+
+    def publish(self, vector_store:FAISS, category:str, updated_sources:list[str]=None, deleted_sources:list[str]=None, final:bool=True):
+        """
+        Saves a vector store from `load_for_update` as the category's index, replacing the old one atomically.
+
+        The corpus sources updated and deleted since the previous publish are applied to its BM25 index; without
+        them, BM25 is rebuilt from the whole corpus. Intermediate publishes (`final=False`) save a flat index, so
+        the configured ANN structure is trained once, by the final publish, instead of on every publish.
+        """
+        corpus_delta = {'updated': updated_sources, 'deleted': deleted_sources or []} if updated_sources is not None else None
+        index_spec = None if final else normalize_index_spec()
+        self._save_vector_store(vector_store, category, self.get_index_type(category), corpus_delta, index_spec)
+
+    def upsert_documents(self, documents:list[Document], category:str=None):
+        """Adds or replaces documents by their `source`; documents whose content did not change are not re-embedded."""
+        self.update_index(documents, [], category)
+
+    def delete_documents(self, sources:list[str], category:str=None):
+        """Removes the vectors of the given sources from the index."""
+        self.update_index([], sources, category)
+
+    @staticmethod
+    def source_to_id(source) -> int:
+        """Derives a stable, non-negative int64 FAISS id from a document source."""
+        digest = hashlib.sha256(str(source).encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') & 0x7FFFFFFFFFFFFFFF
+
+    def _get_category(self, category:str=None) -> str:
+        if category is None:
+            if self.create_index_category is None:
+                raise ValueError("You must provide a category either as an argument or during initialization.")
+
+            category = self.create_index_category
+        return category
+
+    @staticmethod
+    def _document_key(document:Document) -> str:
+        """Docstore key of a document: its source for summaries, `source#chunk` for chunks."""
+        source = str(document.metadata['source'])
+        if 'chunk' in document.metadata:
+            return f"{source}#{document.metadata['chunk']}"
+        return source
+
+    @staticmethod
+    def _uses_cosine(vector_store:FAISS) -> bool:
+        return vector_store._normalize_L2 or vector_store.index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+    def _get_metric(self, vector_store:FAISS) -> str:
+        return 'cosine' if self._uses_cosine(vector_store) else 'l2'
+
+    def _upsert_documents(self, vector_store:FAISS, documents:list[Document], vectors:list[list[float]]=None):
+        # 同一個 source 的文件（一份摘要或全部切塊）視為一組比對與替換，同一個 key 只保留最後一份
+        documents_by_source = {}
+        for document in documents:
+            documents_by_source.setdefault(str(document.metadata['source']), {})[self._document_key(document)] = document
+        # 已嵌入的文件（串流建置時由嵌入階段提供）不再重新嵌入
+        vectors_by_key = dict(zip((self._document_key(document) for document in documents), vectors)) if vectors is not None else {}
+
+        source_ids = IndexRegistry.build_source_id_table(vector_store)
+        changed_sources = []
+        for source, keyed_documents in documents_by_source.items():
+            existing_contents = {}
+            for faiss_id in source_ids.get(source, []):
+                docstore_id = vector_store.index_to_docstore_id[faiss_id]
+                existing_contents[docstore_id] = vector_store.docstore.search(docstore_id).page_content
+            if existing_contents == {key: document.page_content for key, document in keyed_documents.items()}:
+                continue
+            changed_sources.append(source)
+
+        if not changed_sources:
+            return
+
+        self._remove_sources(vector_store, changed_sources, source_ids)
+        changed_documents = {key: document for source in changed_sources for key, document in documents_by_source[source].items()}
+
+        # 只嵌入新增或內容有變更的文件
+        if vectors is not None:
+            vectors = np.array([vectors_by_key[key] for key in changed_documents], dtype=np.float32)
+        else:
+            vectors = np.array(self.embedding_model.embed_documents([document.page_content for document in changed_documents.values()]), dtype=np.float32)
+        if self._uses_cosine(vector_store):
+            faiss.normalize_L2(vectors)
+        ids = np.array([self.source_to_id(key) for key in changed_documents], dtype=np.int64)
+
+        vector_store.index.add_with_ids(vectors, ids)
+        vector_store.docstore.add(changed_documents)
+        vector_store.index_to_docstore_id.update({int(faiss_id): key for faiss_id, key in zip(ids, changed_documents)})
+
+    def _remove_sources(self, vector_store:FAISS, sources:list[str], source_ids:dict=None):
+        if source_ids is None:
+            source_ids = IndexRegistry.build_source_id_table(vector_store)
+        ids = [faiss_id for source in sources for faiss_id in source_ids.get(str(source), [])]
+        if not ids:
+            return
+
+        vector_store.index.remove_ids(np.array(ids, dtype=np.int64))
+        vector_store.docstore.delete([vector_store.index_to_docstore_id.pop(faiss_id) for faiss_id in ids])
+
+    def _load_writable_vector_store(self, category:str) -> FAISS:
+        # 索引需可寫入，因此不使用 registry 中常駐（可能為 memory-map）的版本
+        index_path = self.get_index_path(category)
+        vector_store = FAISS.load_local(index_path, embeddings=self.embedding_model, allow_dangerous_deserialization=True)
+
+        if isinstance(vector_store.index, faiss.IndexIDMap) and is_flat_index(vector_store.index) and self._get_metric(vector_store) == self.metric:
+            return vector_store
+
+        # 舊版索引以位置為 ID、ANN 索引或度量與設定不同：取回向量後改用 source 推導的 ID 與設定的度量建立 flat 索引，不需重新嵌入
+        if os.path.exists(os.path.join(index_path, 'vectors.npz')):
+            # ANN 索引無法刪除向量（HNSW）或只保存近似向量（IVF-PQ），更新一律從保存的原始向量重建
+            arrays = np.load(os.path.join(index_path, 'vectors.npz'))
+            vectors, faiss_ids = arrays['vectors'], arrays['ids']
+            keys = [vector_store.index_to_docstore_id[int(faiss_id)] for faiss_id in faiss_ids]
+        elif isinstance(vector_store.index, faiss.IndexIDMap):
+            vectors, faiss_ids = self._get_vectors(vector_store.index)
+            keys = [vector_store.index_to_docstore_id[int(faiss_id)] for faiss_id in faiss_ids]
+        else:
+            vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+            keys = [vector_store.index_to_docstore_id[i] for i in range(vector_store.index.ntotal)]
+        documents = [vector_store.docstore.search(key) for key in keys]
+        keys = [self._document_key(document) for document in documents]
+
+        if self.metric == 'cosine':
+            faiss.normalize_L2(vectors)
+        index = self._new_index(vector_store.index.d)
+        index.add_with_ids(vectors, np.array([self.source_to_id(key) for key in keys], dtype=np.int64))
+        return FAISS(
+            embedding_function=self.embedding_model,
+            index=index,
+            docstore=InMemoryDocstore(dict(zip(keys, documents))),
+            index_to_docstore_id={self.source_to_id(key): key for key in keys}
+        )
+
+    @staticmethod
+    def _get_vectors(index:faiss.IndexIDMap) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the vectors of a flat IndexIDMap with their FAISS ids."""
+        return index.index.reconstruct_n(0, index.ntotal), faiss.vector_to_array(index.id_map)
+
+    @shared_tracer.traced('faiss.save')
+    def _save_vector_store(self, vector_store:FAISS, category:str, index_type:str='summary', corpus_delta:dict=None, index_spec:dict=None):
+        """
+        Writes the index into a new versioned directory and publishes it by atomically replacing the
+        `<category>_faiss_index` symlink, so readers always find either the previous or the new complete index.
+
+        `corpus_delta` lists the 'updated' and 'deleted' corpus sources since the previous save; when given, the
+        previous BM25 index is updated with them instead of being rebuilt from the whole corpus. `index_spec`
+        overrides the category's configured index structure.
+        """
+        index_path = self.get_index_path(category)
+        temp_path = f"{index_path}.v-{uuid4().hex}"
+
+        # 更新時使用 flat 索引，儲存時才依設定建立（並訓練）ANN 索引
+        requested_index_spec = normalize_index_spec(index_spec) if index_spec is not None else self.get_index_spec(category)
+        if requested_index_spec['type'] == 'flat':
+            search_index, index_spec = vector_store.index, requested_index_spec
+        else:
+            vectors, faiss_ids = self._get_vectors(vector_store.index)
+            search_index, index_spec = build_index(requested_index_spec, vector_store.index.d, vector_store.index.metric_type, vectors, faiss_ids)
 
+        flat_index = vector_store.index
+        vector_store.index = search_index
         try:
-            vector_store = FAISS.load_local(
-                    f"{self.index_directory}/{question_category}_faiss_index",
-                    embeddings=self.embedding_model,
-                    # 僅當來源可信時使用此選項
-                    allow_dangerous_deserialization=True
-                )
-            
-        except Exception as e:
-            print(f"Error loading the FAISS index: {e}")
+            vector_store.save_local(temp_path)
+        finally:
+            vector_store.index = flat_index
+
+        if index_spec['type'] != 'flat':
+            np.savez(os.path.join(temp_path, 'vectors.npz'), vectors=vectors, ids=faiss_ids)
+
+        # 預先建立 source→FAISS id 對照表，供搜尋時限制候選文件
+        with open(os.path.join(temp_path, 'source_ids.json'), 'w', encoding='utf-8') as f:
+            json.dump(IndexRegistry.build_source_id_table(vector_store), f, ensure_ascii=False)
+
+        # BM25 稀疏索引與 FAISS 索引一起替換
+        self._get_bm25_index(category, index_path, corpus_delta).save(temp_path)
+
+        with open(os.path.join(temp_path, 'index_meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'id_scheme': 'source_sha256',
+                'index_type': index_type,
+                'metric': self._get_metric(vector_store),
+                'index_spec': index_spec,
+                'requested_index_spec': requested_index_spec,
+            }, f)
+
+        self._publish_version(index_path, temp_path)
+
+    @staticmethod
+    def _get_bm25_index(category:str, index_path:str, corpus_delta:dict=None) -> BM25Index:
+        corpus_manager = CorpusManager(category)
+        if corpus_delta is not None and BM25Index.exists(index_path):
+            previous_index = BM25Index.load(index_path)
+            if previous_index.can_update():
+                # 只讀取並切詞變更的文件；已不在語料中的 source 視為刪除
+                changed_items, deleted_sources = [], list(corpus_delta['deleted'])
+                for source in dict.fromkeys(map(str, corpus_delta['updated'])):
+                    content = corpus_manager.get_document(source)
+                    if content is None:
+                        deleted_sources.append(source)
+                    else:
+                        changed_items.append((source, content))
+                return previous_index.update(changed_items, deleted_sources)
+
+        # 第一次建立或舊版 BM25 沒有詞頻時，以完整語料建立
+        return BM25Index.build(corpus_manager.iter_corpus())
+
+    @staticmethod
+    def _publish_version(index_path:str, version_path:str):
+        """Points the index symlink at `version_path` with a single os.replace and removes the previous version."""
+        if os.path.isdir(index_path) and not os.path.islink(index_path):
+            # 舊版以實體目錄保存索引，先改名為一個版本目錄；只有這次遷移會有短暫的空窗
+            legacy_path = f"{index_path}.v-{uuid4().hex}"
+            os.replace(index_path, legacy_path)
+            os.symlink(os.path.basename(legacy_path), index_path)
+
+        old_path = os.path.join(os.path.dirname(index_path), os.readlink(index_path)) if os.path.islink(index_path) else None
+        temp_link = f"{index_path}.link-{uuid4().hex}"
+        # 相對路徑的 symlink，整個目錄搬移後仍然有效
+        os.symlink(os.path.basename(version_path), temp_link)
+        os.replace(temp_link, index_path)
+
+        # 已 memory-map 的檔案在刪除後仍可讀取；正在開啟檔案的讀取者會在 IndexRegistry 中重試
+        if old_path is not None and os.path.abspath(old_path) != os.path.abspath(version_path):
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    def get_embedding_cache_stats(self) -> dict:
+        """Returns the hit rates and sizes of the query and document embedding caches."""
+        return self.embedding_model.get_stats()
+
+    def get_registry_stats(self) -> dict:
+        """Returns the hit/miss and load-time counters of the resident index and corpus registry."""
+        return self.index_registry.get_stats()
+
+    def preload(self, categories:list[str]) -> list[str]:
+        """
+        Loads the embedding model and every resident structure the categories are searched with, so the first
+        question of a long-running process does not pay for them.
+
+        Returns:
+            list[str]: The categories whose index exists and was loaded.
+        """
+        # 第一次推論也較慢，以不進快取的問題預熱
+        self.embedding_model.embeddings.embed_query('預熱')
+
+        loaded_categories = []
+        for category in categories:
+            if not os.path.exists(self.index_registry.get_index_path(category)):
+                print(f"The {category} FAISS index does not exist, skipping preload.")
+                continue
+
+            self.index_registry.get_vector_store(category, self.embedding_model)
+            self.index_registry.get_index_meta(category)
+            self.index_registry.get_source_ids(category, self.embedding_model)
+            self.index_registry.get_corpus(category)
+            if self.retrieval_mode != 'dense':
+                self.index_registry.get_bm25_index(category)
+            loaded_categories.append(category)
+        return loaded_categories
+ 
+
+    def search(self, query:str, question_category:str, sources:list=None) -> tuple[str, list]:
+        return self.search_many([query], [question_category], [sources])[0]
+
+    @shared_tracer.traced('faiss.search')
+    def search_many(self, queries:list[str], categories:list[str], sources_list:list[list]=None, batch_size:int=None) -> list[tuple[str, list]]:
+        """
+        Retrieves the nearest document for many questions at once.
+
+        Questions are grouped by category; each group is embedded in batches of `batch_size` and searched with a
+        single matrix `index.search` call, so the results are the same as calling `search` once per question.
+
+        Args:
+            queries (list[str]): The question texts.
+            categories (list[str]): The category of each question, aligned with `queries`.
+            sources_list (list[list], optional): The candidate sources each question may be answered from. When
+                given, the search of that question only covers the vectors of these sources.
+            batch_size (int, optional): Number of questions embedded per call. Defaults to `query_batch_size`.
+
+        Returns:
+            list[tuple[str, list]]: One (documents_context, sources_num) tuple per question, in input order.
+        """
+        results = []
+        for ranking in self._rank_many(queries, categories, sources_list, batch_size):
+            if ranking is None:
+                results.append((None, None))
+            elif self.retrieval_mode == 'dense' and not ranking['reranked']:
+                results.append(self._select_documents(ranking['scored_sources'], ranking['corpus_dict'], ranking['metric']))
+            else:
+                results.append(self._select_ranked_source(ranking['ranked_sources'], ranking['corpus_dict']))
+        return results
+
+    @shared_tracer.traced('faiss.rank')
+    def rank_many(self, queries:list[str], categories:list[str], sources_list:list[list]=None, batch_size:int=None, depth:int=None) -> list[list[str]]:
+        """
+        Ranks the candidate sources of many questions best first, the way `search_many` ranks them before picking
+        the answer document, without reading the documents; used to evaluate retrieval without the LLM.
+
+        `depth` raises the number of dense and BM25 candidates retrieved per question, so metrics such as recall@k
+        can look further than the few candidates `search_many` needs. Questions whose index cannot be loaded get None.
+        """
+        return [ranking['ranked_sources'] if ranking is not None else None for ranking in self._rank_many(queries, categories, sources_list, batch_size, depth)]
+
+    def _rank_many(self, queries:list[str], categories:list[str], sources_list:list[list]=None, batch_size:int=None, depth:int=None) -> list[dict]:
+        if len(queries) != len(categories):
+            raise ValueError("queries and categories must have the same length.")
+
+        if sources_list is None:
+            sources_list = [None] * len(queries)
+
+        batch_size = batch_size or self.query_batch_size
+        depth = depth or 0
+        fusion_k = max(self.fusion_k, depth)
+        rankings = [None] * len(queries)
+
+        positions_by_category = {}
+        for position, category in enumerate(categories):
+            positions_by_category.setdefault(category, []).append(position)
+
+        for question_category, positions in positions_by_category.items():
+            category_queries = [queries[position] for position in positions]
+            category_sources = [sources_list[position] for position in positions]
+
+            dense_results_list = [[] for _ in positions]
+            is_chunk_index = False
+            metric = None
+            if self.retrieval_mode != 'sparse':
+                if not self._wait_for_index(question_category):
+                    # 搜尋時不建立索引，索引需先由初始化流程建立
+                    print(f"The {question_category} FAISS index does not exist, run the initialization first.")
+                    continue
+
+                try:
+                    vector_store = self.index_registry.get_vector_store(question_category, self.embedding_model)
+
+                except Exception as e:
+                    print(f"Error loading the FAISS index: {e}")
+                    continue
+
+                allowed_ids_list = self._get_allowed_ids(category_sources, question_category)
+                index_meta = self.index_registry.get_index_meta(question_category)
+                is_chunk_index = index_meta.get('index_type') == 'chunk'
+                metric = index_meta.get('metric') or self._get_metric(vector_store)
+                if is_chunk_index:
+                    # 多取一些切塊，彙整後才有足夠的候選文件
+                    k = max(self.chunk_k, depth)
+                elif self.retrieval_mode == 'dense':
+                    k = max(5, self.rerank_k if self.reranker is not None else 0, depth)
+                else:
+                    k = fusion_k
+                dense_results_list = self._similarity_search_many(vector_store, category_queries, k=k, batch_size=batch_size, allowed_ids_list=allowed_ids_list)
+
+            corpus_dict = self.index_registry.get_corpus(question_category)
+
+            bm25_index = self.index_registry.get_bm25_index(question_category) if self.retrieval_mode != 'dense' else None
+            for position, query, sources, dense_results in zip(positions, category_queries, category_sources, dense_results_list):
+                scored_sources = self._rank_dense_results(dense_results, metric, is_chunk_index)
+                dense_sources = [source for source, _ in scored_sources]
+
+                if bm25_index is None:
+                    ranked_sources = dense_sources
+                else:
+                    sparse_sources = [source for source, _ in bm25_index.search(query, fusion_k, sources)]
+                    ranked_sources = self._reciprocal_rank_fusion([dense_sources, sparse_sources], [self.dense_weight, self.sparse_weight])
+
+                reranked = False
+                if self.reranker is not None and ranked_sources:
+                    candidates = self._get_rerank_candidates(ranked_sources[:self.rerank_k], dense_results, corpus_dict)
+                    reranked_sources = self.reranker.rerank(query, candidates)
+                    # 超過延遲預算時沿用原本的排序；重排序範圍外的候選文件排在後面
+                    if reranked_sources is not None:
+                        ranked_sources = reranked_sources + [source for source in ranked_sources if source not in reranked_sources]
+                        reranked = True
+
+                rankings[position] = {
+                    'ranked_sources': ranked_sources, 'scored_sources': scored_sources, 'metric': metric,
+                    'corpus_dict': corpus_dict, 'reranked': reranked,
+                }
+
+        return rankings
+
+    def _wait_for_index(self, category:str, timeout:float=0.2) -> bool:
+        """
+        Whether the category's index exists. Publishing swaps the symlink with one os.replace, so the path only goes
+        missing while a legacy directory is being migrated, or the first version is being linked, right after a
+        version directory was created; only then is the path polled, for at most `timeout` seconds.
+        """
+        index_path = self.get_index_path(category)
+        if os.path.exists(index_path):
+            return True
+        if not glob.glob(f"{glob.escape(index_path)}.v-*"):
+            return False
+
+        deadline = time.perf_counter() + timeout
+        while not os.path.exists(index_path):
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def get_rerank_stats(self) -> dict:
+        """Returns the reranker's fallback and pair-cache counters, or an empty dict when reranking is off."""
+        return self.reranker.get_stats() if self.reranker is not None else {}
+
+    def _get_rerank_candidates(self, sources:list[str], dense_results:list, corpus_dict:dict, passage_chars:int=1000) -> list[tuple[str, str]]:
+        """Pairs each candidate source with the passages dense retrieval matched, or the start of its text when it has none."""
+        passages_by_source = {}
+        for document, _ in dense_results:
+            passages_by_source.setdefault(str(document.metadata['source']), []).append(document.page_content)
+
+        candidates = []
+        for source in sources:
+            for passage in passages_by_source.get(source) or [corpus_dict.get(source, '')[:passage_chars]]:
+                candidates.append((source, passage))
+        return candidates
+
+    def _rank_dense_results(self, search_results:list, metric:str, is_chunk_index:bool) -> list[tuple[str, float]]:
+        """
+        Ranks the sources of dense search results best first, with a score where higher is better.
+
+        The score is the cosine similarity, or the negated L2 distance. Chunks are aggregated per parent source by
+        the max, or the sum of the top `chunk_top_k`, of their scores.
+        """
+        scores_by_source = {}
+        for document, score in search_results:
+            score = float(score) if metric == 'cosine' else -float(score)
+            scores_by_source.setdefault(str(document.metadata['source']), []).append(score)
+
+        if not is_chunk_index or self.chunk_aggregation == 'max':
+            source_scores = {source: max(scores) for source, scores in scores_by_source.items()}
+        else:
+            source_scores = {source: sum(sorted(scores, reverse=True)[:self.chunk_top_k]) for source, scores in scores_by_source.items()}
+        return sorted(source_scores.items(), key=lambda item: item[1], reverse=True)
+
+    def _reciprocal_rank_fusion(self, rankings:list[list[str]], weights:list[float]) -> list[str]:
+        """Fuses ranked source lists with weighted reciprocal rank fusion, best first."""
+        fused_scores = {}
+        for ranking, weight in zip(rankings, weights):
+            for rank, source in enumerate(ranking):
+                fused_scores[source] = fused_scores.get(source, 0.0) + weight / (self.rrf_k + rank + 1)
+        return sorted(fused_scores, key=fused_scores.get, reverse=True)
+
+    def _select_ranked_source(self, ranked_sources:list[str], corpus_dict:dict) -> tuple[str, list]:
+        if not ranked_sources:
+            print("No document matched the query.")
             return None, None
+        return corpus_dict.get(ranked_sources[0], ''), [ranked_sources[0]]
 
-        
-        search_results = vector_store.similarity_search_with_score(query, k=5)
-        corpus_manager = CorpusManager(question_category)
-        
-        corpus_dict = corpus_manager.load_corpus(question_category)
+    @shared_tracer.traced('faiss.embed_queries')
+    def _embed_queries(self, queries:list[str], batch_size:int) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(queries), batch_size):
+            vectors.extend(self.embedding_model.embed_queries(queries[start:start + batch_size]))
+        return np.array(vectors, dtype=np.float32)
+
+    def _get_allowed_ids(self, sources_list:list[list], question_category:str) -> list[np.ndarray]:
+        if all(sources is None for sources in sources_list):
+            return [None] * len(sources_list)
+
+        source_ids = self.index_registry.get_source_ids(question_category, self.embedding_model)
+        allowed_ids_list = []
+        for sources in sources_list:
+            if sources is None:
+                allowed_ids_list.append(None)
+                continue
+
+            allowed_ids = [faiss_id for source in sources for faiss_id in source_ids.get(str(source), [])]
+            if not allowed_ids:
+                # 候選文件都不在索引中，退回搜尋整個類別
+                print(f"None of the candidate sources {sources} are in the {question_category} FAISS index.")
+                allowed_ids_list.append(None)
+                continue
+            allowed_ids_list.append(np.array(allowed_ids, dtype=np.int64))
+        return allowed_ids_list
 
+    @shared_tracer.traced('faiss.index_search')
+    def _similarity_search_many(self, vector_store:FAISS, queries:list[str], k:int, batch_size:int, allowed_ids_list:list[np.ndarray]=None) -> list[list]:
+        """
+        Same as `similarity_search_with_score` for every query, but with one embedding batch and one matrix search.
+
+        Queries with allowed ids are searched one by one through an `IDSelectorBatch`, so only the vectors of
+        their candidate sources are scanned and every returned slot belongs to an allowed document.
+        """
+        vectors = self._embed_queries(queries, batch_size)
+        if self._uses_cosine(vector_store):
+            faiss.normalize_L2(vectors)
+
+        if allowed_ids_list is None:
+            allowed_ids_list = [None] * len(queries)
+
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+
+        unrestricted = [row for row, allowed_ids in enumerate(allowed_ids_list) if allowed_ids is None]
+        if unrestricted:
+            scores[unrestricted], indices[unrestricted] = vector_store.index.search(vectors[unrestricted], k)
+
+        for row, allowed_ids in enumerate(allowed_ids_list):
+            if allowed_ids is None:
+                continue
+            selector = faiss.IDSelectorBatch(allowed_ids)
+            restricted_k = min(k, len(allowed_ids))
+            row_scores, row_indices = vector_store.index.search(vectors[row:row + 1], restricted_k, params=make_search_parameters(vector_store.index, selector))
+            scores[row, :restricted_k], indices[row, :restricted_k] = row_scores[0], row_indices[0]
+
+        search_results_list = []
+        for row_scores, row_indices in zip(scores, indices):
+            search_results = []
+            for score, i in zip(row_scores, row_indices):
+                if i == -1:
+                    # 索引中的文件數量不足 k 筆
+                    continue
+                document = vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+                search_results.append((document, score))
+            search_results_list.append(search_results)
+        return search_results_list
+
+    def _select_documents(self, scored_sources:list[tuple[str, float]], corpus_dict:dict, metric:str) -> tuple[str, list]:
         high_score_documents = []
         sources_num = []
         
-        #目前玉山競賽只要選出唯一值
-        # for document, score in search_results:
-        #     if score > 0.9:
-        #         source = document.metadata['source']
-        #         high_score_documents.append(corpus_dict.get(source, ''))
-        #         sources_num.append(source)
+        # 設定門檻時回傳所有 cosine 相似度達門檻的文件，依分數排序
+        if self.score_threshold is not None and metric == 'cosine':
+            for source, score in scored_sources:
+                if score >= self.score_threshold:
+                    high_score_documents.append(corpus_dict.get(source, ''))
+                    sources_num.append(source)
         
         if high_score_documents:
             combined_documents_context = '\n---\n'.join(high_score_documents)
@@ -108,8 +762,5 @@ class FAISSIndexManager:
             return combined_documents_context, sources_num
         
         else:
-            max_score_document = max(search_results, key=itemgetter(1))
-            documents_context = corpus_dict.get(max_score_document[0].metadata['source'], '')
-            sources_num.append(max_score_document[0].metadata['source'])
-            
-            return documents_context, sources_num
\ No newline at end of file
+            # scored_sources 已依度量排序，第一筆即為最相近的文件
+            return self._select_ranked_source([source for source, _ in scored_sources], corpus_dict)
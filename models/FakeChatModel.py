@@ -0,0 +1,69 @@
+import time
+import random
+from typing import Iterator
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Local stand-in for ChatOpenAI that answers without any network call.
+
+    The reply quotes the beginning of the last message, so answers still depend on the retrieved documents and
+    questions. Every call waits `latency_ms` before the first chunk and `token_latency_ms` between chunks of
+    `chunk_chars` characters, so it mimics both the time to first token and the streaming rate of a real model.
+    Pass it as `chat_model` of a LangChainModel to run the pipeline or the server without an OpenAI key.
+
+    A fraction `error_rate` of the calls fails before the first chunk with the same `openai.APIStatusError` a real
+    429 or 5xx reply raises, carrying `error_status_code` and, when `retry_after` is set, a `retry-after` header.
+    With `error_after_chunks` set, every call fails after yielding that many chunks instead, like a connection
+    dropped in the middle of a streamed answer.
+    """
+    latency_ms: float = 0.0
+    token_latency_ms: float = 0.0
+    chunk_chars: int = 4
+    reply_chars: int = 50
+    error_rate: float = 0.0
+    error_status_code: int = 429
+    retry_after: float = None
+    error_after_chunks: int = None
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-chat-model'
+
+    @property
+    def _identifying_params(self) -> dict:
+        # 只有回覆長度會改變回覆內容
+        return {'reply_chars': self.reply_chars}
+
+    def _generate(self, messages:list[BaseMessage], stop:list[str]=None, run_manager=None, **kwargs) -> ChatResult:
+        content = ''.join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _stream(self, messages:list[BaseMessage], stop:list[str]=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            raise self._make_error()
+
+        content = f"[fake] {messages[-1].content[:self.reply_chars]}" if messages else '[fake]'
+        for position, start in enumerate(range(0, len(content), self.chunk_chars)):
+            if position == self.error_after_chunks:
+                raise self._make_error()
+            if start and self.token_latency_ms:
+                time.sleep(self.token_latency_ms / 1000)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=content[start:start + self.chunk_chars]))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _make_error(self) -> Exception:
+        import httpx
+        import openai
+
+        headers = {'retry-after': str(self.retry_after)} if self.retry_after is not None else {}
+        response = httpx.Response(self.error_status_code, headers=headers, request=httpx.Request('POST', 'https://fake-chat-model.local/v1/chat/completions'))
+        return openai.APIStatusError(f"Fake error {self.error_status_code}", response=response, body=None)
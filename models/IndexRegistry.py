@@ -0,0 +1,241 @@
+import os
+import hashlib
+import json
+import pickle
+import threading
+import time
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from models.CorpusManager import CorpusManager
+from models.BM25Index import BM25Index
+from models.Tracer import shared_tracer
+
+
+class IndexRegistry:
+    """
+    In-process registry that keeps FAISS vector stores and corpora resident, keyed by category.
+
+    Each entry is loaded once and reused until the files backing it change on disk. A change is detected
+    through the (mtime, size) signature of the files; when `verify_content_hash` is enabled, a changed
+    signature is confirmed against a SHA-256 of the file contents before the entry is reloaded, so touching
+    a file without modifying it does not trigger a reload.
+
+    Each entry is loaded under its own lock, so loading one category never blocks the searches of another.
+    The registry only reads what the initialization built: a missing corpus is an empty one.
+    """
+    def __init__(self, index_directory:str=None, verify_content_hash:bool=False, use_mmap:bool=True):
+        self.index_directory = index_directory or os.path.dirname(os.path.abspath(__file__))
+        self.verify_content_hash = verify_content_hash
+        self.use_mmap = use_mmap
+
+        self._vector_stores = {}
+        self._corpora = {}
+        self._source_ids = {}
+        self._bm25_indexes = {}
+        self._index_metas = {}
+        # _lock 只保護各表與計數；載入在各 entry 自己的鎖內進行
+        self._lock = threading.Lock()
+        self._entry_locks = {}
+        self._counters = {
+            'index': {'hits': 0, 'misses': 0, 'load_seconds': 0.0},
+            'corpus': {'hits': 0, 'misses': 0, 'load_seconds': 0.0},
+            'source_ids': {'hits': 0, 'misses': 0, 'load_seconds': 0.0},
+            'bm25': {'hits': 0, 'misses': 0, 'load_seconds': 0.0},
+            'meta': {'hits': 0, 'misses': 0, 'load_seconds': 0.0},
+        }
+
+    def get_index_path(self, category:str) -> str:
+        return os.path.join(self.index_directory, f"{category}_faiss_index")
+
+    def get_vector_store(self, category:str, embeddings) -> FAISS:
+        """Returns the resident vector store for the category, loading it from disk on first use or after it changed."""
+        index_path = self.get_index_path(category)
+        files = [os.path.join(index_path, 'index.faiss'), os.path.join(index_path, 'index.pkl')]
+        return self._get_entry(self._vector_stores, 'index', category, files, lambda: self._load_vector_store(index_path, embeddings))
+
+    def get_source_ids(self, category:str, embeddings) -> dict[str, list[int]]:
+        """Returns the source→FAISS id table of the category, read from source_ids.json or rebuilt for older indexes."""
+        index_path = self.get_index_path(category)
+        files = [os.path.join(index_path, name) for name in ('index.faiss', 'index.pkl', 'source_ids.json')]
+        return self._get_entry(self._source_ids, 'source_ids', category, files, lambda: self._load_source_ids(category, embeddings))
+
+    def get_index_meta(self, category:str) -> dict:
+        """Returns index_meta.json of the category's index, or an empty dict for older indexes without one."""
+        file_name = os.path.join(self.get_index_path(category), 'index_meta.json')
+        return self._get_entry(self._index_metas, 'meta', category, [file_name], lambda: self._load_index_meta(file_name))
+
+    def get_bm25_index(self, category:str) -> BM25Index:
+        """Returns the lexical index saved with the category's FAISS index, or one built from the corpus for older indexes."""
+        index_path = self.get_index_path(category)
+        files = [os.path.join(index_path, 'bm25.npz'), os.path.join(index_path, 'bm25_vocabulary.json')] + CorpusManager(category).get_storage_files()
+        return self._get_entry(self._bm25_indexes, 'bm25', category, files, lambda: self._load_bm25_index(category))
+
+    def get_corpus(self, category:str) -> dict:
+        """Returns the resident corpus dictionary for the category, loading it from disk on first use or after it changed."""
+        corpus_manager = CorpusManager(category)
+        files = corpus_manager.get_storage_files()
+        return self._get_entry(self._corpora, 'corpus', category, files, lambda: self._load_corpus(corpus_manager))
+
+    def invalidate(self, category:str=None):
+        """Drops the resident entries of one category, or of every category when none is given."""
+        with self._lock:
+            for entries in (self._vector_stores, self._corpora, self._source_ids, self._bm25_indexes, self._index_metas):
+                if category is None:
+                    entries.clear()
+                else:
+                    entries.pop(category, None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {kind: dict(counters) for kind, counters in self._counters.items()}
+
+    def _get_entry(self, entries:dict, kind:str, category:str, files:list[str], loader):
+        with self._lock:
+            entry_lock = self._entry_locks.setdefault((kind, category), threading.Lock())
+
+        with entry_lock:
+            signature = self._get_signature(files)
+            entry = entries.get(category)
+
+            if entry is not None and entry['signature'] == signature:
+                with self._lock:
+                    self._counters[kind]['hits'] += 1
+                return entry['value']
+
+            if entry is not None and self.verify_content_hash:
+                content_hash = self._get_content_hash(files)
+                if entry['content_hash'] == content_hash:
+                    # 檔案被觸碰但內容沒有變更，不需要重新載入
+                    entry['signature'] = signature
+                    with self._lock:
+                        self._counters[kind]['hits'] += 1
+                    return entry['value']
+
+            start_time = time.perf_counter()
+            value, signature = self._load_consistent(files, loader)
+            with self._lock:
+                self._counters[kind]['misses'] += 1
+                self._counters[kind]['load_seconds'] += time.perf_counter() - start_time
+
+                entries[category] = {
+                    'signature': signature,
+                    'content_hash': self._get_content_hash(files) if self.verify_content_hash else None,
+                    'value': value,
+                }
+            return value
+
+    def _load_consistent(self, files:list[str], loader, attempts:int=5):
+        """
+        Loads an entry and returns it with the signature of the files it was read from.
+
+        Indexes are replaced by repointing a symlink to a new version directory and removing the previous one, so a
+        load that races with a swap can fail on a missing file or read files from two versions. In both cases the load is retried once the swap has finished.
+        """
+        for attempt in range(attempts):
+            signature = self._get_signature(files)
+            try:
+                value = loader()
+            except FileNotFoundError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.05)
+                continue
+
+            # 載入期間簽章有變動（例如 load_corpus 建立了檔案或索引被替換）時重新取得
+            new_signature = self._get_signature(files)
+            if new_signature == signature or attempt == attempts - 1:
+                return value, new_signature
+        raise FileNotFoundError(f"Could not load a consistent version of {files}.")
+
+    @shared_tracer.traced('faiss.load')
+    def _load_vector_store(self, index_path:str, embeddings) -> FAISS:
+        index = self._read_index(os.path.join(index_path, 'index.faiss'))
+
+        # 僅當來源可信時才反序列化 index.pkl
+        with open(os.path.join(index_path, 'index.pkl'), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id
+        )
+
+    def _load_source_ids(self, category:str, embeddings) -> dict[str, list[int]]:
+        file_name = os.path.join(self.get_index_path(category), 'source_ids.json')
+        if os.path.exists(file_name):
+            with open(file_name, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        # 舊版索引沒有預先建立的對照表，從 docstore 重建
+        return self.build_source_id_table(self.get_vector_store(category, embeddings))
+
+    @staticmethod
+    @shared_tracer.traced('corpus.load')
+    def _load_corpus(corpus_manager:CorpusManager) -> dict:
+        # 搜尋時不建立語料，語料需先由初始化流程建立
+        if not corpus_manager.exists():
+            print(f"The {corpus_manager.category} corpus does not exist, run the initialization first.")
+            return {}
+        return dict(corpus_manager.iter_corpus())
+
+    @staticmethod
+    def _load_index_meta(file_name:str) -> dict:
+        if not os.path.exists(file_name):
+            return {}
+        with open(file_name, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load_bm25_index(self, category:str) -> BM25Index:
+        index_path = self.get_index_path(category)
+        if BM25Index.exists(index_path):
+            return BM25Index.load(index_path)
+        return BM25Index.build(CorpusManager(category).iter_corpus())
+
+    @staticmethod
+    def build_source_id_table(vector_store:FAISS) -> dict[str, list[int]]:
+        """Maps each document source to the FAISS internal ids of its vectors."""
+        source_ids = {}
+        for faiss_id, docstore_id in vector_store.index_to_docstore_id.items():
+            source = vector_store.docstore.search(docstore_id).metadata['source']
+            source_ids.setdefault(str(source), []).append(int(faiss_id))
+        return source_ids
+
+    def _read_index(self, file_name:str):
+        if not os.path.exists(file_name):
+            raise FileNotFoundError(file_name)
+        if self.use_mmap:
+            try:
+                return faiss.read_index(file_name, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                # 並非所有索引類型都支援 memory-map，退回一般讀取
+                pass
+        return faiss.read_index(file_name)
+
+    @staticmethod
+    def _get_signature(files:list[str]) -> tuple:
+        signature = []
+        for file_name in files:
+            try:
+                stat = os.stat(file_name)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    @staticmethod
+    def _get_content_hash(files:list[str]) -> str:
+        sha256 = hashlib.sha256()
+        for file_name in files:
+            if not os.path.exists(file_name):
+                sha256.update(b'\0missing\0')
+                continue
+            with open(file_name, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha256.update(block)
+        return sha256.hexdigest()
+
+
+shared_index_registry = IndexRegistry()
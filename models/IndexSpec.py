@@ -0,0 +1,99 @@
+import math
+
+import faiss
+import numpy as np
+
+
+# 各索引類型的預設參數
+INDEX_SPEC_DEFAULTS = {
+    'flat': {},
+    'hnsw': {'M': 32, 'efConstruction': 80, 'efSearch': 64},
+    'ivfpq': {'nlist': 256, 'nprobe': 16, 'code_size': 64, 'nbits': 8},
+}
+
+# IVF 每個分群至少需要的訓練向量數，低於此數時自動減少分群
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def normalize_index_spec(index_spec:dict=None) -> dict:
+    """Fills in the default parameters of an index spec such as {'type': 'hnsw', 'M': 32}."""
+    index_spec = dict(index_spec or {'type': 'flat'})
+    index_type = index_spec.get('type', 'flat')
+    if index_type not in INDEX_SPEC_DEFAULTS:
+        raise ValueError(f"Unknown index spec type '{index_type}', expected one of {list(INDEX_SPEC_DEFAULTS)}.")
+
+    unknown = set(index_spec) - set(INDEX_SPEC_DEFAULTS[index_type]) - {'type'}
+    if unknown:
+        raise ValueError(f"Unknown parameters {sorted(unknown)} for a '{index_type}' index.")
+    return dict(INDEX_SPEC_DEFAULTS[index_type], **dict(index_spec, type=index_type))
+
+
+def build_index(index_spec:dict, dimension:int, metric_type:int, vectors:np.ndarray, ids:np.ndarray) -> tuple[faiss.Index, dict]:
+    """
+    Builds an IndexIDMap over the index described by `index_spec`, training it on `vectors` when needed.
+
+    IVF-PQ parameters are reduced to what the number of vectors can train: fewer lists, fewer bits per code and a
+    code size that divides the dimension; with too few vectors for any IVF-PQ the index falls back to flat.
+
+    Returns:
+        tuple[faiss.Index, dict]: The filled index and the spec it was actually built with.
+    """
+    index_spec = normalize_index_spec(index_spec)
+
+    if index_spec['type'] == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, index_spec['M'], metric_type)
+        index.hnsw.efConstruction = index_spec['efConstruction']
+
+    elif index_spec['type'] == 'ivfpq':
+        index_spec = _fit_ivfpq_spec(index_spec, dimension, len(vectors))
+        if index_spec['type'] == 'flat':
+            print(f"Too few vectors ({len(vectors)}) to train an IVF-PQ index, using a flat index.")
+            return build_index(index_spec, dimension, metric_type, vectors, ids)
+
+        quantizer = faiss.IndexFlat(dimension, metric_type)
+        index = faiss.IndexIVFPQ(quantizer, dimension, index_spec['nlist'], index_spec['code_size'], index_spec['nbits'], metric_type)
+        index.train(vectors)
+
+    else:
+        index = faiss.IndexFlat(dimension, metric_type)
+
+    id_map = faiss.IndexIDMap(index)
+    if len(vectors):
+        id_map.add_with_ids(vectors, ids)
+    apply_search_settings(id_map, index_spec)
+    return id_map, index_spec
+
+
+def apply_search_settings(index:faiss.Index, index_spec:dict):
+    """Sets the query-time parameters (efSearch, nprobe) of the spec on a loaded index."""
+    inner_index = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if index_spec.get('type') == 'hnsw' and isinstance(inner_index, faiss.IndexHNSW):
+        inner_index.hnsw.efSearch = index_spec['efSearch']
+    elif index_spec.get('type') == 'ivfpq' and isinstance(inner_index, faiss.IndexIVF):
+        inner_index.nprobe = index_spec['nprobe']
+
+
+def make_search_parameters(index:faiss.Index, selector:faiss.IDSelector=None) -> faiss.SearchParameters:
+    """Search parameters of the index's own type, so a selector does not reset efSearch or nprobe."""
+    inner_index = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if isinstance(inner_index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner_index.hnsw.efSearch)
+    if isinstance(inner_index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner_index.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def is_flat_index(index:faiss.Index) -> bool:
+    inner_index = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    return isinstance(inner_index, faiss.IndexFlat)
+
+
+def _fit_ivfpq_spec(index_spec:dict, dimension:int, vector_count:int) -> dict:
+    nbits = min(index_spec['nbits'], int(math.log2(vector_count)) if vector_count > 1 else 0)
+    nlist = min(index_spec['nlist'], vector_count // _MIN_POINTS_PER_CENTROID)
+    if nbits < 4 or nlist < 1:
+        return normalize_index_spec({'type': 'flat'})
+
+    # PQ 的子向量數必須整除維度
+    code_size = max(size for size in range(1, min(index_spec['code_size'], dimension) + 1) if dimension % size == 0)
+    return dict(index_spec, nlist=nlist, nbits=nbits, code_size=code_size, nprobe=min(index_spec['nprobe'], nlist))
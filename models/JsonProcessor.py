@@ -3,6 +3,7 @@ import os
 # import sys
 # sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__))))
 from models.CorpusManager import CorpusManager
+from models.CorpusManifest import CorpusManifest
 
 
 class JsonProcessor:
@@ -14,30 +15,78 @@ class JsonProcessor:
             raise FileNotFoundError(f"Reference data is missing, the path is incorrect, or the directory is empty: {self.category_source_path}")
 
         self.corpusmanager = CorpusManager(category)
+        self.manifest = CorpusManifest(category)
+        self.delta = {'updated': [], 'deleted': []}
+        self._delta_files = {'updated': [], 'deleted': []}
         
     def create_and_save_json_content(self) -> dict:
-        formatted_data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'formatted_data')
-        os.makedirs(formatted_data_path, exist_ok=True)
-        
-        if not os.path.exists(f"{formatted_data_path}/{self.category}_all_text.json"):
-            file_ls = self._get_json_file_names()
-
-            corpus_dict_all = {}
-            for file in file_ls:
-                file_name = os.path.join(self.category_source_path, file)
-                corpus_dict = self._extract_qa_from_json(file_name)
-                corpus_dict_all.update(corpus_dict)
-            self.corpusmanager.save_corpus(corpus_dict_all)
-            # print(f'The {self.category} Json data has been extracted and returned as a dictionary, and saved to data/formatted_data/.') 
-            return  corpus_dict_all
-
-        else:
-            # print(f'The {self.category} Json context dictionary already exists and has been returned from data/formatted_data/ as a dictionary.')
-            corpus_dict_all = self.corpusmanager.load_corpus()
-            return  corpus_dict_all
+        """
+        Extracts the FAQ entries of added or changed JSON files and saves them, keeping the manifest up to date.
+
+        Entries of deleted files, and entries that disappeared from changed files, are removed from the corpus.
+        The changed and deleted sources are kept in `self.delta` for the downstream stages; the files are only
+        marked done by `commit_delta` once the index is updated.
+        """
+        file_ls = self._get_json_file_names()
+        if not self.corpusmanager.exists():
+            # 語料不存在時 manifest 已失效，所有檔案都需重新處理
+            self.manifest.entries.clear()
+        elif not self.manifest.exists():
+            self._adopt_existing_corpus(file_ls)
+
+        delta = self.manifest.get_delta(self.category_source_path, file_ls)
+
+        deleted_sources = [source for sources in delta['deleted'].values() for source in sources]
+
+        corpus_dict_all = {}
+        processed_sources = {}
+        # FAQ 擷取成本低，已寫入語料但尚未建立索引的檔案直接重新擷取
+        for file in delta['stored'] + delta['to_process']:
+            file_name = os.path.join(self.category_source_path, file)
+            corpus_dict = self._extract_qa_from_json(file_name)
+            corpus_dict_all.update(corpus_dict)
+
+            # 變更後的檔案中已不存在的題目也要從語料中刪除
+            deleted_sources.extend(set(self.manifest.entries[file]['sources']) - set(corpus_dict))
+            processed_sources[file] = list(corpus_dict.keys())
+
+        self.corpusmanager.delete_documents(deleted_sources)
+        self.corpusmanager.save_corpus(corpus_dict_all)
+        self.corpusmanager.export_json()
+        for file, sources in processed_sources.items():
+            self.manifest.mark_stored(file, sources)
+        self.manifest.save()
+
+        self.delta = {'updated': list(corpus_dict_all.keys()), 'deleted': deleted_sources}
+        self._delta_files = {'updated': list(processed_sources), 'deleted': list(delta['deleted'])}
+        # print(f'The {self.category} Json data has been extracted and returned as a dictionary, and saved to data/formatted_data/.') 
+        return self.corpusmanager.load_corpus()
+
+    def commit_delta(self, failed_sources:list[str]=None):
+        """
+        Marks the files of `self.delta` done and forgets the deleted ones, after the index was updated with it.
+        Files with any of `failed_sources` stay stored and are indexed again on the next run.
+        """
+        failed_sources = set(failed_sources or [])
+        for file in self._delta_files['updated']:
+            if failed_sources & set(self.manifest.entries[file].get('stored_sources', [])):
+                continue
+            self.manifest.mark_done(file)
+        for file in self._delta_files['deleted']:
+            self.manifest.remove(file)
+        self.manifest.save()
+
+    def _adopt_existing_corpus(self, file_ls:list[str]):
+        # 舊版建置沒有 manifest：內容與現有語料一致的檔案直接標記為完成
+        sources_by_file = {}
+        for file in file_ls:
+            corpus_dict = self._extract_qa_from_json(os.path.join(self.category_source_path, file))
+            if all(self.corpusmanager.get_document(key) == value for key, value in corpus_dict.items()):
+                sources_by_file[file] = list(corpus_dict.keys())
+        self.manifest.adopt(self.category_source_path, file_ls, sources_by_file)
         
     def _get_json_file_names(self) -> list[str]:
-        return [f for f in os.listdir(self.category_source_path) if f.endswith('.json')]
+        return sorted(f for f in os.listdir(self.category_source_path) if f.endswith('.json'))
 
     def _extract_qa_from_json(self, file_name:str) -> dict:
         corpus_dict = {}
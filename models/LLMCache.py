@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+class LLMCache:
+    """
+    Content-addressed, persistent cache of LLM outputs backed by SQLite.
+
+    Entries are keyed by a SHA-256 of the prompt template, the model name and the input variables, so a cached
+    output is only reused when the exact same request would be sent again. The least recently used entries are
+    evicted once the cache holds more than `max_entries` entries or `max_bytes` bytes of outputs.
+    """
+    def __init__(self, file_name:str=None, max_entries:int=100000, max_bytes:int=None):
+        if file_name is None:
+            file_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'cache', 'llm_cache.sqlite')
+        os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+
+        self.file_name = file_name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_name, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS llm_cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, tokens INTEGER NOT NULL, '
+            'size INTEGER NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)')
+        self._connection.commit()
+
+        self._stats = {'hits': 0, 'misses': 0, 'saved_tokens': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(prompt_template, model_name:str, input_data:dict) -> str:
+        payload = json.dumps({
+            'prompt': prompt_template.pretty_repr(),
+            'model': model_name,
+            'input': input_data,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key:str):
+        with self._lock:
+            row = self._connection.execute('SELECT value, tokens FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+
+            self._connection.execute('UPDATE llm_cache SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._connection.commit()
+            self._stats['hits'] += 1
+            self._stats['saved_tokens'] += row[1]
+            return row[0]
+
+    def set(self, key:str, value:str, tokens:int):
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, value, tokens, size, last_access) VALUES (?, ?, ?, ?, ?)',
+                (key, value, tokens, size, time.time())
+            )
+            self._evict()
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('DELETE FROM llm_cache')
+            self._connection.commit()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            entries, total_bytes = self._connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache').fetchone()
+            return dict(self._stats, entries=entries, bytes=total_bytes)
+
+    def _evict(self):
+        if self.max_entries is not None:
+            entries = self._connection.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+            if entries > self.max_entries:
+                self._delete_oldest(entries - self.max_entries)
+
+        if self.max_bytes is not None:
+            total_bytes = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM llm_cache').fetchone()[0]
+            while total_bytes > self.max_bytes:
+                row = self._connection.execute('SELECT key, size FROM llm_cache ORDER BY last_access LIMIT 1').fetchone()
+                if row is None:
+                    break
+                self._connection.execute('DELETE FROM llm_cache WHERE key = ?', (row[0],))
+                self._stats['evictions'] += 1
+                total_bytes -= row[1]
+
+    def _delete_oldest(self, count:int):
+        self._connection.execute(
+            'DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)', (count,)
+        )
+        self._stats['evictions'] += count
@@ -1,28 +1,295 @@
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
 import os
 import sys
+import json
+import time
+import random
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config'))
-from config.Config import Config
+import threading
+from config.Config import get_config
+from models.RateLimiter import RateLimiter
+from models.LLMCache import LLMCache
+from models.LatencyHistogram import LatencyHistogram
+from models.SharedModels import get_chat_model, check_chat_model_config, ConfigurationError
+from models.Tracer import shared_tracer
 
 
-config = Config()
+# 呼叫失敗時回傳的內容，這類回覆不寫入任何快取
+FAILED_RESPONSE = "An error occurred while processing the request."
+# 沒有檢索內容或問題時不呼叫模型，直接回傳
+INVALID_INPUT_RESPONSE = "Invalid input provided."
+
+_shared_lock = threading.Lock()
+_shared_llm_cache = None
+_shared_langchain_model = None
+
+def get_shared_llm_cache() -> LLMCache:
+    global _shared_llm_cache
+    with _shared_lock:
+        if _shared_llm_cache is None:
+            config = get_config()
+            _shared_llm_cache = LLMCache(max_entries=config.LLM_CACHE_MAX_ENTRIES, max_bytes=config.LLM_CACHE_MAX_BYTES)
+        return _shared_llm_cache
+
+def get_shared_langchain_model() -> 'LangChainModel':
+    """Returns the process-wide LangChainModel, so every component shares one rate limiter, pool and cache."""
+    global _shared_langchain_model
+    if _shared_langchain_model is None:
+        model = LangChainModel()
+        with _shared_lock:
+            if _shared_langchain_model is None:
+                _shared_langchain_model = model
+    return _shared_langchain_model
 
 class LangChainModel:
-    def __init__(self):
+    """
+    Wraps the chat model behind the prompts used by the pipeline.
+
+    Every call goes through a shared requests/tokens-per-minute limiter and is retried with exponential backoff
+    on 429 and 5xx errors. The `get_*s` batch methods run their calls on a bounded worker pool and return the
+    results in input order. Any LangChain chat model can be passed as `chat_model`, e.g. a fake model with
+    injected latency and errors for tests.
+
+    Successful outputs are stored in an `LLMCache` keyed by the prompt template, model name and input variables,
+    so unchanged requests are answered from disk. Pass `use_cache=False` to bypass the cache.
+
+    `stream_response` yields the answer as it is generated; its time to first token and total time are recorded
+    in histograms reported by `get_stream_stats`.
+    """
+    def __init__(self, chat_model=None, max_concurrency:int=None, requests_per_minute:int=None, tokens_per_minute:int=None, max_retries:int=None, cache:LLMCache=None, use_cache:bool=None):
         # 初始化配置和模型
-        self.chat_model = ChatOpenAI(model='gpt-4o-mini', api_key=config.OPENAI_API_KEY)
+        config = get_config()
+        self.model_name = 'gpt-4o-mini'
+        # 未指定時使用共用的 ChatOpenAI，第一次呼叫時才建立；設定錯誤（例如缺少金鑰）在建立時即回報
+        if chat_model is None:
+            check_chat_model_config(config)
+        self._chat_model = chat_model
+        # 快取鍵使用實際回覆的模型，注入的模型（例如假模型）不會沿用或寫入 gpt-4o-mini 的快取
+        self.model_identity = self.get_model_identity(chat_model) if chat_model is not None else self.model_name
         self.str_parser = StrOutputParser()
 
+        self.max_concurrency = max_concurrency or config.LLM_MAX_CONCURRENCY
+        self.max_retries = max_retries if max_retries is not None else config.LLM_MAX_RETRIES
+        self.rate_limiter = RateLimiter(
+            requests_per_minute or config.LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute or config.LLM_TOKENS_PER_MINUTE
+        )
+        # 預估 token 時為回覆保留的額度
+        self.completion_tokens_estimate = 512
+        self.max_backoff_seconds = 60
+
+        self.use_cache = config.LLM_CACHE_ENABLED if use_cache is None else use_cache
+        self.cache = cache or (get_shared_llm_cache() if self.use_cache else None)
+
+        self.stream_latency = {'ttft': LatencyHistogram(), 'total': LatencyHistogram()}
+
+    @staticmethod
+    def get_model_identity(chat_model) -> str:
+        """Identifies an injected chat model by its type and parameters, e.g. `openai-chat:{"model": ...}`."""
+        return f"{chat_model._llm_type}:{json.dumps(chat_model._identifying_params, sort_keys=True, default=str)}"
+
+    @property
+    def chat_model(self):
+        if self._chat_model is None:
+            self._chat_model = get_chat_model(self.model_name)
+        return self._chat_model
+
     def _generate_response(self, prompt_template, input_data: dict) -> str:
+        with shared_tracer.span('llm.generate') as span:
+            try:
+                cache_key = None
+                if self.use_cache:
+                    cache_key = LLMCache.make_key(prompt_template, self.model_identity, input_data)
+                    cached_response = self.cache.get(cache_key)
+                    if cached_response is not None:
+                        span.set('cache_hits', 1)
+                        return cached_response
+
+                # 保留模型回傳的訊息，才能讀取實際的 token 用量
+                chain = prompt_template | self.chat_model
+                message = self._invoke_with_retry(chain, prompt_template, input_data)
+                response = self.str_parser.invoke(message)
+                if shared_tracer.enabled:
+                    for name, value in self._get_usage(getattr(message, 'usage_metadata', None) or {}, prompt_template, input_data, response).items():
+                        span.set(name, value)
+
+                # 只快取成功的回覆，失敗的請求下次會重新呼叫
+                if cache_key is not None:
+                    estimated_tokens = self._estimate_tokens(prompt_template, input_data) - self.completion_tokens_estimate + len(response)
+                    self.cache.set(cache_key, response, estimated_tokens)
+                return response
+            except ConfigurationError:
+                # 設定錯誤每次呼叫都會失敗，不能當成單次請求失敗吞掉
+                raise
+            except Exception as e:
+                print(f"Error invoking the chain: {e}")
+                span.set('failures', 1)
+        return FAILED_RESPONSE
+
+    def _get_usage(self, usage: dict, prompt_template, input_data: dict, response: str) -> dict:
+        """The prompt/completion tokens and the cost of one call as span values, estimated when the model reports no usage."""
+        values = {}
+        prompt_tokens = usage.get('input_tokens')
+        completion_tokens = usage.get('output_tokens')
+        if prompt_tokens is None or completion_tokens is None:
+            prompt_tokens = self._estimate_tokens(prompt_template, input_data) - self.completion_tokens_estimate
+            completion_tokens = len(response)
+            values['estimated_usage'] = 1
+
+        config = get_config()
+        values['prompt_tokens'] = prompt_tokens
+        values['completion_tokens'] = completion_tokens
+        values['cost_usd'] = (prompt_tokens * config.LLM_INPUT_COST_PER_MILLION + completion_tokens * config.LLM_OUTPUT_COST_PER_MILLION) / 1000000
+        return values
+
+    def _generate_responses(self, prompt_template, input_data_list: list[dict]) -> list[str]:
+        """Runs `_generate_response` for every input on a bounded worker pool, keeping the input order."""
+        if not input_data_list:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(input_data_list))) as executor:
+            return list(executor.map(lambda input_data: self._generate_response(prompt_template, input_data), input_data_list))
+
+    def _generate_stream(self, prompt_template, input_data: dict) -> Iterator[str]:
+        """
+        Streams one response. A call that fails before the first chunk yields FAILED_RESPONSE like
+        `_generate_response`; a failure after chunks were yielded is raised, so the caller can report the answer as
+        incomplete instead of finishing it normally.
+
+        Spans cannot stay open across the yields of a generator, so the call is recorded as an 'llm.stream' span
+        with `Tracer.record` once it ends.
+        """
+        start_time = time.perf_counter()
+        values = {}
+        failed = False
+        try:
+            cache_key = None
+            if self.use_cache:
+                cache_key = LLMCache.make_key(prompt_template, self.model_identity, input_data)
+                cached_response = self.cache.get(cache_key)
+                if cached_response is not None:
+                    values['cache_hits'] = 1
+                    self.stream_latency['ttft'].observe(time.perf_counter() - start_time)
+                    self.stream_latency['total'].observe(time.perf_counter() - start_time)
+                    yield cached_response
+                    return
+
+            chunks = []
+            usage = {}
+            try:
+                # 保留模型回傳的訊息片段，才能讀取最後一個片段附帶的 token 用量
+                chain = prompt_template | self.chat_model
+                for message in self._stream_with_retry(chain, prompt_template, input_data):
+                    for name, count in (getattr(message, 'usage_metadata', None) or {}).items():
+                        if isinstance(count, int):
+                            usage[name] = usage.get(name, 0) + count
+                    chunk = self.str_parser.invoke(message)
+                    if not chunk:
+                        continue
+                    if not chunks:
+                        self.stream_latency['ttft'].observe(time.perf_counter() - start_time)
+                    chunks.append(chunk)
+                    yield chunk
+            except ConfigurationError:
+                raise
+            except Exception as e:
+                print(f"Error streaming the chain: {e}")
+                values['failures'] = 1
+                if chunks:
+                    # 已送出部分回覆，交由呼叫端回報錯誤，不能當成完整的回覆
+                    raise
+                yield FAILED_RESPONSE
+                return
+            self.stream_latency['total'].observe(time.perf_counter() - start_time)
+
+            response = ''.join(chunks)
+            if shared_tracer.enabled:
+                values.update(self._get_usage(usage, prompt_template, input_data, response))
+
+            # 與 _generate_response 相同，只快取完整成功的回覆
+            if cache_key is not None:
+                estimated_tokens = self._estimate_tokens(prompt_template, input_data) - self.completion_tokens_estimate + len(response)
+                self.cache.set(cache_key, response, estimated_tokens)
+        except BaseException:
+            # 包含呼叫端提前關閉產生器（GeneratorExit）
+            failed = True
+            raise
+        finally:
+            shared_tracer.record('llm.stream', time.perf_counter() - start_time, failed, **values)
+
+    def get_stream_stats(self) -> dict:
+        """Returns the time-to-first-token and total-time histograms of streamed responses."""
+        return {stage: histogram.snapshot() for stage, histogram in self.stream_latency.items()}
+
+    def get_cache_stats(self) -> dict:
+        """Returns hits, misses, saved tokens and size of the LLM output cache, or an empty dict when it is bypassed."""
+        return self.cache.get_stats() if self.use_cache else {}
+
+    def _invoke_with_retry(self, chain, prompt_template, input_data: dict):
+        estimated_tokens = self._estimate_tokens(prompt_template, input_data)
+
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(estimated_tokens)
+            try:
+                return chain.invoke(input_data)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                time.sleep(self._get_backoff_seconds(e, attempt))
+                attempt += 1
+
+    def _stream_with_retry(self, chain, prompt_template, input_data: dict) -> Iterator[str]:
+        estimated_tokens = self._estimate_tokens(prompt_template, input_data)
+
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(estimated_tokens)
+            started = False
+            try:
+                for chunk in chain.stream(input_data):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                # 已輸出部分內容後不能重試，否則呼叫端會收到重複的文字
+                if started or attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                time.sleep(self._get_backoff_seconds(e, attempt))
+                attempt += 1
+
+    def _estimate_tokens(self, prompt_template, input_data: dict) -> int:
+        # 中文約一字一個 token，以字數粗估即可
         try:
-            chain = prompt_template | self.chat_model | self.str_parser
-            return chain.invoke(input_data)
-        except Exception as e:
-            print(f"Error invoking the chain: {e}")
-        return "An error occurred while processing the request."
+            prompt_length = sum(len(message.content) for message in prompt_template.format_messages(**input_data))
+        except Exception:
+            prompt_length = sum(len(str(value)) for value in input_data.values())
+        return prompt_length + self.completion_tokens_estimate
+
+    @staticmethod
+    def _get_status_code(error: Exception):
+        status_code = getattr(error, 'status_code', None)
+        if status_code is None:
+            status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+        return status_code
+
+    def _is_retryable(self, error: Exception) -> bool:
+        status_code = self._get_status_code(error)
+        return status_code is not None and (status_code == 429 or status_code >= 500)
+
+    def _get_backoff_seconds(self, error: Exception, attempt: int) -> float:
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        retry_after = headers.get('retry-after')
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff_seconds)
+            except ValueError:
+                pass
+        return min(2 ** attempt, self.max_backoff_seconds) + random.uniform(0, 1)
     
     
     def get_ocr_prompt(self) -> ChatPromptTemplate:
@@ -38,6 +305,10 @@ class LangChainModel:
     def get_formatted_text_from_ocr(self, ocr_message:str) -> str:
 
         return self._generate_response(self.get_ocr_prompt(), {"input": ocr_message})
+
+    def get_formatted_texts_from_ocr(self, ocr_messages:list[str]) -> list[str]:
+
+        return self._generate_responses(self.get_ocr_prompt(), [{"input": ocr_message} for ocr_message in ocr_messages])
         
 
 
@@ -55,6 +326,10 @@ class LangChainModel:
 
         return self._generate_response(self.get_document_summary_prompt(), {"input": document_message})
 
+    def get_document_summaries(self, document_messages:list[str]) -> list[str]:
+
+        return self._generate_responses(self.get_document_summary_prompt(), [{"input": document_message} for document_message in document_messages])
+
 
     def get_response_prompt(self) -> ChatPromptTemplate:
         # 返回一個帶有客製化提示語的 prompt
@@ -73,13 +348,42 @@ class LangChainModel:
         if not rag_content or not human_message:
             print("Empty input detected.")
             print(rag_content)
-            return "Invalid input provided."
+            return INVALID_INPUT_RESPONSE
     
         return self._generate_response(self.get_response_prompt(), {
             "rag_content": rag_content,
             "input": human_message
         })
 
+    def stream_response(self, rag_content:str, human_message:str) -> Iterator[str]:
+        """Streams the answer of `get_response` chunk by chunk as the chat model produces it."""
+        if not rag_content or not human_message:
+            print("Empty input detected.")
+            print(rag_content)
+            yield INVALID_INPUT_RESPONSE
+            return
 
+        yield from self._generate_stream(self.get_response_prompt(), {
+            "rag_content": rag_content,
+            "input": human_message
+        })
+
+    def get_responses(self, rag_contents:list[str], human_messages:list[str]) -> list[str]:
+        """Answers many questions concurrently; invalid inputs get the same reply as `get_response`."""
+        responses = [INVALID_INPUT_RESPONSE] * len(human_messages)
 
-        
\ No newline at end of file
+        valid_positions = []
+        for position, (rag_content, human_message) in enumerate(zip(rag_contents, human_messages)):
+            if not rag_content or not human_message:
+                print("Empty input detected.")
+                print(rag_content)
+                continue
+            valid_positions.append(position)
+
+        valid_responses = self._generate_responses(self.get_response_prompt(), [
+            {"rag_content": rag_contents[position], "input": human_messages[position]}
+            for position in valid_positions
+        ])
+        for position, response in zip(valid_positions, valid_responses):
+            responses[position] = response
+        return responses
@@ -0,0 +1,66 @@
+import bisect
+import threading
+
+
+class LatencyHistogram:
+    """
+    Thread-safe latency histogram with fixed millisecond buckets.
+
+    Each observation increments the first bucket whose upper bound covers it; percentiles are estimated as the
+    upper bound of the bucket they fall in, which is exact enough for dashboards and costs O(log buckets) per
+    observation regardless of how many requests have been served.
+    """
+    DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+    def __init__(self, buckets_ms:tuple=DEFAULT_BUCKETS_MS):
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self._lock = threading.Lock()
+        # 最後一格收集超過最大上限的觀測值
+        self._counts = [0] * (len(self.buckets_ms) + 1)
+        self._count = 0
+        self._sum_ms = 0.0
+        self._max_ms = 0.0
+
+    def observe(self, seconds:float):
+        milliseconds = seconds * 1000
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets_ms, milliseconds)] += 1
+            self._count += 1
+            self._sum_ms += milliseconds
+            self._max_ms = max(self._max_ms, milliseconds)
+
+    def percentile(self, fraction:float) -> float:
+        with self._lock:
+            return self._percentile(fraction)
+
+    def snapshot(self) -> dict:
+        """Returns count, mean, max, p50/p95/p99 and the cumulative bucket counts (Prometheus `le` style) in ms."""
+        with self._lock:
+            cumulative = 0
+            buckets = []
+            for upper_ms, count in zip(self.buckets_ms + (float('inf'),), self._counts):
+                cumulative += count
+                buckets.append({'le_ms': upper_ms if upper_ms != float('inf') else '+Inf', 'count': cumulative})
+
+            return {
+                'count': self._count,
+                'mean_ms': self._sum_ms / self._count if self._count else 0.0,
+                'max_ms': self._max_ms,
+                'p50_ms': self._percentile(0.5),
+                'p95_ms': self._percentile(0.95),
+                'p99_ms': self._percentile(0.99),
+                'buckets': buckets,
+            }
+
+    def _percentile(self, fraction:float) -> float:
+        if not self._count:
+            return 0.0
+
+        rank = fraction * self._count
+        cumulative = 0
+        for position, count in enumerate(self._counts):
+            cumulative += count
+            if cumulative >= rank:
+                # 超過最大上限的觀測值以實際最大值表示
+                return self.buckets_ms[position] if position < len(self.buckets_ms) else self._max_ms
+        return self._max_ms
@@ -0,0 +1,216 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+
+class OCRCache:
+    """
+    Persistent cache of OCR results keyed by image content, backed by SQLite.
+
+    Each entry holds the raw Tesseract text of an image and, once the LLM has cleaned it up, the formatted text
+    together with the `format_key` (OCR prompt and model) it was produced with; a formatted text of another key is
+    a miss. Images are looked up by the digest of their content. With `max_distance` set, an image of the same
+    size whose perceptual hash differs in at most `max_distance` of its 256 bits is only a candidate: its stored
+    grayscale pixels are compared block by block and the entry is reused only when no block differs by more than
+    `max_block_difference`, so re-encoded copies of letterheads and boilerplate are recognized while scans that
+    differ in a few digits are not. By default (`max_distance=None`) only exact copies are reused. The least
+    recently used entries are evicted beyond `max_entries`.
+    """
+    hash_size = 16
+    # 逐區塊比較像素時的區塊邊長與允許的平均灰階差；改過一個數字的區塊會遠超過此值
+    block_size = 8
+    max_block_difference = 24
+
+    def __init__(self, file_name:str=None, max_distance:int=None, max_entries:int=100000):
+        if file_name is None:
+            file_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'cache', 'ocr_cache.sqlite')
+        os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+
+        self.file_name = file_name
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_name, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS ocr_cache ('
+            'digest TEXT PRIMARY KEY, phash BLOB NOT NULL, width INTEGER NOT NULL, height INTEGER NOT NULL, '
+            'ocr_text TEXT NOT NULL, formatted_text TEXT, last_access REAL NOT NULL)'
+        )
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(ocr_cache)')]
+        if 'format_key' not in columns:
+            # 舊版快取的格式化結果沒有記錄 prompt 與模型，不再命中
+            self._connection.execute('ALTER TABLE ocr_cache ADD COLUMN format_key TEXT')
+        if 'pixels' not in columns:
+            self._connection.execute('ALTER TABLE ocr_cache ADD COLUMN pixels BLOB')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS ocr_cache_last_access ON ocr_cache (last_access)')
+        self._connection.commit()
+
+        # 依圖片尺寸分組的感知雜湊，近似比對只掃描同尺寸的圖片
+        self._hashes = {}
+        self._stats = {'ocr_hits': 0, 'similar_hits': 0, 'ocr_misses': 0, 'similar_rejected': 0, 'formatted_hits': 0, 'formatted_misses': 0}
+        self._load_hashes()
+
+    @staticmethod
+    def make_digest(data:bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @classmethod
+    def perceptual_hash(cls, image) -> bytes:
+        """DCT hash of a PIL image: the signs of its lowest frequencies against their median, packed into bytes."""
+        from PIL import Image
+
+        size = cls.hash_size * 4
+        pixels = np.asarray(image.convert('L').resize((size, size), Image.LANCZOS), dtype=np.float64)
+        positions = np.arange(size)
+        dct_matrix = np.cos(np.pi * (2 * positions[None, :] + 1) * positions[:, None] / (2 * size))
+        frequencies = (dct_matrix @ pixels @ dct_matrix.T)[:cls.hash_size, :cls.hash_size]
+        return np.packbits(frequencies > np.median(frequencies)).tobytes()
+
+    def get(self, digest:str):
+        """Returns the raw OCR text of an exact copy of the image, or None."""
+        with self._lock:
+            row = self._connection.execute('SELECT ocr_text FROM ocr_cache WHERE digest = ?', (digest,)).fetchone()
+            if row is None:
+                return None
+            self._touch(digest)
+            self._stats['ocr_hits'] += 1
+            return row[0]
+
+    def get_similar(self, digest:str, phash:bytes, image):
+        """
+        Returns the raw OCR text of a near-duplicate of the PIL `image` whose pixels match, or None; a found entry
+        is also stored under `digest` so the next copy of this image is an exact hit.
+        """
+        if self.max_distance is None:
+            with self._lock:
+                self._stats['ocr_misses'] += 1
+            return None
+
+        with self._lock:
+            candidates = self._find_similar(phash, image.size)
+            rows = [
+                (candidate, self._connection.execute('SELECT pixels FROM ocr_cache WHERE digest = ?', (candidate,)).fetchone())
+                for candidate in candidates
+            ]
+
+        # 感知雜湊只篩選候選，像素比對在鎖外進行
+        pixels = self.get_pixels(image)
+        match = next((candidate for candidate, row in rows if row is not None and row[0] is not None and self._same_pixels(row[0], pixels)), None)
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT ocr_text, formatted_text, format_key FROM ocr_cache WHERE digest = ?', (match,)
+            ).fetchone() if match is not None else None
+            if row is None:
+                self._stats['similar_rejected'] += bool(candidates)
+                self._stats['ocr_misses'] += 1
+                return None
+            self._touch(match)
+            self._insert(digest, phash, image.size, row[0], self.encode_pixels(pixels), row[1], row[2])
+            self._stats['ocr_hits'] += 1
+            self._stats['similar_hits'] += 1
+            return row[0]
+
+    def set_ocr(self, digest:str, phash:bytes, image, ocr_text:str):
+        # 只有啟用近似比對時才保存像素，供之後確認候選
+        pixels = self.encode_pixels(self.get_pixels(image)) if self.max_distance is not None else None
+        with self._lock:
+            self._insert(digest, phash, image.size, ocr_text, pixels, None, None)
+
+    def get_formatted(self, digest:str, format_key:str):
+        with self._lock:
+            row = self._connection.execute('SELECT formatted_text, format_key FROM ocr_cache WHERE digest = ?', (digest,)).fetchone()
+            if row is None or row[0] is None or row[1] != format_key:
+                self._stats['formatted_misses'] += 1
+                return None
+            self._stats['formatted_hits'] += 1
+            return row[0]
+
+    def set_formatted(self, digest:str, format_key:str, formatted_text:str):
+        with self._lock:
+            self._connection.execute('UPDATE ocr_cache SET formatted_text = ?, format_key = ? WHERE digest = ?', (formatted_text, format_key, digest))
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('DELETE FROM ocr_cache')
+            self._connection.commit()
+            self._hashes.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            entries = self._connection.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+            stats = dict(self._stats, entries=entries)
+        stats['ocr_calls_avoided'] = stats['ocr_hits']
+        stats['llm_calls_avoided'] = stats['formatted_hits']
+        return stats
+
+    def _find_similar(self, phash:bytes, size:tuple[int, int]) -> list[str]:
+        """Digests of the cached images of the same size within `max_distance`, nearest first."""
+        group = self._hashes.get(tuple(size))
+        if not group:
+            return []
+
+        digests = list(group)
+        hashes = np.frombuffer(b''.join(group.values()), dtype=np.uint8).reshape(len(digests), -1)
+        distances = np.unpackbits(hashes ^ np.frombuffer(phash, dtype=np.uint8), axis=1).sum(axis=1)
+        return [digests[i] for i in np.argsort(distances, kind='stable') if distances[i] <= self.max_distance]
+
+    @staticmethod
+    def get_pixels(image) -> np.ndarray:
+        return np.asarray(image.convert('L'), dtype=np.uint8)
+
+    @staticmethod
+    def encode_pixels(pixels:np.ndarray) -> bytes:
+        return zlib.compress(pixels.tobytes())
+
+    def _same_pixels(self, encoded:bytes, pixels:np.ndarray) -> bool:
+        """Whether no `block_size` block of the stored pixels differs from `pixels` by more than `max_block_difference` on average."""
+        stored = np.frombuffer(zlib.decompress(encoded), dtype=np.uint8)
+        if stored.size != pixels.size:
+            return False
+        difference = np.abs(stored.reshape(pixels.shape).astype(np.int16) - pixels.astype(np.int16))
+
+        # 邊緣不足一個區塊的部分補零後一併比較
+        block = self.block_size
+        height, width = difference.shape
+        difference = np.pad(difference, ((0, -height % block), (0, -width % block)))
+        blocks = difference.reshape(difference.shape[0] // block, block, difference.shape[1] // block, block)
+        return bool(blocks.mean(axis=(1, 3)).max() <= self.max_block_difference)
+
+    def _insert(self, digest:str, phash:bytes, size:tuple[int, int], ocr_text:str, pixels:bytes, formatted_text:str, format_key:str):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO ocr_cache (digest, phash, width, height, ocr_text, pixels, formatted_text, format_key, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (digest, phash, size[0], size[1], ocr_text, pixels, formatted_text, format_key, time.time())
+        )
+        self._hashes.setdefault(tuple(size), {})[digest] = phash
+        self._evict()
+        self._connection.commit()
+
+    def _touch(self, digest:str):
+        self._connection.execute('UPDATE ocr_cache SET last_access = ? WHERE digest = ?', (time.time(), digest))
+        self._connection.commit()
+
+    def _evict(self):
+        if self.max_entries is None:
+            return
+        entries = self._connection.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+        if entries <= self.max_entries:
+            return
+        evicted = self._connection.execute(
+            'SELECT digest, width, height FROM ocr_cache ORDER BY last_access LIMIT ?', (entries - self.max_entries,)
+        ).fetchall()
+        self._connection.executemany('DELETE FROM ocr_cache WHERE digest = ?', [(digest,) for digest, _, _ in evicted])
+        for digest, width, height in evicted:
+            self._hashes.get((width, height), {}).pop(digest, None)
+
+    def _load_hashes(self):
+        for digest, phash, width, height in self._connection.execute('SELECT digest, phash, width, height FROM ocr_cache'):
+            self._hashes.setdefault((width, height), {})[digest] = phash
@@ -1,18 +1,354 @@
 
 import os
-from models.LangChainModel import LangChainModel
 from models.CorpusManager import CorpusManager
+from models.CorpusManifest import CorpusManifest
+from models.LLMCache import LLMCache
+from models.OCRCache import OCRCache
+from models.TesseractPool import get_shared_tesseract_pool
+from models.Tracer import shared_tracer
+from config.Config import get_config
 
-import pytesseract
 import pymupdf
-from PIL import Image
+from abc import ABC, abstractmethod
 import io
 import re
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from itertools import islice
+
+# pytesseract、PIL 與 pdfplumber 只在需要 OCR 或使用 pdfplumber 後端時才匯入
+
+_shared_lock = threading.Lock()
+_shared_ocr_cache = None
+
+def get_shared_ocr_cache() -> OCRCache:
+    global _shared_ocr_cache
+    with _shared_lock:
+        if _shared_ocr_cache is None:
+            config = get_config()
+            max_distance = config.OCR_CACHE_MAX_DISTANCE if config.OCR_CACHE_MAX_DISTANCE >= 0 else None
+            _shared_ocr_cache = OCRCache(max_distance=max_distance, max_entries=config.OCR_CACHE_MAX_ENTRIES)
+        return _shared_ocr_cache
+
+class PDFExtractionBackend(ABC):
+    """Extracts the text layer and the embedded image xrefs of every page of an opened PDF."""
+    name = None
+
+    @abstractmethod
+    def extract_pages(self, file_name:str, pdf:pymupdf.Document) -> list[tuple[str, list[int]]]:
+        """Returns (text, image_xrefs) for every page, in page order."""
+
+
+class PyMuPDFBackend(PDFExtractionBackend):
+    """Reads text and image xrefs in a single pass over the pages of the already opened pymupdf document."""
+    name = 'pymupdf'
+
+    def extract_pages(self, file_name:str, pdf:pymupdf.Document) -> list[tuple[str, list[int]]]:
+        pages = []
+        for page in pdf:
+            text = page.get_text(sort=True)
+            image_xrefs = [img[0] for img in page.get_images(full=True)]
+            pages.append((text, image_xrefs))
+        return pages
+
+
+class PdfplumberBackend(PDFExtractionBackend):
+    """
+    Reads text with pdfplumber, which is slower but was used to build the existing corpora; it stays the default
+    until the pymupdf text has been compared against it on the corpus with benchmarks/pdf_backend_benchmark.py.
+    """
+    name = 'pdfplumber'
+
+    def extract_pages(self, file_name:str, pdf:pymupdf.Document) -> list[tuple[str, list[int]]]:
+        page_texts = _extract_text_from_pdf(file_name)
+        return [
+            (page_texts[page_number], [img[0] for img in pdf.load_page(page_number).get_images(full=True)])
+            for page_number in range(pdf.page_count)
+        ]
+
+
+PDF_EXTRACTION_BACKENDS = {backend.name: backend for backend in (PyMuPDFBackend, PdfplumberBackend)}
+
+def get_extraction_backend(name:str) -> PDFExtractionBackend:
+    if name not in PDF_EXTRACTION_BACKENDS:
+        raise ValueError(f"Unknown PDF extraction backend '{name}', expected one of {list(PDF_EXTRACTION_BACKENDS)}.")
+    return PDF_EXTRACTION_BACKENDS[name]()
+
+def iter_raw_pdf_content(file_names:list[str], min_width:int=500, min_height:int=500, workers:int=1, backend:str='pdfplumber', ocr_cache=None, ocr_dpi:int=300, adaptive_ocr:bool=True, ocr_report=None):
+    """
+    Runs the CPU-bound part of ingestion for every PDF, yielding (file_name, raw_pages) in input order.
+
+    With more than one worker the text extraction is fanned out to a `ProcessPoolExecutor`; the pool keeps
+    extracting the next files while the caller consumes the current one, so the I/O-bound LLM stage overlaps with
+    extraction. At most `2 * workers` files are submitted ahead of the one being consumed, so extracted pages do
+    not pile up in memory when extraction outpaces the LLM stage. OCR runs in this process on the shared `TesseractPool`, so every file shares the same
+    `ocr_cache` and `ocr_report`.
+    """
+    if workers is None or workers <= 1:
+        for file_name in file_names:
+            yield file_name, ocr_pdf_pages(extract_pdf_pages(file_name, min_width, min_height, backend, ocr_dpi, adaptive_ocr), ocr_cache, ocr_report)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 只保留有限個提交中的檔案，每取走一個結果再補提交下一個
+        pending = deque()
+        remaining_files = iter(file_names)
+        for file_name in islice(remaining_files, 2 * workers):
+            pending.append((file_name, executor.submit(extract_pdf_pages, file_name, min_width, min_height, backend, ocr_dpi, adaptive_ocr)))
+        while pending:
+            file_name, future = pending.popleft()
+            pages = future.result()
+            for next_file_name in islice(remaining_files, 1):
+                pending.append((next_file_name, executor.submit(extract_pdf_pages, next_file_name, min_width, min_height, backend, ocr_dpi, adaptive_ocr)))
+            yield file_name, ocr_pdf_pages(pages, ocr_cache, ocr_report)
+
+def extract_raw_pdf_content(file_name:str, min_width:int=500, min_height:int=500, backend:str='pdfplumber', ocr_dpi:int=300, adaptive_ocr:bool=True) -> list[dict]:
+    """
+    Extracts the text layer and the raw Tesseract OCR text of every page of a PDF.
+
+    This is the CPU-bound stage of ingestion and has no LLM dependency, so it can run in a worker process.
+
+    Args:
+        file_name (str): Path of the PDF file.
+        min_width (int): Minimum image width for OCR.
+        min_height (int): Minimum image height for OCR.
+        backend (str): Name of the text extraction backend, 'pymupdf' or 'pdfplumber'.
+        ocr_dpi (int): Resolution at which image regions are rendered for OCR, or None to OCR the embedded images.
+        adaptive_ocr (bool): Whether to skip image regions that the text layer already covers.
+
+    Returns:
+        list[dict]: One dict per page with the cleaned page `text`, the list of raw `ocr_texts` of its images and
+            the `ocr_keys` of those images.
+    """
+    return ocr_pdf_pages(extract_pdf_pages(file_name, min_width, min_height, backend, ocr_dpi, adaptive_ocr))
+
+@shared_tracer.traced('pdf.extract')
+def extract_pdf_pages(file_name:str, min_width:int=500, min_height:int=500, backend:str='pdfplumber', ocr_dpi:int=300, adaptive_ocr:bool=True) -> list[dict]:
+    """
+    Extracts the text layer of every page of a PDF and decides, per image placed on the page, whether it needs OCR.
+
+    With `adaptive_ocr`, an image is skipped when it covers a negligible part of the page (logos, icons) or when
+    the text layer inside its region is already dense (digitally generated pages, scans with a text layer);
+    otherwise only its region of the page is rendered at `ocr_dpi` for OCR.
+
+    Returns:
+        list[dict]: One dict per page with the cleaned page `text`, its OCR `images`, one per placement, each a dict
+            with the `digest` of the pixels to OCR and its `png` bytes, and the number of `skipped_images`.
+    """
+    extraction_backend = get_extraction_backend(backend)
+    pages = []
+    with pymupdf.open(file_name) as pdf:
+        for page_number, (page_text, image_xrefs) in enumerate(extraction_backend.extract_pages(file_name, pdf)):
+            images, skipped_images = _extract_ocr_images(pdf, page_number, image_xrefs, min_width, min_height, ocr_dpi, adaptive_ocr)
+            pages.append({
+                'text': _remove_page_whitespace(page_text),
+                'images': images,
+                'skipped_images': skipped_images,
+            })
+    return pages
+
+@shared_tracer.traced('pdf.ocr')
+def ocr_pdf_pages(pages:list[dict], ocr_cache=None, ocr_report=None) -> list[dict]:
+    """
+    Runs Tesseract on the images of pages from `extract_pdf_pages`, returning the pages with their `ocr_texts`
+    and, in `ocr_keys`, the digest of the image each text comes from.
+
+    Every distinct image is recognized once, in parallel on the shared `TesseractPool`; with an `OCRCache`, images
+    already recognized in another file or an earlier run are not recognized again.
+    """
+    # 像素相同的圖片只辨識一次，但每個位置仍各自對應一段文字
+    images = {}
+    for page_number, page in enumerate(pages):
+        for image in page['images']:
+            images.setdefault(image['digest'], (image['png'], page_number))
+
+    def recognize(digest):
+        png, page_number = images[digest]
+        if ocr_cache is not None:
+            return _ocr_cached_image(digest, png, page_number, ocr_cache, ocr_report)
+        return _ocr_image(png, page_number, ocr_report)
+
+    if len(images) > 1:
+        ocr_texts = dict(zip(images, get_shared_tesseract_pool().map(recognize, images)))
+    else:
+        ocr_texts = {digest: recognize(digest) for digest in images}
+
+    raw_pages = []
+    for page in pages:
+        # 少於 30 字的 OCR 結果多為圖示或雜訊，不送交 LLM
+        digests = [image['digest'] for image in page['images'] if ocr_texts[image['digest']] and len(ocr_texts[image['digest']]) >= 30]
+        raw_pages.append({'text': page['text'], 'ocr_texts': [ocr_texts[digest] for digest in digests], 'ocr_keys': digests})
+    if ocr_report is not None:
+        ocr_report.add_pages(pages)
+    return raw_pages
+
+def _extract_text_from_pdf(file_name:str) -> list[str]:
+    import pdfplumber  # 用於從PDF文件中提取文字的工具
+
+    page_texts = []
+    with pdfplumber.open(file_name) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text()
+            page_texts.append(text or "")
+    return page_texts
+
+def _remove_page_whitespace(page_text) -> str:
+    page_text = re.sub(r'[\n\r\t]+', ', ', page_text)
+    page_text = re.sub(r'\s{2,}', ' ', page_text)
+    return page_text
+
+# 圖片佔頁面面積的比例低於此值時視為標誌或圖示，不進行 OCR
+MIN_OCR_IMAGE_COVERAGE = 0.02
+# 圖片區域內文字層每平方英吋的字數達此值時，視為文字層已涵蓋該區域
+MIN_TEXT_LAYER_DENSITY = 10
+
+def _extract_ocr_images(pdf:pymupdf.Document, page_number:int, image_xrefs:list[int], min_width:int, min_height:int, ocr_dpi:int=300, adaptive_ocr:bool=True) -> tuple[list[dict], int]:
+    """
+    Extracts the images found on the page by the extraction backend that meet the minimum width and height and
+    need OCR, encoded as PNG so they can be passed to another process or thread, together with a digest that
+    identifies the same pixels across files: the digest of the rendered PNG for a region rendered at `ocr_dpi`,
+    otherwise the digest of the raw xref stream. Every placement of an image is returned.
+
+    Returns:
+        tuple[list[dict], int]: The images to OCR and the number of image placements skipped by `adaptive_ocr`.
+    """
+    page = pdf.load_page(page_number)
+    images = []
+    skipped_images = 0
+    # 同一張圖片放在多個位置時會依名稱重複列出，而 get_image_rects 已回傳所有位置，每個 xref 只展開一次
+    rendered_xrefs = set()
+    for xref in image_xrefs:
+        if xref in rendered_xrefs:
+            continue
+        try:
+            width, height = _get_image_size(pdf, xref)
+            if width <= min_width or height <= min_height:
+                continue
+            digest = OCRCache.make_digest(pdf.xref_stream_raw(xref) or str(xref).encode())
+
+            # 圖片在頁面上的位置；找不到時（例如位於 Form XObject 內）直接使用圖片本身的像素
+            rects = [rect & page.rect for rect in page.get_image_rects(xref)] if ocr_dpi or adaptive_ocr else []
+            rects = [rect for rect in rects if not rect.is_empty]
+            if not rects:
+                images.append({'digest': digest, 'png': _get_image_png(pdf, xref)})
+                continue
+
+            rendered_xrefs.add(xref)
+            for rect in rects:
+                if adaptive_ocr and not _needs_ocr(page, rect):
+                    skipped_images += 1
+                    continue
+                if not ocr_dpi:
+                    images.append({'digest': digest, 'png': _get_image_png(pdf, xref)})
+                    continue
+                # 渲染的區域包含裁切與疊在圖片上的內容，以渲染結果本身的雜湊作為快取鍵
+                png = page.get_pixmap(clip=rect, dpi=ocr_dpi).tobytes("png")
+                images.append({'digest': OCRCache.make_digest(png), 'png': png})
+        except Exception as e:
+            print(f"Error processing image on page {page_number+1}: {e}")
+            continue
+    return images, skipped_images
+
+def _get_image_size(pdf:pymupdf.Document, xref:int) -> tuple[int, int]:
+    # 由影像字典讀取尺寸，不需解碼整張圖片
+    width, height = pdf.xref_get_key(xref, 'Width'), pdf.xref_get_key(xref, 'Height')
+    if width[0] == 'int' and height[0] == 'int':
+        return int(width[1]), int(height[1])
+    pix = pymupdf.Pixmap(pdf, xref)
+    return pix.width, pix.height
+
+def _get_image_png(pdf:pymupdf.Document, xref:int) -> bytes:
+    pix = pymupdf.Pixmap(pdf, xref)
+    if pix.n > 3:
+        pix = pymupdf.Pixmap(pymupdf.csRGB, pix)
+    return pix.tobytes("png")
+
+def _needs_ocr(page:pymupdf.Page, rect:pymupdf.Rect) -> bool:
+    """Whether an image region is large enough to carry content and is not already covered by the text layer."""
+    if abs(rect) < MIN_OCR_IMAGE_COVERAGE * abs(page.rect):
+        return False
+    text_chars = len(''.join(page.get_text(clip=rect).split()))
+    return text_chars / (abs(rect) / 72 ** 2) < MIN_TEXT_LAYER_DENSITY
+
+@shared_tracer.traced('ocr.tesseract')
+def _ocr_image(image, page_number:int, ocr_report=None):
+    """Returns the raw Tesseract text of a PNG image (bytes or an opened PIL image), or None when OCR fails."""
+    from PIL import Image
+    start_time = time.perf_counter()
+    try:
+        if isinstance(image, bytes):
+            image = Image.open(io.BytesIO(image))
+        ocr_text = get_shared_tesseract_pool().image_to_string(image)
+    except Exception as e:
+        print(f"Error processing image on page {page_number+1}: {e}")
+        return None
+    if ocr_report is not None:
+        ocr_report.add_ocr(time.perf_counter() - start_time)
+    return ocr_text
+
+
+class OCRReport:
+    """Counts the per-page OCR decisions and the Tesseract time of a run, across files and threads."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'pages': 0, 'pages_ocr': 0, 'pages_skipped': 0, 'pages_without_images': 0, 'images_ocr': 0, 'images_skipped': 0, 'tesseract_calls': 0, 'tesseract_seconds': 0.0}
+
+    def add_pages(self, pages:list[dict]):
+        with self._lock:
+            for page in pages:
+                self._stats['pages'] += 1
+                self._stats['images_ocr'] += len(page['images'])
+                self._stats['images_skipped'] += page.get('skipped_images', 0)
+                if page['images']:
+                    self._stats['pages_ocr'] += 1
+                elif page.get('skipped_images'):
+                    self._stats['pages_skipped'] += 1
+                else:
+                    self._stats['pages_without_images'] += 1
+
+    def add_ocr(self, seconds:float):
+        with self._lock:
+            self._stats['tesseract_calls'] += 1
+            self._stats['tesseract_seconds'] += seconds
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        # 以本次每張圖片的平均 OCR 時間估計略過的圖片省下的時間
+        mean_seconds = stats['tesseract_seconds'] / stats['tesseract_calls'] if stats['tesseract_calls'] else None
+        stats['estimated_seconds_saved'] = stats['images_skipped'] * mean_seconds if mean_seconds is not None else None
+        return stats
+
+    def format(self) -> str:
+        stats = self.get_stats()
+        saved = f"{stats['estimated_seconds_saved']:.1f}s" if stats['estimated_seconds_saved'] is not None else 'n/a'
+        return (f"OCR: {stats['pages_ocr']}/{stats['pages']} pages OCR'd, {stats['pages_skipped']} skipped (text layer sufficient or decorative images only), "
+                f"{stats['pages_without_images']} without images; {stats['images_ocr']} images OCR'd, {stats['images_skipped']} skipped, "
+                f"{stats['tesseract_calls']} Tesseract calls in {stats['tesseract_seconds']:.1f}s, estimated {saved} saved.")
+
+def _ocr_cached_image(digest:str, png:bytes, page_number:int, ocr_cache:OCRCache, ocr_report=None):
+    cached = ocr_cache.get(digest)
+    if cached is not None:
+        return cached
+
+    from PIL import Image
+    image = Image.open(io.BytesIO(png))
+    phash = OCRCache.perceptual_hash(image)
+    cached = ocr_cache.get_similar(digest, phash, image)
+    if cached is not None:
+        return cached
+
+    ocr_text = _ocr_image(image, page_number, ocr_report)
+    # OCR 失敗時不寫入快取，下次重新辨識
+    if ocr_text is not None:
+        ocr_cache.set_ocr(digest, phash, image, ocr_text)
+    return ocr_text
 
-import pdfplumber  # 用於從PDF文件中提取文字的工具
 
 class PDFTextImageExtractor:
-    def __init__(self, category:str, source_path:str, min_width:int=500, min_height:int=500, file_counter_for_save = 100):
+    def __init__(self, category:str, source_path:str, min_width:int=500, min_height:int=500, file_counter_for_save = 100, workers:int=1, backend:str='pdfplumber', use_ocr_cache:bool=None, ocr_dpi:int=300, adaptive_ocr:bool=True):
         self.category = category
         
         self.category_source_path = os.path.join(source_path, category)
@@ -22,16 +358,57 @@ class PDFTextImageExtractor:
         self.min_width = min_width
         self.min_height = min_height
         self.file_counter_for_save = file_counter_for_save
-        self.llm_model = LangChainModel()
+        # 文字擷取與 OCR 的平行程序數，1 表示在目前程序中依序處理
+        self.workers = workers
+        # 文字擷取後端，pymupdf 只需開啟一次檔案，pdfplumber 保留作為備用
+        self.backend = backend
+        self._llm_model = None
+        # 重複出現的圖片（信頭、標誌、制式表格）沿用快取的 OCR 與格式化結果，設定 OCR_CACHE_ENABLED=0 可略過
+        self.use_ocr_cache = get_config().OCR_CACHE_ENABLED if use_ocr_cache is None else use_ocr_cache
+        self._ocr_cache = None
+        # 只對文字層未涵蓋的圖片區域以 ocr_dpi 渲染後 OCR，ocr_dpi 為 None 時使用圖片本身的像素
+        self.ocr_dpi = ocr_dpi
+        self.adaptive_ocr = adaptive_ocr
+        self.ocr_report = OCRReport()
         self.corpusmanager = CorpusManager(self.category)
+        self.manifest = CorpusManifest(self.category)
+        self.delta = {'updated': [], 'deleted': []}
+        self._delta_files = {'updated': [], 'deleted': []}
+        self.deleted_files = []
+
+    @property
+    def ocr_cache(self):
+        if self._ocr_cache is None and self.use_ocr_cache:
+            self._ocr_cache = get_shared_ocr_cache()
+        return self._ocr_cache
+
+    def report_ocr(self):
+        print(self.ocr_report.format())
+        stats = self.get_ocr_cache_stats()
+        if stats:
+            print(f"OCR cache: {stats['ocr_calls_avoided']} OCR calls avoided ({stats['similar_hits']} near-duplicate images), "
+                  f"{stats['llm_calls_avoided']} LLM formatting calls avoided, {stats['entries']} cached images.")
+
+    @property
+    def llm_model(self):
+        # 共用同一個 LangChainModel（速率限制、快取與連線池），第一次格式化 OCR 文字時才建立
+        if self._llm_model is None:
+            from models.LangChainModel import get_shared_langchain_model
+            self._llm_model = get_shared_langchain_model()
+        return self._llm_model
 
+    @shared_tracer.traced('pdf.ingest')
     def create_and_save_pdf_content(self) -> dict:
         """
         Extracts content from PDF files in the specified source path and saves the processed data.
 
-        This method iterates over all PDF files in the source directory, extracts text and images from each page, 
-        and performs OCR on images meeting the size criteria. It formats and concatenates the extracted text and 
-        OCR results, stores the combined output into a corpus dictionary, and saves the data using the CorpusManager.
+        This method compares the PDF files in the source directory with the category's CorpusManifest and only
+        processes files that were added, changed, or left unfinished by an interrupted build; documents of deleted
+        files are dropped from the corpus. For each processed file it extracts text and images from each page and
+        performs OCR on images meeting the size criteria. Text extraction and OCR run in `workers` processes,
+        while the LLM formatting of the OCR results runs concurrently in this process. The formatted output is
+        merged into the corpus in file name order and checkpointed every `file_counter_for_save` files, together
+        with the manifest. The changed and deleted sources are kept in `self.delta` for the downstream stages.
 
         Returns:
             dict: A dictionary where each key is the filename (without extension) and the value is the combined 
@@ -40,112 +417,174 @@ class PDFTextImageExtractor:
         Raises:
             Exception: If any issues occur while processing images or extracting content from PDFs.
         """
-        formatted_data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'formatted_data')
-        os.makedirs(formatted_data_path, exist_ok=True)
-
-        if not os.path.exists(f"{formatted_data_path}/{self.category}_all_text.json"):
-            file_ls = self._get_pdf_file_names()
-            corpus_dict = {}
-            file_counter = 0
-            for file in file_ls:
-                file_name = os.path.join(self.category_source_path, file)
-                page_texts = self._extract_text_from_pdf(file_name)
-
-                with pymupdf.open(file_name) as pdf:
-                    for page_number in range(pdf.page_count):
-                        page_texts[page_number] = self._remove_page_whitespace(page_texts[page_number])
-                        gpt_img_text = self._extract_images_and_ocr(pdf, page_number)
-                        page_texts[page_number] += gpt_img_text
-                
-                corpus_dict[file.replace('.pdf', '')] = "\n---\n".join(page_texts)
-            
-                file_counter += 1
-                if file_counter % self.file_counter_for_save == 0:
-                    self.corpusmanager.save_corpus(corpus_dict)
-            
-            self.corpusmanager.save_corpus(corpus_dict)
-
-            # print(f'The {self.category} PDF data has been extracted and returned as a dictionary, and saved to data/formatted_data/.') 
-            
-            return  corpus_dict
+        files_to_process, stored_files, deleted_sources = self.prepare_delta()
+
+        file_names = [os.path.join(self.category_source_path, file) for file in files_to_process]
+        corpus_dict = {}
+        processed_files = []
+        unsaved_files = []
+        raw_contents = iter_raw_pdf_content(file_names, self.min_width, self.min_height, self.workers, self.backend, self.ocr_cache, self.ocr_dpi, self.adaptive_ocr, self.ocr_report)
+        for file, (_, raw_pages) in zip(files_to_process, raw_contents):
+            try:
+                page_texts = self.format_raw_pages(raw_pages)
+            except RuntimeError as e:
+                # 格式化失敗的檔案不寫入語料，維持待處理，下次執行重試
+                print(f"Warning: {e} {file} will be retried on the next run.")
+                continue
+            corpus_dict[self.get_source(file)] = "\n---\n".join(page_texts)
+            processed_files.append(file)
+        
+            unsaved_files.append(file)
+            if len(unsaved_files) >= self.file_counter_for_save:
+                self._save_checkpoint(corpus_dict, unsaved_files)
+                unsaved_files = []
+        
+        self._save_checkpoint(corpus_dict, unsaved_files)
+        self.corpusmanager.export_json()
+        # 上次中斷時已寫入語料、尚未建立索引的檔案也交給後續步驟；索引更新後由 commit_delta 標記完成
+        self.delta = {'updated': [self.get_source(file) for file in stored_files] + list(corpus_dict.keys()), 'deleted': deleted_sources}
+        self._delta_files = {'updated': stored_files + processed_files, 'deleted': self.deleted_files}
+        self.report_ocr()
+
+        # print(f'The {self.category} PDF data has been extracted and returned as a dictionary, and saved to data/formatted_data/.') 
         
-        else:
-            # print(f'The {self.category} PDF context dictionary already exists and has been returned from data/formatted_data/ as a dictionary.')
-            corpus_dict = self.corpusmanager.load_corpus()
-            
-            return  corpus_dict
+        return self.corpusmanager.load_corpus()
+
+    def prepare_delta(self) -> tuple[list[str], list[str], list[str]]:
+        """
+        Compares the source directory with the manifest and drops the documents of deleted files from the corpus.
+
+        Returns the files to (re)process, the files an interrupted build already stored in the corpus but did not
+        index, and the deleted sources. The deleted files are kept in `deleted_files`; they stay in the manifest
+        until `mark_deleted`, so a build interrupted before the index update removes their documents from the index
+        on the next run.
+        """
+        file_ls = self._get_pdf_file_names()
+        if not self.corpusmanager.exists():
+            # 語料不存在時 manifest 已失效，所有檔案都需重新處理
+            self.manifest.entries.clear()
+        elif not self.manifest.exists():
+            corpus_sources = set(self.corpusmanager.get_sources())
+            self.manifest.adopt(self.category_source_path, file_ls, {file: [self.get_source(file)] for file in file_ls if self.get_source(file) in corpus_sources})
+
+        delta = self.manifest.get_delta(self.category_source_path, file_ls)
+
+        deleted_sources = [source for sources in delta['deleted'].values() for source in sources]
+        self.corpusmanager.delete_documents(deleted_sources)
+        self.deleted_files = list(delta['deleted'])
+        self.manifest.save()
+        return delta['to_process'], delta['stored'], deleted_sources
+
+    @staticmethod
+    def get_source(file:str) -> str:
+        return file.replace('.pdf', '')
+
+    def store_document(self, file:str, page_texts:list[str]) -> str:
+        """Appends the formatted pages of one file to the corpus; the file is only marked done by `mark_done`."""
+        source = self.get_source(file)
+        self.corpusmanager.save_corpus({source: "\n---\n".join(page_texts)})
+        return source
+
+    def mark_stored(self, files:list[str]):
+        for file in files:
+            self.manifest.mark_stored(file, [self.get_source(file)])
+        self.manifest.save()
+
+    def mark_done(self, files:list[str]):
+        """Marks files done once their documents are searchable in the index."""
+        for file in files:
+            self.manifest.mark_done(file, [self.get_source(file)])
+        self.manifest.save()
+
+    def mark_deleted(self, files:list[str]):
+        """Forgets deleted files once their documents are removed from the index."""
+        for file in files:
+            self.manifest.remove(file)
+        self.manifest.save()
+
+    def commit_delta(self, failed_sources:list[str]=None):
+        """
+        Marks the files of `self.delta` done and forgets the deleted ones, after the index was updated with it.
+        Files of `failed_sources`, whose summaries failed, stay stored and are indexed again on the next run.
+        """
+        failed_sources = set(failed_sources or [])
+        self.mark_done([file for file in self._delta_files['updated'] if self.get_source(file) not in failed_sources])
+        self.mark_deleted(self._delta_files['deleted'])
+
+    def _save_checkpoint(self, corpus_dict:dict, files:list[str]):
+        # 只追加上次存檔後處理的檔案；中斷後已寫入語料的檔案不需重新擷取，但仍會交給摘要與索引
+        self.corpusmanager.save_corpus({self.get_source(file): corpus_dict[self.get_source(file)] for file in files})
+        self.mark_stored(files)
 
     
     def _get_pdf_file_names(self) -> list[str]:
-        return [f for f in os.listdir(self.category_source_path) if f.endswith('.pdf')]
+        # 排序確保每次合併語料的順序一致
+        return sorted(f for f in os.listdir(self.category_source_path) if f.endswith('.pdf'))
+
+    @shared_tracer.traced('pdf.format')
+    def format_raw_pages(self, raw_pages:list[dict]) -> list[str]:
+        """
+        Appends the LLM-formatted OCR text of each page to its text layer, formatting all OCR texts of the file
+        concurrently. Images whose formatted text is in the OCR cache, or repeated within the file, are not sent
+        to the LLM again. Raises RuntimeError when the LLM fails on any OCR text of the file.
+        """
+        from models.LangChainModel import FAILED_RESPONSE
+        ocr_items = [item for raw_page in raw_pages for item in zip(raw_page['ocr_keys'], raw_page['ocr_texts'])]
+        formatted_texts = self._format_ocr_items(ocr_items)
+        if FAILED_RESPONSE in formatted_texts:
+            # 失敗訊息不可寫入語料，整個檔案留待重試
+            raise RuntimeError("Formatting the OCR text failed.")
+        formatted_texts = iter(formatted_texts)
 
-    def _extract_text_from_pdf(self, file_name:str) -> list[str]:
         page_texts = []
-        with pdfplumber.open(file_name) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                page_texts.append(text or "")
+        for raw_page in raw_pages:
+            gpt_img_text = ''.join(next(formatted_texts) for _ in raw_page['ocr_texts'])
+            page_texts.append(raw_page['text'] + gpt_img_text)
         return page_texts
     
-    def _remove_page_whitespace(self, page_text) -> str:
-        page_text = re.sub(r'[\n\r\t]+', ', ', page_text)
-        page_text = re.sub(r'\s{2,}', ' ', page_text)
-        return page_text
-    
-    def _extract_images_and_ocr(self, pdf:pymupdf.Document, page_number:int) -> str:
-        """
-        Extracts images from a specific page of a PDF and performs OCR on images that meet the size criteria.
+    def _format_ocr_items(self, ocr_items:list[tuple[str, str]]) -> list[str]:
+        """Formats (image digest, OCR text) pairs, reusing cached formatted texts and formatting each image once."""
+        if self.ocr_cache is None:
+            return self._ocr_to_formatted_texts([ocr_text for _, ocr_text in ocr_items])
 
-        This method loads the specified page, identifies all embedded images, and extracts each image for OCR 
-        processing if it meets the minimum width and height requirements. The extracted text from the OCR 
-        process is formatted and appended to the result.
+        # 格式化結果依 prompt 與模型區分，更換其一後不沿用舊的結果
+        format_key = LLMCache.make_key(self.llm_model.get_ocr_prompt(), self.llm_model.model_identity, {})
+        formatted_by_key = {}
+        missing = {}
+        for key, ocr_text in ocr_items:
+            if key in formatted_by_key or key in missing:
+                continue
+            formatted_text = self.ocr_cache.get_formatted(key, format_key)
+            if formatted_text is None:
+                missing[key] = ocr_text
+            else:
+                formatted_by_key[key] = formatted_text
 
-        Args:
-            pdf (pymupdf.Document): The PDF document object being processed.
-            page_number (int): The page number from which to extract images.
+        from models.LangChainModel import FAILED_RESPONSE
+        for key, formatted_text in zip(missing, self._ocr_to_formatted_texts(list(missing.values()))):
+            formatted_by_key[key] = formatted_text
+            # 只快取成功的格式化結果
+            if formatted_text != FAILED_RESPONSE:
+                self.ocr_cache.set_formatted(key, format_key, formatted_text)
+        return [formatted_by_key[key] for key, _ in ocr_items]
 
-        Returns:
-            str: A string containing the formatted OCR text extracted from all processed images on the page.
-        
-        Raises:
-            Exception: Catches and logs errors encountered during image processing and OCR extraction.
-        """
-        page = pdf.load_page(page_number)
-        img_list = page.get_images(full=True)
-        gpt_img_text = ''
-
-        for img in img_list:
-            xref = img[0]
-            pix = pymupdf.Pixmap(pdf, xref)
-            if pix.width > self.min_width and pix.height > self.min_height: 
-                try:
-                    if pix.n > 3: 
-                        pix = pymupdf.Pixmap(pymupdf.csRGB, pix)
-                    img = Image.open(io.BytesIO(pix.tobytes("png")))
-                    img_ocr_text = pytesseract.image_to_string(img, lang="eng+chi_tra")
-
-                    if len(img_ocr_text) >= 30:
-                        formatted_text = self._ocr_to_formatted_text(img_ocr_text)
-                        gpt_img_text += formatted_text
-                except Exception as e:
-                    print(f"Error processing image on page {page_number+1}: {e}")
-                    continue
-        return gpt_img_text
-    
-    def _ocr_to_formatted_text(self, img_ocr_text:str) -> str:
+    def get_ocr_cache_stats(self) -> dict:
+        return self.ocr_cache.get_stats() if self.ocr_cache is not None else {}
+
+    def _ocr_to_formatted_texts(self, img_ocr_texts:list[str]) -> list[str]:
         """
-        Formats the OCR-extracted text using a language model for improved readability and structure.
+        Formats the OCR-extracted texts using a language model for improved readability and structure.
 
-        This method takes raw OCR text from an image, processes it through a language model to enhance 
-        clarity, and returns the formatted result.
+        This method takes raw OCR texts from images, processes them through a language model concurrently to
+        enhance clarity, and returns the formatted results in input order.
 
         Args:
-            img_ocr_text (str): The raw text extracted from an image via OCR.
+            img_ocr_texts (list[str]): The raw texts extracted from images via OCR.
 
         Returns:
-            str: A string containing the formatted and structured text output from the language model.
+            list[str]: The formatted and structured text output from the language model for each input.
         """
-        return self.llm_model.get_formatted_text_from_ocr(img_ocr_text)
+        return self.llm_model.get_formatted_texts_from_ocr(img_ocr_texts)
     
 
 
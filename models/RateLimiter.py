@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe requests-per-minute and tokens-per-minute limiter.
+
+    Both limits are token buckets that hold at most one minute of budget and refill continuously. `acquire`
+    blocks the calling thread until both buckets can cover the request; a limit set to None is not enforced.
+    """
+    def __init__(self, requests_per_minute:int=None, tokens_per_minute:int=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+        self._available_requests = float(requests_per_minute or 0)
+        self._available_tokens = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens:int=0):
+        if self.requests_per_minute is None and self.tokens_per_minute is None:
+            return
+
+        if self.tokens_per_minute is not None:
+            # 單一請求超過每分鐘上限時，最多等待一整分鐘的額度
+            tokens = min(tokens, self.tokens_per_minute)
+
+        while True:
+            with self._lock:
+                self._refill()
+                wait_seconds = max(
+                    self._get_wait_seconds(self._available_requests, 1, self.requests_per_minute),
+                    self._get_wait_seconds(self._available_tokens, tokens, self.tokens_per_minute)
+                )
+                if wait_seconds <= 0:
+                    if self.requests_per_minute is not None:
+                        self._available_requests -= 1
+                    if self.tokens_per_minute is not None:
+                        self._available_tokens -= tokens
+                    return
+            time.sleep(wait_seconds)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+
+        if self.requests_per_minute is not None:
+            self._available_requests = min(self.requests_per_minute, self._available_requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute is not None:
+            self._available_tokens = min(self.tokens_per_minute, self._available_tokens + elapsed * self.tokens_per_minute / 60)
+
+    @staticmethod
+    def _get_wait_seconds(available:float, required:float, per_minute:int) -> float:
+        if per_minute is None or available >= required:
+            return 0
+        return (required - available) * 60 / per_minute
@@ -0,0 +1,200 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+import faiss
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Persistent cache of answers keyed by question meaning rather than exact text.
+
+    Answered questions are embedded and kept in one inner-product FAISS index per category (over normalized
+    vectors, so scores are cosine similarities). A new question reuses a cached answer when a previous question
+    of the same category and the same candidate sources has a similarity of at least `threshold` and retrieval
+    returned the same sources for it, so an answer is never reused for different documents. Callers also pass a
+    `version` identifying the model and the retrieved text; an entry of another version is a miss, so answers of
+    another model, or of documents changed since, are not reused.
+
+    Entries older than `ttl_seconds` are dropped, and each category keeps at most `max_entries` entries, evicting
+    the least recently used. Entries and their vectors are stored in SQLite and reloaded on start.
+    """
+    def __init__(self, embedding_model, file_name:str=None, threshold:float=0.95, ttl_seconds:float=7 * 24 * 3600, max_entries:int=10000):
+        if file_name is None:
+            file_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'cache', 'answer_cache.sqlite')
+        # ':memory:' 為不落地的 SQLite 資料庫
+        if file_name != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+
+        self.embedding_model = embedding_model
+        self.file_name = file_name
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_name, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS answer_cache ('
+            'id INTEGER PRIMARY KEY, category TEXT NOT NULL, candidates TEXT NOT NULL, question TEXT NOT NULL, '
+            'vector BLOB NOT NULL, sources TEXT NOT NULL, response TEXT NOT NULL, seconds REAL NOT NULL, '
+            'created_at REAL NOT NULL, last_access REAL NOT NULL)'
+        )
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(answer_cache)')]
+        if 'version' not in columns:
+            # 舊版快取沒有版本，這些答案不會再命中，之後由 TTL 或 LRU 清除
+            self._connection.execute("ALTER TABLE answer_cache ADD COLUMN version TEXT NOT NULL DEFAULT ''")
+        self._connection.commit()
+
+        # 各類別一個 FAISS 索引，id 即 SQLite 的 id
+        self._indexes = {}
+        self._candidate_ids = {}
+        self._entries = {}
+        self._stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'source_mismatches': 0, 'version_mismatches': 0, 'expired': 0, 'evictions': 0, 'saved_seconds': 0.0, 'lookup_seconds': 0.0}
+        self._load()
+
+    @staticmethod
+    def make_candidates_key(candidate_sources:list=None) -> str:
+        # 未限定候選文件的問題共用同一組
+        if candidate_sources is None:
+            return '*'
+        return json.dumps(sorted(str(source) for source in candidate_sources))
+
+    def get(self, question:str, category:str, candidate_sources:list, retrieved_sources:list, version:str=''):
+        """Returns the cached answer of a near-duplicate question that retrieved the same sources with the same version, or None."""
+        start_time = time.perf_counter()
+        vector = self._embed(question)
+        with self._lock:
+            try:
+                self._stats['lookups'] += 1
+                matches = self._search(vector, category, self.make_candidates_key(candidate_sources), 1)
+                if not matches:
+                    self._stats['misses'] += 1
+                    return None
+
+                entry_id = matches[0]
+                entry = self._entries[entry_id]
+                if self._is_expired(entry):
+                    self._remove([entry_id])
+                    self._connection.commit()
+                    self._stats['expired'] += 1
+                    self._stats['misses'] += 1
+                    return None
+
+                if entry['sources'] != [str(source) for source in retrieved_sources or []]:
+                    self._stats['source_mismatches'] += 1
+                    self._stats['misses'] += 1
+                    return None
+
+                if entry['version'] != version:
+                    self._stats['version_mismatches'] += 1
+                    self._stats['misses'] += 1
+                    return None
+
+                entry['last_access'] = time.time()
+                self._connection.execute('UPDATE answer_cache SET last_access = ? WHERE id = ?', (entry['last_access'], entry_id))
+                self._connection.commit()
+                self._stats['hits'] += 1
+                self._stats['saved_seconds'] += entry['seconds']
+                return entry['response']
+            finally:
+                self._stats['lookup_seconds'] += time.perf_counter() - start_time
+
+    def set(self, question:str, category:str, candidate_sources:list, retrieved_sources:list, response:str, seconds:float, version:str=''):
+        """Caches an answer together with the sources and version it was generated from and the `seconds` it took."""
+        vector = self._embed(question)
+        candidates_key = self.make_candidates_key(candidate_sources)
+        sources = [str(source) for source in retrieved_sources or []]
+        now = time.time()
+        with self._lock:
+            # 同組候選文件中相近的舊答案由新答案取代
+            self._remove(self._search(vector, category, candidates_key, 10))
+
+            cursor = self._connection.execute(
+                'INSERT INTO answer_cache (category, candidates, question, vector, sources, response, seconds, created_at, last_access, version) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (category, candidates_key, question, vector.tobytes(), json.dumps(sources), response, seconds, now, now, version)
+            )
+            self._add(cursor.lastrowid, category, candidates_key, vector, sources, response, seconds, now, now, version)
+            self._evict(category)
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('DELETE FROM answer_cache')
+            self._connection.commit()
+            self._indexes.clear()
+            self._candidate_ids.clear()
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        stats['hit_rate'] = stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0
+        stats['mean_lookup_ms'] = stats['lookup_seconds'] / stats['lookups'] * 1000 if stats['lookups'] else 0.0
+        return stats
+
+    def _embed(self, question:str) -> np.ndarray:
+        vector = np.asarray([self.embedding_model.embed_query(question)], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector[0]
+
+    def _search(self, vector:np.ndarray, category:str, candidates_key:str, k:int) -> list[int]:
+        """Ids of the entries of the same category and candidates whose similarity reaches the threshold."""
+        ids = self._candidate_ids.get((category, candidates_key))
+        if not ids:
+            return []
+
+        selector = faiss.IDSelectorBatch(np.fromiter(ids, dtype=np.int64))
+        scores, found_ids = self._indexes[category].search(vector.reshape(1, -1), min(k, len(ids)), params=faiss.SearchParameters(sel=selector))
+        return [int(entry_id) for score, entry_id in zip(scores[0], found_ids[0]) if entry_id != -1 and score >= self.threshold]
+
+    def _add(self, entry_id:int, category:str, candidates_key:str, vector:np.ndarray, sources:list, response:str, seconds:float, created_at:float, last_access:float, version:str):
+        if category not in self._indexes:
+            self._indexes[category] = faiss.IndexIDMap(faiss.IndexFlatIP(len(vector)))
+        self._indexes[category].add_with_ids(vector.reshape(1, -1), np.array([entry_id], dtype=np.int64))
+        self._candidate_ids.setdefault((category, candidates_key), set()).add(entry_id)
+        self._entries[entry_id] = {
+            'category': category, 'candidates': candidates_key, 'sources': sources, 'response': response,
+            'seconds': seconds, 'created_at': created_at, 'last_access': last_access, 'version': version,
+        }
+
+    def _remove(self, entry_ids:list[int]):
+        for entry_id in entry_ids:
+            entry = self._entries.pop(entry_id, None)
+            if entry is None:
+                continue
+            self._indexes[entry['category']].remove_ids(np.array([entry_id], dtype=np.int64))
+            self._candidate_ids[(entry['category'], entry['candidates'])].discard(entry_id)
+            self._connection.execute('DELETE FROM answer_cache WHERE id = ?', (entry_id,))
+
+    def _is_expired(self, entry:dict) -> bool:
+        return self.ttl_seconds is not None and time.time() - entry['created_at'] > self.ttl_seconds
+
+    def _evict(self, category:str):
+        expired_ids = [entry_id for entry_id, entry in self._entries.items() if self._is_expired(entry)]
+        self._remove(expired_ids)
+        self._stats['expired'] += len(expired_ids)
+
+        if self.max_entries is None:
+            return
+        category_entries = sorted((entry['last_access'], entry_id) for entry_id, entry in self._entries.items() if entry['category'] == category)
+        overflow = len(category_entries) - self.max_entries
+        if overflow > 0:
+            self._remove([entry_id for _, entry_id in category_entries[:overflow]])
+            self._stats['evictions'] += overflow
+
+    def _load(self):
+        rows = self._connection.execute(
+            'SELECT id, category, candidates, vector, sources, response, seconds, created_at, last_access, version FROM answer_cache'
+        ).fetchall()
+        for entry_id, category, candidates_key, vector, sources, response, seconds, created_at, last_access, version in rows:
+            self._add(entry_id, category, candidates_key, np.frombuffer(vector, dtype=np.float32), json.loads(sources), response, seconds, created_at, last_access, version)
+
+        # 過期的答案在載入時就清除
+        for category in list(self._indexes):
+            self._evict(category)
+        self._connection.commit()
@@ -0,0 +1,42 @@
+import threading
+
+from config.Config import get_config
+
+
+# 嵌入模型與聊天模型在行程內只建立一次，第一次使用時才匯入對應的套件並載入
+_lock = threading.Lock()
+_embedding_models = {}
+_chat_models = {}
+
+
+class ConfigurationError(ValueError):
+    """Raised when a model cannot be created from the configuration, e.g. a missing API key; never retried or swallowed."""
+
+
+def get_embedding_model(model_name:str='moka-ai/m3e-large'):
+    """Returns the process-wide HuggingFaceEmbeddings of the model, loading it on first use."""
+    with _lock:
+        if model_name not in _embedding_models:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            _embedding_models[model_name] = HuggingFaceEmbeddings(model_name=model_name)
+        return _embedding_models[model_name]
+
+
+def check_chat_model_config(config=None):
+    """Raises ConfigurationError when the shared chat model could not be created."""
+    config = config or get_config()
+    if not config.OPENAI_API_KEY:
+        raise ConfigurationError("Missing OPENAI_API_KEY environment variable.")
+
+
+def get_chat_model(model_name:str='gpt-4o-mini'):
+    """Returns the process-wide ChatOpenAI client of the model, created on first use."""
+    with _lock:
+        if model_name not in _chat_models:
+            config = get_config()
+            check_chat_model_config(config)
+
+            from langchain_openai import ChatOpenAI
+            # 重試由 LangChainModel 統一處理，避免與 ChatOpenAI 內建的重試疊加；串流時也回傳 token 用量供追蹤統計
+            _chat_models[model_name] = ChatOpenAI(model=model_name, api_key=config.OPENAI_API_KEY, max_retries=0, stream_usage=True)
+        return _chat_models[model_name]
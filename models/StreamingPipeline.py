@@ -0,0 +1,171 @@
+import queue
+import threading
+import time
+
+
+class PipelineStage:
+    """
+    One stage of a StreamingPipeline.
+
+    `function` receives one item (or, with `batch_size` > 1, a list of up to `batch_size` items that are already
+    waiting) and returns an iterable of output items for the next stage; returning None or an empty list drops
+    the item. The stage runs on `workers` threads and reads from a queue bounded to `queue_size` items, so a slow
+    stage blocks the stages before it instead of letting work pile up in memory.
+    """
+    def __init__(self, name:str, function, workers:int=1, queue_size:int=16, batch_size:int=1):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.batch_size = max(1, batch_size)
+
+
+_END = object()
+
+
+class StreamingPipeline:
+    """
+    Runs items through a chain of stages connected by bounded queues, all stages working at the same time.
+
+    Each stage counts its input and output items, errors, busy time and queue depth; `get_metrics` reports them
+    together with the throughput and worker utilization of each stage. An item whose stage function raises is
+    logged and dropped, the rest of the pipeline keeps running.
+    """
+    def __init__(self, stages:list[PipelineStage], report_interval:float=None):
+        self.stages = stages
+        self.report_interval = report_interval
+
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self._lock = threading.Lock()
+        self._running_workers = [stage.workers for stage in stages]
+        self._metrics = [
+            {'items_in': 0, 'items_out': 0, 'errors': 0, 'busy_seconds': 0.0, 'max_queue_depth': 0, 'first_output_seconds': None}
+            for _ in stages
+        ]
+        self._start_time = None
+        self._end_time = None
+
+    def run(self, items) -> dict:
+        """Feeds `items` into the first stage and blocks until every stage has drained; returns `get_metrics()`."""
+        self._start_time = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._work, args=(position,), name=f'{stage.name}-{worker}', daemon=True)
+            for position, stage in enumerate(self.stages) for worker in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        finished = threading.Event()
+        reporter = None
+        if self.report_interval:
+            reporter = threading.Thread(target=self._report, args=(finished,), name='pipeline-reporter', daemon=True)
+            reporter.start()
+
+        try:
+            for item in items:
+                self._put(0, item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                self._queues[0].put(_END)
+            for thread in threads:
+                thread.join()
+            self._end_time = time.perf_counter()
+            finished.set()
+            if reporter is not None:
+                reporter.join()
+        return self.get_metrics()
+
+    def get_metrics(self) -> dict:
+        end_time = self._end_time or time.perf_counter()
+        elapsed = end_time - self._start_time if self._start_time is not None else 0.0
+
+        stages = {}
+        with self._lock:
+            for stage, stage_queue, metrics in zip(self.stages, self._queues, self._metrics):
+                stages[stage.name] = dict(
+                    metrics,
+                    workers=stage.workers,
+                    queue_depth=stage_queue.qsize(),
+                    items_per_second=metrics['items_in'] / elapsed if elapsed else 0.0,
+                    utilization=metrics['busy_seconds'] / (stage.workers * elapsed) if elapsed else 0.0,
+                )
+        return {'elapsed_seconds': elapsed, 'stages': stages}
+
+    def format_metrics(self) -> str:
+        metrics = self.get_metrics()
+        lines = [f"Pipeline finished in {metrics['elapsed_seconds']:.1f}s"]
+        for pipeline_stage, (name, stage) in zip(self.stages, metrics['stages'].items()):
+            first_output = f"{stage['first_output_seconds']:.1f}s" if stage['first_output_seconds'] is not None else '-'
+            lines.append(
+                f"  {name:<10} in: {stage['items_in']:>6}  out: {stage['items_out']:>6}  errors: {stage['errors']:>4}  "
+                f"{stage['items_per_second']:>8.2f} items/s  utilization: {stage['utilization']:>5.0%}  "
+                f"max queue: {stage['max_queue_depth']:>3}/{pipeline_stage.queue_size}  first output: {first_output}"
+            )
+        return '\n'.join(lines)
+
+    def _put(self, position:int, item):
+        stage_queue = self._queues[position]
+        # 佇列已滿時在此阻塞，形成對上游的背壓
+        stage_queue.put(item)
+        with self._lock:
+            self._metrics[position]['max_queue_depth'] = max(self._metrics[position]['max_queue_depth'], stage_queue.qsize())
+
+    def _work(self, position:int):
+        stage = self.stages[position]
+        stage_queue = self._queues[position]
+        metrics = self._metrics[position]
+        is_last = position == len(self.stages) - 1
+
+        while True:
+            item = stage_queue.get()
+            if item is _END:
+                break
+
+            batch = [item]
+            ended = False
+            while len(batch) < stage.batch_size:
+                # 只合併已在佇列中的項目，不等待
+                try:
+                    item = stage_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _END:
+                    ended = True
+                    break
+                batch.append(item)
+
+            start_time = time.perf_counter()
+            try:
+                outputs = list(stage.function(batch if stage.batch_size > 1 else batch[0]) or [])
+            except Exception as e:
+                print(f"Error in pipeline stage '{stage.name}': {e}")
+                outputs = []
+                with self._lock:
+                    metrics['errors'] += len(batch)
+            busy_seconds = time.perf_counter() - start_time
+
+            with self._lock:
+                metrics['items_in'] += len(batch)
+                metrics['items_out'] += len(outputs)
+                metrics['busy_seconds'] += busy_seconds
+                if outputs and metrics['first_output_seconds'] is None:
+                    metrics['first_output_seconds'] = time.perf_counter() - self._start_time
+
+            if not is_last:
+                for output in outputs:
+                    self._put(position + 1, output)
+            if ended:
+                break
+
+        # 本階段最後一個結束的 worker 通知下一階段結束
+        with self._lock:
+            self._running_workers[position] -= 1
+            last_worker = self._running_workers[position] == 0
+        if last_worker and not is_last:
+            for _ in range(self.stages[position + 1].workers):
+                self._queues[position + 1].put(_END)
+
+    def _report(self, finished:threading.Event):
+        while not finished.wait(self.report_interval):
+            stages = self.get_metrics()['stages']
+            print('  '.join(f"{name}: {stage['items_in']} done, {stage['queue_depth']} queued" for name, stage in stages.items()))
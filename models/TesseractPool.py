@@ -0,0 +1,59 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TesseractPool:
+    """
+    Persistent pool of OCR worker threads shared by every PDF of a run.
+
+    With `tesserocr` installed, each thread keeps one initialized Tesseract engine, so the language data is
+    loaded once per thread instead of once per image. Without it, every image falls back to `pytesseract`, which
+    starts a Tesseract process per call. `image_to_string` can also be called from threads outside the pool;
+    they get their own engine the first time.
+    """
+    def __init__(self, workers:int=None, lang:str='eng+chi_tra'):
+        self.workers = workers or os.cpu_count() or 1
+        self.lang = lang
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tesseract')
+        self._local = threading.local()
+        try:
+            import tesserocr
+            self._tesserocr = tesserocr
+        except ImportError:
+            self._tesserocr = None
+
+    @property
+    def backend(self) -> str:
+        return 'tesserocr' if self._tesserocr is not None else 'pytesseract'
+
+    def map(self, function, items) -> list:
+        """Runs `function` on every item on the pool's threads, returning the results in input order."""
+        return list(self._executor.map(function, items))
+
+    def image_to_string(self, image) -> str:
+        """OCR of a PIL image with the engine of the calling thread."""
+        if self._tesserocr is None:
+            import pytesseract
+            return pytesseract.image_to_string(image, lang=self.lang)
+
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = self._local.api = self._tesserocr.PyTessBaseAPI(lang=self.lang)
+        api.SetImage(image)
+        return api.GetUTF8Text()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+_shared_lock = threading.Lock()
+_shared_tesseract_pool = None
+
+def get_shared_tesseract_pool() -> TesseractPool:
+    global _shared_tesseract_pool
+    with _shared_lock:
+        if _shared_tesseract_pool is None:
+            from config.Config import get_config
+            _shared_tesseract_pool = TesseractPool(get_config().OCR_WORKERS)
+        return _shared_tesseract_pool
@@ -0,0 +1,243 @@
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+from models.LatencyHistogram import LatencyHistogram
+
+
+class _NoopSpan:
+    """Span returned while tracing is disabled; every operation does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, name:str, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    One timed section of a run. Numeric values given to `set` (token counts, cost, items processed) are summed
+    per span name in the run summary; other values are only kept on the recorded event.
+    """
+    __slots__ = ('tracer', 'name', 'values', 'parent', 'start_time')
+
+    def __init__(self, tracer:'Tracer', name:str, values:dict):
+        self.tracer = tracer
+        self.name = name
+        self.values = values
+        self.parent = None
+        self.start_time = None
+
+    def set(self, name:str, value):
+        self.values[name] = value
+
+    def __enter__(self):
+        stack = self.tracer._get_stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start_time
+        self.tracer._get_stack().pop()
+        self.tracer._record(self, seconds, exc_type is not None)
+        return False
+
+
+class Tracer:
+    """
+    Per-stage tracing of a run: PDF extraction and OCR, LLM calls, embedding and FAISS search, corpus I/O and
+    question handling.
+
+    `span(name, **values)` is a context manager and `traced(name)` a decorator; both aggregate the count,
+    errors, total and maximum time and a latency histogram per span name, plus the sums of the numeric values
+    set on the spans, such as the prompt and completion tokens and the cost of the LLM calls. The parent of each
+    span is the span open on the same thread, so nested stages can be told apart from their callers. The last
+    `max_events` spans are also kept as events for the JSON export.
+
+    While disabled, `span` returns a shared no-op object and `traced` functions call straight through, so
+    leaving the instrumentation in place costs one attribute check per call. Spans run in worker processes are
+    not collected.
+    """
+    def __init__(self, enabled:bool=False, max_events:int=10000):
+        self.enabled = enabled
+        self.max_events = max_events
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def enable(self):
+        if not self.enabled:
+            self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._events = deque(maxlen=self.max_events)
+            self._start_time = time.perf_counter()
+            self._started_at = time.time()
+
+    def span(self, name:str, **values):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, values)
+
+    def traced(self, name:str):
+        """Decorator that runs every call of the function inside a span called `name`."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Span(self, name, {}):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name:str, seconds:float, failed:bool=False, **values):
+        """
+        Records a span that was timed by the caller, e.g. a generator whose work is spread over the iterations of
+        its consumer and therefore cannot hold a `span` open. The span has no parent.
+        """
+        if not self.enabled:
+            return
+        span = Span(self, name, values)
+        span.start_time = time.perf_counter() - seconds
+        self._record(span, seconds, failed)
+
+    def get_summary(self) -> dict:
+        """Per span name: calls, errors, total/mean/max time, p50/p95/p99, share of the run and summed values."""
+        with self._lock:
+            wall_seconds = time.perf_counter() - self._start_time
+            spans = {}
+            for name, stats in sorted(self._stats.items(), key=lambda item: -item[1]['total_seconds']):
+                # 百分位數為所在桶的上限，不超過實際最大值
+                histogram = stats['histogram'].snapshot()
+                spans[name] = {
+                    'parents': sorted(stats['parents']),
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'total_seconds': stats['total_seconds'],
+                    'mean_ms': stats['total_seconds'] * 1000 / stats['count'],
+                    'max_ms': histogram['max_ms'],
+                    'p50_ms': min(histogram['p50_ms'], histogram['max_ms']),
+                    'p95_ms': min(histogram['p95_ms'], histogram['max_ms']),
+                    'p99_ms': min(histogram['p99_ms'], histogram['max_ms']),
+                    # 同一類 span 可能在多個執行緒同時執行，比例可超過 1
+                    'share_of_run': stats['total_seconds'] / wall_seconds if wall_seconds else 0.0,
+                    'values': dict(stats['values']),
+                }
+        return {'started_at': self._started_at, 'wall_seconds': wall_seconds, 'spans': spans}
+
+    def get_events(self) -> list[dict]:
+        with self._lock:
+            return list(self._events)
+
+    def to_json(self, include_events:bool=True) -> str:
+        report = {'summary': self.get_summary()}
+        if include_events:
+            report['events'] = self.get_events()
+        return json.dumps(report, ensure_ascii=False, indent=4)
+
+    def to_prometheus(self, prefix:str='rag') -> str:
+        """The summary in the Prometheus text exposition format: a duration histogram, an error counter and one counter per summed value."""
+        with self._lock:
+            stats_items = sorted(self._stats.items())
+            snapshots = [(name, stats, stats['histogram'].snapshot()) for name, stats in stats_items]
+
+        lines = [
+            f'# HELP {prefix}_span_duration_seconds Time spent in each traced stage.',
+            f'# TYPE {prefix}_span_duration_seconds histogram',
+        ]
+        for name, stats, histogram in snapshots:
+            label = self._escape_label(name)
+            for bucket in histogram['buckets']:
+                upper = '+Inf' if bucket['le_ms'] == '+Inf' else repr(bucket['le_ms'] / 1000)
+                lines.append(f'{prefix}_span_duration_seconds_bucket{{span="{label}",le="{upper}"}} {bucket["count"]}')
+            lines.append(f'{prefix}_span_duration_seconds_sum{{span="{label}"}} {stats["total_seconds"]!r}')
+            lines.append(f'{prefix}_span_duration_seconds_count{{span="{label}"}} {stats["count"]}')
+
+        lines += [f'# HELP {prefix}_span_errors_total Traced calls that raised.', f'# TYPE {prefix}_span_errors_total counter']
+        for name, stats, _ in snapshots:
+            lines.append(f'{prefix}_span_errors_total{{span="{self._escape_label(name)}"}} {stats["errors"]}')
+
+        lines += [f'# HELP {prefix}_span_value_total Values summed over the traced calls, e.g. tokens and cost.', f'# TYPE {prefix}_span_value_total counter']
+        for name, stats, _ in snapshots:
+            for value_name, value in sorted(stats['values'].items()):
+                lines.append(f'{prefix}_span_value_total{{span="{self._escape_label(name)}",value="{self._escape_label(value_name)}"}} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, file_name:str):
+        """Writes the Prometheus text format to a `.prom` file and JSON to any other file."""
+        content = self.to_prometheus() if file_name.endswith('.prom') else self.to_json()
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def format_summary(self) -> str:
+        summary = self.get_summary()
+        lines = [f"Trace of {summary['wall_seconds']:.1f}s"]
+        for name, span in summary['spans'].items():
+            values = '  '.join(f"{value_name}={value:.4g}" for value_name, value in span['values'].items())
+            lines.append(
+                f"  {name:<24} calls: {span['count']:>6}  errors: {span['errors']:>4}  total: {span['total_seconds']:>8.2f}s  "
+                f"mean: {span['mean_ms']:>9.1f}ms  p95: {span['p95_ms']:>7.0f}ms  max: {span['max_ms']:>9.1f}ms  {values}".rstrip()
+            )
+        return '\n'.join(lines)
+
+    def _get_stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, span:Span, seconds:float, failed:bool):
+        with self._lock:
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = {
+                    'count': 0, 'errors': 0, 'total_seconds': 0.0, 'histogram': LatencyHistogram(), 'values': {}, 'parents': set()
+                }
+            stats['count'] += 1
+            stats['errors'] += failed
+            stats['total_seconds'] += seconds
+            stats['histogram'].observe(seconds)
+            if span.parent is not None:
+                stats['parents'].add(span.parent)
+            for name, value in span.values.items():
+                # bool 也是 int，記為次數
+                if isinstance(value, (int, float)):
+                    stats['values'][name] = stats['values'].get(name, 0) + value
+
+            self._events.append({
+                'name': span.name,
+                'parent': span.parent,
+                'thread': threading.current_thread().name,
+                'start_seconds': span.start_time - self._start_time,
+                'duration_ms': seconds * 1000,
+                'error': failed,
+                'values': span.values,
+            })
+
+    @staticmethod
+    def _escape_label(value:str) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# 整個程序共用的 tracer，預設關閉；app.py 與 server.py 依 --trace 或 TRACING_ENABLED 開啟
+shared_tracer = Tracer()
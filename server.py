@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import sys
+import json
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from controllers.ServingController import ServingController
+
+
+def build_serving_controller(args) -> ServingController:
+    from controllers.QuestionController import QuestionController
+    from controllers.ServingController import ServingController
+    from models.FAISSIndexManager import FAISSIndexManager
+    from models.CrossEncoderReranker import CrossEncoderReranker
+    from models.LangChainModel import LangChainModel, get_shared_langchain_model
+
+    index_types = {category: 'chunk' for category in args.chunk_categories}
+    reranker = CrossEncoderReranker(latency_budget_ms=args.rerank_budget_ms) if args.rerank_k > 0 else None
+    faiss_index_manager = FAISSIndexManager(retrieval_mode=args.retrieval_mode, index_types=index_types, reranker=reranker, rerank_k=args.rerank_k, metric=args.metric, score_threshold=args.score_threshold)
+
+    if args.fake_llm:
+        from models.FakeChatModel import FakeChatModel
+        # 本地假模型不需 OpenAI 金鑰，也不寫入 LLM 快取
+        llm_model = LangChainModel(chat_model=FakeChatModel(latency_ms=args.fake_llm_latency_ms, token_latency_ms=args.fake_llm_token_latency_ms), use_cache=False)
+    else:
+        llm_model = get_shared_langchain_model()
+
+    answer_cache = None
+    if args.answer_cache_threshold is not None:
+        from models.SemanticAnswerCache import SemanticAnswerCache
+        # 假模型的答案只保存在記憶體中，不寫入共用的答案快取檔
+        answer_cache_file_name = ':memory:' if args.fake_llm else None
+        answer_cache = SemanticAnswerCache(faiss_index_manager.embedding_model, file_name=answer_cache_file_name, threshold=args.answer_cache_threshold, ttl_seconds=args.answer_cache_ttl_seconds, max_entries=args.answer_cache_max_entries)
+
+    serving_controller = ServingController(QuestionController(faiss_index_manager, llm_model, answer_cache), max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    serving_controller.preload(args.categories)
+    return serving_controller
+
+
+def answer_payload(serving_controller:ServingController, payload:dict, timeout:float=None) -> dict:
+    response, sources_num = serving_controller.handle_question(payload['query'], payload['category'], payload.get('source'), timeout)
+    return format_answer(payload, response, sources_num)
+
+
+def format_answer(payload:dict, response:str, sources_num:list) -> dict:
+    # 與 app.py 輸出的答案欄位一致
+    return {
+        'qid': payload.get('qid'),
+        'retrieve': int(sources_num[0]) if sources_num else None,
+        'sources': sources_num or [],
+        'response': response,
+    }
+
+
+def make_request_handler(serving_controller:ServingController, timeout:float=None):
+    class QuestionRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path == '/health':
+                health = serving_controller.get_health()
+                self._send_json(200 if health['status'] == 'ok' else 503, health)
+            elif self.path == '/metrics':
+                self._send_json(200, serving_controller.get_metrics())
+            elif self.path == '/metrics/prometheus':
+                from models.Tracer import shared_tracer
+                self._send_text(200, shared_tracer.to_prometheus(), 'text/plain; version=0.0.4; charset=utf-8')
+            else:
+                self._send_json(404, {'error': f'Unknown path {self.path}.'})
+
+        def do_POST(self):
+            if self.path not in ('/question', '/question/stream'):
+                self._send_json(404, {'error': f'Unknown path {self.path}.'})
+                return
+
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if not isinstance(payload, dict) or not isinstance(payload.get('query'), str) or not isinstance(payload.get('category'), str):
+                    raise ValueError("The body must be a JSON object with string 'query' and 'category' fields.")
+            except ValueError as e:
+                self._send_json(400, {'error': str(e)})
+                return
+
+            if self.path == '/question/stream':
+                self._send_stream(payload)
+                return
+
+            try:
+                self._send_json(200, answer_payload(serving_controller, payload, timeout))
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+
+        def _send_stream(self, payload:dict):
+            try:
+                events = serving_controller.stream_question(payload['query'], payload['category'], payload.get('source'), timeout)
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+
+            # 每個事件一行 JSON，以 chunked 編碼逐一送出
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for event in events:
+                    self._write_chunk(dict(event, qid=payload.get('qid')))
+            except Exception as e:
+                self._write_chunk({'type': 'error', 'qid': payload.get('qid'), 'error': str(e)})
+            self.wfile.write(b'0\r\n\r\n')
+
+        def _write_chunk(self, body:dict):
+            data = (json.dumps(body, ensure_ascii=False) + '\n').encode('utf-8')
+            self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+            self.wfile.flush()
+
+        def _send_text(self, status:int, text:str, content_type:str):
+            data = text.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_json(self, status:int, body:dict):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            # 延遲統計見 /metrics，不逐筆輸出存取紀錄
+            pass
+
+    return QuestionRequestHandler
+
+
+def serve_http(serving_controller:ServingController, host:str, port:int, timeout:float=None):
+    server = ThreadingHTTPServer((host, port), make_request_handler(serving_controller, timeout))
+    server.daemon_threads = True
+    print(f"Serving on http://{host}:{server.server_address[1]} (POST /question, POST /question/stream, GET /health, GET /metrics, GET /metrics/prometheus)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def serve_stdio(serving_controller:ServingController, input_stream=sys.stdin, output_stream=sys.stdout, timeout:float=None):
+    """
+    Reads one JSON request per line and writes one JSON reply per line, in input order.
+
+    Questions are submitted as soon as they are read, so lines piped in together are micro-batched; lines of the
+    form {"command": "health"} or {"command": "metrics"} return the corresponding report. A request with
+    "stream": true is answered with one line per event of `ServingController.stream_question`.
+    """
+    pending = deque()
+    condition = threading.Condition()
+    finished = []
+
+    def write_replies():
+        while True:
+            with condition:
+                while not pending and not finished:
+                    condition.wait()
+                if not pending:
+                    return
+                payload, reply = pending.popleft()
+
+            if payload.get('stream') and not isinstance(reply, dict):
+                try:
+                    for event in reply:
+                        output_stream.write(json.dumps(dict(event, qid=payload.get('qid')), ensure_ascii=False) + '\n')
+                        output_stream.flush()
+                except Exception as e:
+                    output_stream.write(json.dumps({'type': 'error', 'qid': payload.get('qid'), 'error': str(e)}, ensure_ascii=False) + '\n')
+                    output_stream.flush()
+                continue
+
+            if hasattr(reply, 'result'):
+                try:
+                    response, sources_num = reply.result(timeout)
+                    reply = format_answer(payload, response, sources_num)
+                except Exception as e:
+                    reply = {'qid': payload.get('qid'), 'error': str(e)}
+            output_stream.write(json.dumps(reply, ensure_ascii=False) + '\n')
+            output_stream.flush()
+
+    writer = threading.Thread(target=write_replies, name='stdio-writer')
+    writer.start()
+
+    for line in input_stream:
+        if not line.strip():
+            continue
+        try:
+            payload = json.loads(line)
+            if payload.get('command') == 'health':
+                reply = serving_controller.get_health()
+            elif payload.get('command') == 'metrics':
+                reply = serving_controller.get_metrics()
+            elif payload.get('stream'):
+                reply = serving_controller.stream_question(payload['query'], payload['category'], payload.get('source'), timeout)
+            else:
+                reply = serving_controller.submit(payload['query'], payload['category'], payload.get('source'))
+        except (ValueError, KeyError, AttributeError) as e:
+            payload, reply = {}, {'error': f"Invalid request: {e}"}
+
+        with condition:
+            pending.append((payload, reply))
+            condition.notify()
+
+    with condition:
+        finished.append(True)
+        condition.notify()
+    writer.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve questions from a resident process that keeps the indexes and models loaded.')
+    parser.add_argument('--mode', type=str, default='http', choices=['http', 'stdio'], help='以 HTTP 或 JSON lines（stdin/stdout）提供服務')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='HTTP 監聽位址')
+    parser.add_argument('--port', type=int, default=8000, help='HTTP 監聽埠號')
+    parser.add_argument('--categories', type=str, nargs='*', default=['finance', 'insurance', 'faq'], help='啟動時預先載入索引的類別')
+    parser.add_argument('--max_batch_size', type=int, default=32, help='合併成一批檢索的最多問題數')
+    parser.add_argument('--max_wait_ms', type=float, default=5.0, help='等待其他問題併入同一批的最長時間（毫秒）')
+    parser.add_argument('--request_timeout', type=float, default=None, help='每題等待回覆的最長秒數')
+    parser.add_argument('--fake_llm', action='store_true', help='以本地假模型取代 OpenAI，供測試使用')
+    parser.add_argument('--fake_llm_latency_ms', type=float, default=0.0, help='假模型每次回覆第一段文字前的延遲（毫秒）')
+    parser.add_argument('--fake_llm_token_latency_ms', type=float, default=0.0, help='假模型串流時每段文字之間的延遲（毫秒）')
+    parser.add_argument('--chunk_categories', type=str, nargs='*', default=[], help='使用切塊索引的類別')
+    parser.add_argument('--retrieval_mode', type=str, default='dense', choices=['dense', 'sparse', 'hybrid'], help='檢索模式：向量、BM25 或兩者融合')
+    parser.add_argument('--metric', type=str, default='cosine', choices=['cosine', 'l2'], help='向量索引的相似度量')
+    parser.add_argument('--score_threshold', type=float, default=None, help='cosine 相似度門檻，達門檻的文件全部回傳')
+    parser.add_argument('--rerank_k', type=int, default=0, help='以 cross-encoder 重排序的候選文件數，0 表示不重排序')
+    parser.add_argument('--rerank_budget_ms', type=float, default=None, help='每題重排序的延遲預算（毫秒），超過時沿用向量檢索排序')
+    parser.add_argument('--answer_cache_threshold', type=float, default=None, help='相近問題沿用快取答案的 cosine 相似度門檻，未設定時不使用答案快取')
+    parser.add_argument('--answer_cache_ttl_seconds', type=float, default=7 * 24 * 3600, help='快取答案的有效秒數')
+    parser.add_argument('--answer_cache_max_entries', type=int, default=10000, help='每個類別最多快取的答案數')
+    parser.add_argument('--trace', action='store_true', help='記錄各階段的計時與 LLM token 用量，見 /metrics 與 /metrics/prometheus')
+    args = parser.parse_args()
+
+    # stdio 模式下 stdout 只輸出回覆，其他訊息改寫到 stderr
+    output_stream = sys.stdout
+    if args.mode == 'stdio':
+        sys.stdout = sys.stderr
+
+    from config.Config import get_config
+    from models.Tracer import shared_tracer
+    if args.trace or get_config().TRACING_ENABLED:
+        shared_tracer.enable()
+
+    serving_controller = build_serving_controller(args)
+    try:
+        if args.mode == 'http':
+            serve_http(serving_controller, args.host, args.port, args.request_timeout)
+        else:
+            serve_stdio(serving_controller, sys.stdin, output_stream, args.request_timeout)
+    finally:
+        serving_controller.close()
+
+    #python server.py --port 8000
+    #python server.py --mode stdio --fake_llm < questions.jsonl
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import numpy as np
+
+from models.BM25Index import BM25Index, tokenize
+
+
+CORPUS = {
+    '1': '保險金額為新台幣一百萬元',
+    '2': '本公司第三季營收成長 12.5%',
+    '3': '身故保險金的申請文件',
+    '4': 'ESG 報告與董事會組成',
+}
+
+
+def _assert_same_index(index, expected):
+    assert index.sources == expected.sources
+    for query in ('保險金', '營收', 'esg 董事會', '申請'):
+        assert index.search(query, 4) == [(source, score) for source, score in expected.search(query, 4)]
+
+
+def test_tokenize_uses_bigrams_for_chinese_and_keeps_numbers():
+    assert tokenize('保險金 12.5% ESG') == ['保險', '險金', '12.5', 'esg']
+
+
+def test_search_ranks_matching_documents_and_respects_allowed_sources():
+    index = BM25Index.build(CORPUS.items())
+    assert index.search('身故保險金', 1)[0][0] == '3'
+    assert [source for source, _ in index.search('保險金', 5, allowed_sources=['1', '4'])][0] == '1'
+    assert index.search('不存在的詞', 5) == []
+
+
+def test_update_matches_a_full_build():
+    index = BM25Index.build(CORPUS.items())
+    updated = index.update([('2', '第四季營收衰退'), ('5', '保險契約的解約金')], ['4'])
+
+    expected_corpus = dict(CORPUS, **{'2': '第四季營收衰退', '5': '保險契約的解約金'})
+    del expected_corpus['4']
+    expected = BM25Index.build((source, expected_corpus[source]) for source in ['1', '3', '2', '5'])
+    _assert_same_index(updated, expected)
+    # 已刪除文件獨有的詞彙不再保留
+    assert 'esg' not in updated.vocabulary
+
+
+def test_save_and_load_keep_the_index_updatable(tmp_path):
+    index = BM25Index.build(CORPUS.items())
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+
+    assert loaded.can_update()
+    assert np.array_equal(loaded.weights, index.weights)
+    _assert_same_index(loaded.update([], ['1']), BM25Index.build((source, text) for source, text in CORPUS.items() if source != '1'))
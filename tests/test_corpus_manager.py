@@ -0,0 +1,82 @@
+import json
+
+from models.CorpusManager import CorpusManager
+
+
+def make_corpus_manager(tmp_path) -> CorpusManager:
+    corpus_manager = CorpusManager('testcat')
+    corpus_manager.file_path = str(tmp_path)
+    corpus_manager.records_file_name = str(tmp_path / 'testcat_corpus.jsonl')
+    corpus_manager.offsets_file_name = str(tmp_path / 'testcat_corpus.idx.json')
+    corpus_manager.json_file_name = str(tmp_path / 'testcat_all_text.json')
+    return corpus_manager
+
+
+def test_latest_records_win_and_tombstones_delete(tmp_path):
+    corpus_manager = make_corpus_manager(tmp_path)
+    corpus_manager.save_corpus({'1': '甲', '2': '乙', '3': '丙'})
+    corpus_manager.save_corpus({'2': '乙二'})
+    corpus_manager.delete_documents(['3', 'missing'])
+
+    assert corpus_manager.get_document('2') == '乙二'
+    assert corpus_manager.get_document('3') is None
+    assert dict(corpus_manager.iter_corpus()) == {'1': '甲', '2': '乙二'}
+    # 不存在的文件不寫入墓碑
+    with open(corpus_manager.records_file_name, 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == 5
+
+
+def test_offsets_are_persisted_and_only_new_records_are_scanned(tmp_path):
+    corpus_manager = make_corpus_manager(tmp_path)
+    corpus_manager.save_corpus({'1': '甲', '2': '乙'})
+    corpus_manager.export_json()
+    with open(corpus_manager.json_file_name, 'r', encoding='utf-8') as f:
+        assert json.load(f) == {'1': '甲', '2': '乙'}
+
+    # 另一個實例在索引儲存後追加的紀錄
+    make_corpus_manager(tmp_path).save_corpus({'3': '丙'})
+
+    reader = make_corpus_manager(tmp_path)
+    reader._load_offsets()
+    with open(corpus_manager.offsets_file_name, 'r', encoding='utf-8') as f:
+        saved_size = json.load(f)['size']
+    assert saved_size < reader._indexed_size
+    assert reader.get_sources() == ['1', '2', '3']
+    assert corpus_manager.get_document('3') == '丙'
+
+
+def test_compaction_by_another_instance_invalidates_the_offsets(tmp_path):
+    corpus_manager = make_corpus_manager(tmp_path)
+    corpus_manager.save_corpus({'1': '甲', '2': '乙'})
+    corpus_manager.save_corpus({'1': '甲二'})
+    corpus_manager.delete_documents(['2'])
+    assert corpus_manager.get_document('1') == '甲二'
+
+    make_corpus_manager(tmp_path).compact()
+    with open(corpus_manager.records_file_name, 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == 1
+    assert corpus_manager.get_document('1') == '甲二'
+    assert corpus_manager.get_sources() == ['1']
+
+
+def test_an_interrupted_record_is_ignored_and_not_joined_to_the_next(tmp_path):
+    corpus_manager = make_corpus_manager(tmp_path)
+    corpus_manager.save_corpus({'1': '甲'})
+    with open(corpus_manager.records_file_name, 'a', encoding='utf-8') as f:
+        f.write('{"source": "2", "cont')
+
+    reader = make_corpus_manager(tmp_path)
+    assert reader.get_sources() == ['1']
+    reader.save_corpus({'3': '丙'})
+    assert make_corpus_manager(tmp_path).get_sources() == ['1', '3']
+    assert reader.get_document('3') == '丙'
+
+
+def test_a_legacy_json_corpus_is_imported(tmp_path):
+    corpus_manager = make_corpus_manager(tmp_path)
+    with open(corpus_manager.json_file_name, 'w', encoding='utf-8') as f:
+        json.dump({'1': '甲', '2': '乙'}, f, ensure_ascii=False)
+
+    assert corpus_manager.exists()
+    assert corpus_manager.load_corpus() == {'1': '甲', '2': '乙'}
+    assert (tmp_path / 'testcat_corpus.jsonl').exists()
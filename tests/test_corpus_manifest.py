@@ -0,0 +1,92 @@
+import pytest
+
+from models.CorpusManifest import CorpusManifest
+from models.DocumentManager import DocumentManager
+from models.LangChainModel import FAILED_RESPONSE
+from models.PDFProcessor import PDFTextImageExtractor
+
+
+def test_stored_files_are_handed_to_the_index_again_until_done(tmp_path):
+    (tmp_path / 'a.pdf').write_bytes(b'a')
+    manifest = CorpusManifest('testcat')
+    manifest.entries = {}
+
+    assert manifest.get_delta(str(tmp_path), ['a.pdf']) == {'to_process': ['a.pdf'], 'stored': [], 'deleted': {}}
+    # 語料已寫入，但索引更新前中斷
+    manifest.mark_stored('a.pdf', ['a'])
+    assert manifest.get_delta(str(tmp_path), ['a.pdf']) == {'to_process': [], 'stored': ['a.pdf'], 'deleted': {}}
+
+    manifest.mark_done('a.pdf')
+    assert manifest.entries['a.pdf']['sources'] == ['a']
+    assert manifest.get_delta(str(tmp_path), ['a.pdf']) == {'to_process': [], 'stored': [], 'deleted': {}}
+
+
+def test_deleted_files_keep_their_entry_until_removed(tmp_path):
+    (tmp_path / 'a.pdf').write_bytes(b'a')
+    manifest = CorpusManifest('testcat')
+    manifest.entries = {}
+    manifest.get_delta(str(tmp_path), ['a.pdf'])
+    manifest.mark_stored('a.pdf', ['a'])
+
+    # 已寫入語料但未建立索引的 key 也列為待刪除，直到索引更新後才移除 entry
+    assert manifest.get_delta(str(tmp_path), [])['deleted'] == {'a.pdf': ['a']}
+    assert manifest.get_delta(str(tmp_path), [])['deleted'] == {'a.pdf': ['a']}
+    manifest.remove('a.pdf')
+    assert manifest.get_delta(str(tmp_path), [])['deleted'] == {}
+
+
+class FailingSummaryModel:
+    """Fails to summarize every document that mentions 'fail'."""
+    def get_document_summaries(self, contents:list[str]) -> list[str]:
+        return [FAILED_RESPONSE if 'fail' in content else f'摘要:{content}' for content in contents]
+
+    def get_document_summary(self, content:str) -> str:
+        return self.get_document_summaries([content])[0]
+
+
+def make_document_manager(tmp_path) -> DocumentManager:
+    document_manager = DocumentManager('testcat', llm_model=FailingSummaryModel())
+    document_manager.file_name = str(tmp_path / 'testcat_summarized_documents.json')
+    corpus_manager = document_manager.corpusmanager
+    corpus_manager.file_path = str(tmp_path)
+    corpus_manager.records_file_name = str(tmp_path / 'testcat_corpus.jsonl')
+    corpus_manager.offsets_file_name = str(tmp_path / 'testcat_corpus.idx.json')
+    corpus_manager.json_file_name = str(tmp_path / 'testcat_all_text.json')
+    return document_manager
+
+
+def test_failed_summaries_are_not_indexed_and_their_files_stay_stored(tmp_path):
+    source_path = tmp_path / 'reference'
+    (source_path / 'testcat').mkdir(parents=True)
+    for file in ('a.pdf', 'b.pdf'):
+        (source_path / 'testcat' / file).write_bytes(file.encode())
+
+    pdf_processor = PDFTextImageExtractor('testcat', str(source_path))
+    pdf_processor.manifest.file_name = str(tmp_path / 'testcat_manifest.json')
+    pdf_processor.manifest.entries = {}
+    pdf_processor.manifest.get_delta(pdf_processor.category_source_path, ['a.pdf', 'b.pdf'])
+    pdf_processor.mark_stored(['a.pdf', 'b.pdf'])
+    pdf_processor._delta_files = {'updated': ['a.pdf', 'b.pdf'], 'deleted': []}
+
+    document_manager = make_document_manager(tmp_path)
+    document_manager.corpusmanager.save_corpus({'a': 'ok', 'b': 'fail'})
+    documents = document_manager.create_summarized_documents()
+
+    assert [document.metadata['source'] for document in documents] == ['a']
+    assert document_manager.failed_sources == ['b']
+    pdf_processor.commit_delta(document_manager.failed_sources)
+    assert pdf_processor.manifest.get_delta(pdf_processor.category_source_path, ['a.pdf', 'b.pdf'])['stored'] == ['b.pdf']
+
+    # 串流管線中摘要失敗時拋出例外，由管線略過該檔案
+    with pytest.raises(RuntimeError):
+        document_manager.summarize_document('b', 'fail')
+
+
+def test_a_failed_ocr_format_keeps_the_file_out_of_the_corpus(tmp_path):
+    (tmp_path / 'testcat').mkdir()
+    (tmp_path / 'testcat' / 'a.pdf').write_bytes(b'a')
+    pdf_processor = PDFTextImageExtractor('testcat', str(tmp_path), use_ocr_cache=False)
+    pdf_processor._llm_model = type('FailingFormatModel', (), {'get_formatted_texts_from_ocr': lambda self, texts: [FAILED_RESPONSE for _ in texts]})()
+
+    with pytest.raises(RuntimeError):
+        pdf_processor.format_raw_pages([{'text': '內文', 'ocr_texts': ['圖片文字' * 10], 'ocr_keys': ['digest']}])
@@ -0,0 +1,44 @@
+import json
+
+from langchain_core.documents import Document
+
+from models.DocumentManager import DocumentManager
+
+
+def make_document_manager(tmp_path) -> DocumentManager:
+    document_manager = DocumentManager('testcat')
+    document_manager.file_path = str(tmp_path)
+    document_manager.file_name = str(tmp_path / 'testcat_summarized_documents.json')
+    document_manager.pending_file_name = str(tmp_path / 'testcat_summarized_documents.pending.jsonl')
+    return document_manager
+
+
+def summary(source:str, text:str) -> Document:
+    return Document(page_content=text, metadata={'source': source, 'qa_category': 'testcat'})
+
+
+def test_appended_summaries_are_read_before_and_after_compaction(tmp_path):
+    document_manager = make_document_manager(tmp_path)
+    document_manager.merge_summarized_documents([summary('1', 'a'), summary('2', 'b')], [])
+
+    document_manager.append_summarized_documents([summary('3', 'c')], [])
+    document_manager.append_summarized_documents([summary('1', 'a2')], ['2'])
+    # 追加時不改寫摘要檔
+    with open(document_manager.file_name, 'r', encoding='utf-8') as f:
+        assert [doc['page_content'] for doc in json.load(f)] == ['a', 'b']
+
+    expected = [('3', 'c'), ('1', 'a2')]
+    assert [(doc.metadata['source'], doc.page_content) for doc in document_manager.get_summarized_documents()] == expected
+
+    document_manager.compact_summarized_documents()
+    assert not (tmp_path / 'testcat_summarized_documents.pending.jsonl').exists()
+    assert [(doc.metadata['source'], doc.page_content) for doc in document_manager.get_summarized_documents()] == expected
+
+
+def test_pending_summaries_alone_count_as_existing(tmp_path):
+    document_manager = make_document_manager(tmp_path)
+    assert not document_manager.exists()
+
+    document_manager.append_summarized_documents([summary('1', 'a')], [])
+    assert document_manager.exists()
+    assert [doc.page_content for doc in document_manager.get_summarized_documents()] == ['a']
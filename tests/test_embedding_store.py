@@ -0,0 +1,33 @@
+import numpy as np
+
+from models.EmbeddingCache import EmbeddingStore
+
+
+def test_stores_in_two_processes_never_share_rows(tmp_path):
+    file_name = str(tmp_path / 'embeddings')
+    # 兩個實例模擬兩個程序，各自只看過自己載入時的 key
+    first = EmbeddingStore(file_name, dtype=np.float32)
+    second = EmbeddingStore(file_name, dtype=np.float32)
+
+    first.set_many([('a', [1.0, 0.0]), ('b', [2.0, 0.0])])
+    second.set_many([('c', [3.0, 0.0]), ('a', [9.0, 9.0])])
+    first.set_many([('d', [4.0, 0.0])])
+
+    reloaded = EmbeddingStore(file_name, dtype=np.float32)
+    assert len(reloaded) == 4
+    for key, value in (('a', 1.0), ('b', 2.0), ('c', 3.0), ('d', 4.0)):
+        assert reloaded.get(key).tolist() == [value, 0.0]
+    assert second.get('b').tolist() == [2.0, 0.0]
+
+
+def test_an_interrupted_key_record_does_not_swallow_the_next_one(tmp_path):
+    file_name = str(tmp_path / 'embeddings')
+    store = EmbeddingStore(file_name, dtype=np.float32)
+    store.set_many([('a', [1.0])])
+    with open(f'{file_name}.keys.jsonl', 'a', encoding='utf-8') as f:
+        f.write('{"key": "broken", "ro')
+
+    EmbeddingStore(file_name, dtype=np.float32).set_many([('b', [2.0])])
+    reloaded = EmbeddingStore(file_name, dtype=np.float32)
+    assert reloaded.get('b').tolist() == [2.0]
+    assert reloaded.get('broken') is None
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+import pytest
+
+from models.CorpusManager import CorpusManager
+from models.FAISSIndexManager import FAISSIndexManager
+from models.IndexRegistry import IndexRegistry
+
+
+def _make_version(tmp_path, name, content):
+    path = tmp_path / name
+    path.mkdir()
+    (path / 'index.faiss').write_text(content)
+    return str(path)
+
+
+def test_publish_version_replaces_the_symlink_and_removes_the_previous_version(tmp_path):
+    index_path = str(tmp_path / 'testcat_faiss_index')
+    first = _make_version(tmp_path, 'testcat_faiss_index.v-1', 'first')
+    second = _make_version(tmp_path, 'testcat_faiss_index.v-2', 'second')
+
+    FAISSIndexManager._publish_version(index_path, first)
+    assert os.readlink(index_path) == 'testcat_faiss_index.v-1'
+
+    FAISSIndexManager._publish_version(index_path, second)
+    assert open(os.path.join(index_path, 'index.faiss')).read() == 'second'
+    assert not os.path.exists(first)
+
+
+def test_publish_version_migrates_a_legacy_directory(tmp_path):
+    index_path = _make_version(tmp_path, 'testcat_faiss_index', 'legacy')
+    version = _make_version(tmp_path, 'testcat_faiss_index.v-1', 'new')
+
+    FAISSIndexManager._publish_version(index_path, version)
+    assert os.path.islink(index_path)
+    assert open(os.path.join(index_path, 'index.faiss')).read() == 'new'
+    assert sorted(os.listdir(tmp_path)) == ['testcat_faiss_index', 'testcat_faiss_index.v-1']
+
+
+def test_search_does_not_build_a_missing_index(tmp_path, monkeypatch):
+    faiss_index_manager = FAISSIndexManager(index_directory=str(tmp_path))
+    monkeypatch.setattr(faiss_index_manager, 'create_index', lambda category=None: (_ for _ in ()).throw(AssertionError('built an index')))
+
+    assert faiss_index_manager.search_many(['問題'], ['testcat']) == [(None, None)]
+
+
+def test_a_missing_index_is_only_awaited_while_a_version_is_being_linked(tmp_path):
+    faiss_index_manager = FAISSIndexManager(index_directory=str(tmp_path))
+
+    start_time = time.perf_counter()
+    assert not faiss_index_manager._wait_for_index('testcat')
+    assert time.perf_counter() - start_time < 0.05
+
+    # 已建立版本目錄、symlink 尚未建立
+    version = _make_version(tmp_path, 'testcat_faiss_index.v-1', 'first')
+    linker = threading.Timer(0.05, os.symlink, (os.path.basename(version), str(tmp_path / 'testcat_faiss_index')))
+    linker.start()
+    assert faiss_index_manager._wait_for_index('testcat', timeout=2.0)
+    linker.join()
+
+
+def test_the_registry_does_not_build_a_missing_corpus(monkeypatch):
+    monkeypatch.setattr(CorpusManager, 'load_corpus', lambda self, category=None: (_ for _ in ()).throw(AssertionError('built a corpus')))
+    assert IndexRegistry().get_corpus('testcat_without_corpus') == {}
+
+
+def test_a_slow_load_does_not_block_other_categories(tmp_path):
+    index_registry = IndexRegistry(str(tmp_path))
+    entries = {}
+    loading = threading.Event()
+
+    def slow_loader():
+        loading.set()
+        time.sleep(0.5)
+        return 'slow'
+
+    thread = threading.Thread(target=index_registry._get_entry, args=(entries, 'corpus', 'slow', [], slow_loader))
+    thread.start()
+    loading.wait()
+    start_time = time.perf_counter()
+    assert index_registry._get_entry(entries, 'corpus', 'fast', [], lambda: 'fast') == 'fast'
+    assert time.perf_counter() - start_time < 0.2
+    thread.join()
+    assert entries['slow']['value'] == 'slow'
+
+
+def test_index_directory_gets_its_own_registry(tmp_path):
+    faiss_index_manager = FAISSIndexManager(index_directory=str(tmp_path))
+
+    assert faiss_index_manager.index_registry.get_index_path('testcat') == faiss_index_manager.get_index_path('testcat')
+    assert not faiss_index_manager.index_exists('testcat')
+    with pytest.raises(FileNotFoundError):
+        faiss_index_manager.export_vectors('testcat')
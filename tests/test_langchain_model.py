@@ -0,0 +1,140 @@
+import pytest
+
+import models.LangChainModel as langchain_model_module
+from models.FakeChatModel import FakeChatModel
+from models.LangChainModel import FAILED_RESPONSE, LangChainModel
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(langchain_model_module.time, 'sleep', recorded.append)
+    return recorded
+
+
+def make_model(max_retries:int=3, **fake_options) -> LangChainModel:
+    return LangChainModel(chat_model=FakeChatModel(**fake_options), max_retries=max_retries, use_cache=False)
+
+
+def test_retry_after_header_sets_backoff(sleeps):
+    model = make_model(max_retries=2, error_rate=1.0, error_status_code=429, retry_after=7)
+
+    assert model.get_response('文件內容', '問題') == FAILED_RESPONSE
+    assert sleeps == [7.0, 7.0]
+
+
+def test_server_errors_back_off_exponentially(sleeps):
+    model = make_model(max_retries=3, error_rate=1.0, error_status_code=503)
+
+    assert model.get_response('文件內容', '問題') == FAILED_RESPONSE
+    assert len(sleeps) == 3
+    for attempt, seconds in enumerate(sleeps):
+        assert 2 ** attempt <= seconds <= 2 ** attempt + 1
+
+
+def test_client_errors_are_not_retried(sleeps):
+    model = make_model(error_rate=1.0, error_status_code=400)
+
+    assert model.get_response('文件內容', '問題') == FAILED_RESPONSE
+    assert sleeps == []
+
+
+def test_stream_is_retried_before_the_first_chunk(sleeps):
+    model = make_model(max_retries=1, error_rate=1.0, retry_after=1)
+    prompt_template = model.get_response_prompt()
+    chain = prompt_template | model.chat_model | model.str_parser
+
+    with pytest.raises(Exception) as error:
+        list(model._stream_with_retry(chain, prompt_template, {'rag_content': '文件內容', 'input': '問題'}))
+    assert error.value.status_code == 429
+    assert sleeps == [1.0]
+
+
+def test_stream_is_not_retried_after_the_first_chunk(sleeps):
+    model = make_model(error_after_chunks=2, retry_after=1)
+    prompt_template = model.get_response_prompt()
+    chain = prompt_template | model.chat_model | model.str_parser
+
+    chunks = []
+    with pytest.raises(Exception) as error:
+        for chunk in model._stream_with_retry(chain, prompt_template, {'rag_content': '文件內容', 'input': '問題'}):
+            chunks.append(chunk)
+    assert error.value.status_code == 429
+    assert len(chunks) == 2
+    assert sleeps == []
+
+
+def test_batch_responses_keep_input_order():
+    model = make_model()
+
+    responses = model.get_responses(['文件一', '', '文件三'], ['問題一', '問題二', '問題三'])
+    assert responses[0].endswith('問題一')
+    assert responses[1] == "Invalid input provided."
+    assert responses[2].endswith('問題三')
+
+
+def test_injected_model_has_its_own_cache_keys(tmp_path):
+    from models.LLMCache import LLMCache
+
+    cache = LLMCache(file_name=str(tmp_path / 'llm_cache.sqlite'))
+    model = LangChainModel(chat_model=FakeChatModel(), cache=cache, use_cache=True)
+    response = model.get_response('文件內容', '問題')
+
+    input_data = {'rag_content': '文件內容', 'input': '問題'}
+    assert cache.get(LLMCache.make_key(model.get_response_prompt(), model.model_identity, input_data)) == response
+    assert cache.get(LLMCache.make_key(model.get_response_prompt(), 'gpt-4o-mini', input_data)) is None
+    # 不同參數的假模型回覆不同，也不共用快取
+    assert LangChainModel.get_model_identity(FakeChatModel(reply_chars=10)) != model.model_identity
+
+
+def test_missing_api_key_fails_when_the_model_is_created(monkeypatch):
+    from config.Config import get_config
+    from models.SharedModels import ConfigurationError
+    monkeypatch.setattr(get_config(), 'OPENAI_API_KEY', None)
+
+    with pytest.raises(ConfigurationError):
+        LangChainModel(use_cache=False)
+
+
+def test_configuration_errors_are_not_swallowed(monkeypatch):
+    from config.Config import get_config
+    from models.SharedModels import ConfigurationError
+
+    def fail(model_name):
+        raise ConfigurationError("Missing OPENAI_API_KEY environment variable.")
+
+    monkeypatch.setattr(get_config(), 'OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(langchain_model_module, 'get_chat_model', fail)
+    model = LangChainModel(use_cache=False)
+
+    with pytest.raises(ConfigurationError):
+        model.get_response('文件內容', '問題')
+    with pytest.raises(ConfigurationError):
+        list(model.stream_response('文件內容', '問題'))
+
+
+def test_stream_failure_after_the_first_chunk_is_raised(sleeps):
+    model = make_model(error_after_chunks=2)
+    chunks = []
+
+    with pytest.raises(Exception) as error:
+        for chunk in model.stream_response('文件內容', '問題'):
+            chunks.append(chunk)
+    assert error.value.status_code == 429
+    assert len(chunks) == 2
+    assert FAILED_RESPONSE not in chunks
+
+
+def test_streamed_calls_are_traced_with_usage(monkeypatch):
+    from models.Tracer import Tracer
+    tracer = Tracer(enabled=True)
+    monkeypatch.setattr(langchain_model_module, 'shared_tracer', tracer)
+    model = make_model()
+
+    response = ''.join(model.stream_response('文件內容', '問題'))
+    spans = tracer.get_summary()['spans']
+    assert spans['llm.stream']['count'] == 1
+    assert spans['llm.stream']['errors'] == 0
+    assert spans['llm.stream']['values']['completion_tokens'] > 0
+    assert spans['llm.stream']['values']['cost_usd'] > 0
+    assert response
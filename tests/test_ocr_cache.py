@@ -0,0 +1,79 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from models.OCRCache import OCRCache
+
+
+def make_scan(amount:str) -> Image.Image:
+    image = Image.new('L', (600, 400), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 580, 60), fill=0)
+    draw.text((40, 200), f'Total amount: {amount}', fill=0, font_size=40)
+    return image
+
+def reencode(image:Image.Image) -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=70)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+def store(cache:OCRCache, digest:str, image:Image.Image, ocr_text:str):
+    cache.set_ocr(digest, OCRCache.perceptual_hash(image), image, ocr_text)
+
+
+def test_only_exact_copies_are_reused_by_default(tmp_path):
+    cache = OCRCache(str(tmp_path / 'ocr.sqlite'))
+    image = make_scan('1,000')
+    store(cache, 'a', image, 'Total amount: 1,000')
+
+    assert cache.get('a') == 'Total amount: 1,000'
+    copy = reencode(image)
+    assert cache.get_similar('b', OCRCache.perceptual_hash(copy), copy) is None
+
+
+def test_a_reencoded_copy_is_reused_but_changed_digits_are_not(tmp_path):
+    cache = OCRCache(str(tmp_path / 'ocr.sqlite'), max_distance=32)
+    store(cache, 'a', make_scan('1,000'), 'Total amount: 1,000')
+
+    copy = reencode(make_scan('1,000'))
+    assert cache.get_similar('b', OCRCache.perceptual_hash(copy), copy) == 'Total amount: 1,000'
+    assert cache.get('b') == 'Total amount: 1,000'
+
+    # 只差幾個數字的掃描感知雜湊相近，但像素比對不符，不能沿用
+    changed = make_scan('7,000')
+    assert cache._find_similar(OCRCache.perceptual_hash(changed), changed.size)
+    assert cache.get_similar('c', OCRCache.perceptual_hash(changed), changed) is None
+    assert cache.get_stats()['similar_rejected'] == 1
+
+
+def test_the_first_image_of_a_size_is_a_miss(tmp_path):
+    cache = OCRCache(str(tmp_path / 'ocr.sqlite'), max_distance=4)
+    image = make_scan('1,000')
+    assert cache.get_similar('a', OCRCache.perceptual_hash(image), image) is None
+
+    store(cache, 'a', image, 'Total amount: 1,000')
+    other_size = image.resize((300, 200))
+    assert cache.get_similar('b', OCRCache.perceptual_hash(other_size), other_size) is None
+    stats = cache.get_stats()
+    assert stats['ocr_misses'] == 2 and stats['similar_rejected'] == 0
+
+
+def test_formatted_text_is_tied_to_the_format_key(tmp_path):
+    file_name = str(tmp_path / 'ocr.sqlite')
+    cache = OCRCache(file_name)
+    store(cache, 'a', make_scan('1,000'), 'Total amount: 1,000')
+    cache.set_formatted('a', 'prompt-and-model', 'formatted')
+
+    reopened = OCRCache(file_name)
+    assert reopened.get_formatted('a', 'prompt-and-model') == 'formatted'
+    assert reopened.get_formatted('a', 'another-model') is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = OCRCache(str(tmp_path / 'ocr.sqlite'), max_entries=2)
+    for digest in ('a', 'b', 'c'):
+        store(cache, digest, make_scan(digest), digest)
+
+    assert cache.get('a') is None
+    assert cache.get('c') == 'c'
+    assert cache.get_stats()['entries'] == 2
@@ -0,0 +1,42 @@
+import io
+
+import pymupdf
+from PIL import Image
+
+from models.OCRCache import OCRCache
+from models.PDFProcessor import extract_pdf_pages
+
+
+def write_pdf(file_name:str):
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 800), 'white').save(buffer, format='PNG')
+    with pymupdf.open() as pdf:
+        page = pdf.new_page(width=600, height=800)
+        xref = page.insert_image(pymupdf.Rect(0, 0, 300, 300), stream=buffer.getvalue())
+        page.insert_image(pymupdf.Rect(0, 400, 300, 700), xref=xref)
+        # 兩個位置上疊了不同的內容，渲染結果不同
+        page.insert_text((20, 150), 'Premium 1,000', fontsize=20)
+        page.insert_text((20, 550), 'Premium 7,000', fontsize=20)
+        pdf.save(file_name)
+        return pdf.xref_stream_raw(xref)
+
+
+def test_rendered_placements_are_keyed_by_their_pixels(tmp_path):
+    file_name = str(tmp_path / 'doc.pdf')
+    raw_stream = write_pdf(file_name)
+
+    images = extract_pdf_pages(file_name, min_width=500, min_height=500, backend='pymupdf', ocr_dpi=72, adaptive_ocr=False)[0]['images']
+
+    assert len(images) == 2
+    assert images[0]['digest'] != images[1]['digest']
+    assert OCRCache.make_digest(raw_stream) not in {image['digest'] for image in images}
+    assert all(image['digest'] == OCRCache.make_digest(image['png']) for image in images)
+
+
+def test_embedded_images_keep_the_xref_digest_without_rendering(tmp_path):
+    file_name = str(tmp_path / 'doc.pdf')
+    raw_stream = write_pdf(file_name)
+
+    images = extract_pdf_pages(file_name, min_width=500, min_height=500, backend='pymupdf', ocr_dpi=None, adaptive_ocr=False)[0]['images']
+
+    assert [image['digest'] for image in images] == [OCRCache.make_digest(raw_stream)] * 2
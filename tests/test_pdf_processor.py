@@ -0,0 +1,28 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from models import PDFProcessor
+
+
+def test_parallel_extraction_keeps_a_bounded_window_of_files(monkeypatch):
+    lock = threading.Lock()
+    submitted = []
+
+    def extract_pdf_pages(file_name, *args):
+        with lock:
+            submitted.append(file_name)
+        return [{'text': file_name, 'images': [], 'skipped_images': 0}]
+
+    # 以執行緒池代替程序池，才能替換擷取函式並記錄提交的檔案
+    monkeypatch.setattr(PDFProcessor, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(PDFProcessor, 'extract_pdf_pages', extract_pdf_pages)
+
+    file_names = [f'{i}.pdf' for i in range(20)]
+    consumed = []
+    for file_name, raw_pages in PDFProcessor.iter_raw_pdf_content(file_names, workers=2):
+        consumed.append(file_name)
+        assert raw_pages[0]['text'] == file_name
+        # 除了正在處理的檔案，最多再提交 2 * workers 個
+        assert len(submitted) <= len(consumed) + 4
+
+    assert consumed == file_names
@@ -0,0 +1,70 @@
+import pytest
+from langchain_core.embeddings import FakeEmbeddings
+
+from controllers.QuestionController import QuestionController
+from models.FakeChatModel import FakeChatModel
+from models.LangChainModel import FAILED_RESPONSE, LangChainModel
+from models.SemanticAnswerCache import SemanticAnswerCache
+
+
+class FakeIndexManager:
+    """Returns the same retrieved document for every question."""
+    def __init__(self, documents_context:str='文件內容', sources:list=None):
+        self.documents_context = documents_context
+        self.sources = sources or ['1']
+
+    def search(self, query:str, category:str, sources:list=None):
+        return self.documents_context, self.sources
+
+
+class ConstantEmbeddings(FakeEmbeddings):
+    """Embeds every question alike, so every cached answer is a near duplicate."""
+    def embed_query(self, text:str) -> list[float]:
+        return [1.0] * self.size
+
+
+def make_controller(answer_cache=None, max_retries:int=0, **fake_options) -> QuestionController:
+    llm_model = LangChainModel(chat_model=FakeChatModel(**fake_options), max_retries=max_retries, use_cache=False)
+    return QuestionController(FakeIndexManager(), llm_model, answer_cache)
+
+
+@pytest.fixture
+def answer_cache():
+    return SemanticAnswerCache(ConstantEmbeddings(size=8), file_name=':memory:', threshold=0.9)
+
+
+def test_stream_question_yields_sources_tokens_then_done():
+    events = list(make_controller().stream_question('保險金額是多少', 'insurance'))
+
+    assert events[0] == {'type': 'sources', 'sources': ['1']}
+    assert {event['type'] for event in events[1:-1]} == {'token'}
+    assert events[-1]['type'] == 'done'
+    assert 0 <= events[-1]['ttft_ms'] <= events[-1]['total_ms']
+
+
+def test_a_stream_that_fails_midway_is_not_cached(answer_cache):
+    question_controller = make_controller(answer_cache, error_after_chunks=2)
+
+    with pytest.raises(Exception):
+        list(question_controller.stream_question('保險金額是多少', 'insurance'))
+    assert answer_cache.get_stats()['entries'] == 0
+
+    # 第一段文字前就失敗的回覆也不快取
+    question_controller = make_controller(answer_cache, error_rate=1.0, error_status_code=400)
+    assert question_controller.handle_question('保險金額是多少', 'insurance')[0] == FAILED_RESPONSE
+    assert answer_cache.get_stats()['entries'] == 0
+
+
+def test_cached_answers_are_tied_to_the_model_and_the_documents(answer_cache):
+    question_controller = make_controller(answer_cache)
+    response, _ = question_controller.handle_question('保險金額是多少', 'insurance')
+    assert question_controller.handle_question('保險金額為多少', 'insurance')[0] == response
+    assert answer_cache.get_stats()['hits'] == 1
+
+    # 不同的模型或檢索內容不沿用快取
+    other_model = make_controller(answer_cache, reply_chars=10)
+    other_model.handle_question('保險金額是多少', 'insurance')
+    changed_documents = make_controller(answer_cache)
+    changed_documents.faiss_index_manager.documents_context = '更新後的文件內容'
+    changed_documents.handle_question('保險金額是多少', 'insurance')
+    assert answer_cache.get_stats()['version_mismatches'] == 2
@@ -0,0 +1,63 @@
+import models.RateLimiter as rate_limiter_module
+from models.RateLimiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds:float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def install_clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter_module.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rate_limiter_module.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_unlimited_never_waits(monkeypatch):
+    clock = install_clock(monkeypatch)
+    limiter = RateLimiter()
+    for _ in range(100):
+        limiter.acquire(10000)
+    assert clock.sleeps == []
+
+
+def test_requests_per_minute_waits_for_refill(monkeypatch):
+    clock = install_clock(monkeypatch)
+    limiter = RateLimiter(requests_per_minute=2)
+
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.sleeps == []
+
+    # 每分鐘 2 次，第三次需等半分鐘補回一次額度
+    limiter.acquire()
+    assert sum(clock.sleeps) == 30
+
+
+def test_tokens_per_minute_waits_for_enough_tokens(monkeypatch):
+    clock = install_clock(monkeypatch)
+    limiter = RateLimiter(tokens_per_minute=600)
+
+    limiter.acquire(500)
+    assert clock.sleeps == []
+    limiter.acquire(200)
+    # 剩 100 個 token，需補回 100 個，每秒補 10 個
+    assert sum(clock.sleeps) == 10
+
+
+def test_oversized_request_waits_at_most_one_minute(monkeypatch):
+    clock = install_clock(monkeypatch)
+    limiter = RateLimiter(tokens_per_minute=600)
+
+    limiter.acquire(600)
+    limiter.acquire(5000)
+    assert sum(clock.sleeps) == 60
@@ -0,0 +1,73 @@
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from models.SemanticAnswerCache import SemanticAnswerCache
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeds a question as the one-hot vector of the first keyword it contains."""
+    keywords = ['保險', '匯率', '利率', '手續費']
+
+    def embed_query(self, text:str) -> list[float]:
+        return [1.0 if keyword in text else 0.0 for keyword in self.keywords] + [0.01]
+
+    def embed_documents(self, texts:list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+def make_cache(file_name:str=':memory:', **options) -> SemanticAnswerCache:
+    return SemanticAnswerCache(KeywordEmbeddings(), file_name=file_name, threshold=0.9, **options)
+
+
+def test_near_duplicates_hit_only_with_the_same_sources_and_category():
+    answer_cache = make_cache()
+    answer_cache.set('保險金額是多少', 'insurance', None, ['1'], '一百萬', 1.5)
+
+    assert answer_cache.get('保險金額為多少', 'insurance', None, ['1']) == '一百萬'
+    assert answer_cache.get('匯率是多少', 'insurance', None, ['1']) is None
+    assert answer_cache.get('保險金額為多少', 'insurance', None, ['2']) is None
+    assert answer_cache.get('保險金額為多少', 'finance', None, ['1']) is None
+    assert answer_cache.get('保險金額為多少', 'insurance', ['1', '2'], ['1']) is None
+
+    stats = answer_cache.get_stats()
+    assert stats['hits'] == 1 and stats['source_mismatches'] == 1 and stats['saved_seconds'] == 1.5
+
+
+def test_expired_answers_are_dropped():
+    answer_cache = make_cache(ttl_seconds=0.05)
+    answer_cache.set('保險金額是多少', 'insurance', None, ['1'], '一百萬', 1.0)
+    time.sleep(0.1)
+
+    assert answer_cache.get('保險金額是多少', 'insurance', None, ['1']) is None
+    stats = answer_cache.get_stats()
+    assert stats['expired'] == 1 and stats['entries'] == 0
+
+
+def test_least_recently_used_answers_are_evicted_per_category():
+    answer_cache = make_cache(max_entries=2)
+    answer_cache.set('保險金額是多少', 'finance', None, ['1'], 'a', 1.0)
+    answer_cache.set('匯率是多少', 'finance', None, ['1'], 'b', 1.0)
+    answer_cache.get('保險金額是多少', 'finance', None, ['1'])
+    answer_cache.set('利率是多少', 'finance', None, ['1'], 'c', 1.0)
+    answer_cache.set('手續費是多少', 'insurance', None, ['1'], 'd', 1.0)
+
+    assert answer_cache.get('匯率是多少', 'finance', None, ['1']) is None
+    assert answer_cache.get('保險金額是多少', 'finance', None, ['1']) == 'a'
+    assert answer_cache.get('手續費是多少', 'insurance', None, ['1']) == 'd'
+    assert answer_cache.get_stats()['evictions'] == 1
+
+
+def test_answers_persist_across_instances(tmp_path):
+    file_name = str(tmp_path / 'answer_cache.sqlite')
+    answer_cache = make_cache(file_name)
+    answer_cache.set('保險金額是多少', 'insurance', None, ['1'], '一百萬', 1.0, version='v1')
+    answer_cache.set('匯率是多少', 'finance', None, ['2'], '三十', 1.0, version='v1')
+
+    reopened = make_cache(file_name)
+    assert reopened.get('保險金額為多少', 'insurance', None, ['1'], version='v1') == '一百萬'
+    assert reopened.get('保險金額為多少', 'insurance', None, ['1'], version='v2') is None
+
+    # 重新載入時清除已過期的答案
+    time.sleep(0.05)
+    assert make_cache(file_name, ttl_seconds=0.01).get_stats()['entries'] == 0
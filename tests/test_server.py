@@ -0,0 +1,100 @@
+import http.client
+import io
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from controllers.QuestionController import QuestionController
+from controllers.ServingController import ServingController
+from models.FakeChatModel import FakeChatModel
+from models.LangChainModel import LangChainModel
+from server import make_request_handler, serve_stdio
+
+
+class FakeIndexManager:
+    def search_many(self, queries:list, categories:list, sources_list:list):
+        return [(f'文件:{query}', [str(position)]) for position, query in enumerate(queries)]
+
+    def get_embedding_cache_stats(self) -> dict:
+        return {}
+
+    def get_registry_stats(self) -> dict:
+        return {}
+
+
+class SlowQuestionChatModel(FakeChatModel):
+    """Answers questions that mention 'slow' last, so replies finish out of input order."""
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if 'slow' in messages[-1].content:
+            time.sleep(0.3)
+        yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+
+@pytest.fixture
+def serving_controller():
+    llm_model = LangChainModel(chat_model=SlowQuestionChatModel(), max_retries=0, use_cache=False)
+    serving_controller = ServingController(QuestionController(FakeIndexManager(), llm_model), max_wait_ms=50.0, llm_workers=4)
+    yield serving_controller
+    serving_controller.close()
+
+
+def test_stdio_replies_are_written_in_input_order(serving_controller):
+    requests = [
+        {'qid': 1, 'query': 'slow question', 'category': 'faq'},
+        {'qid': 2, 'query': 'fast question', 'category': 'faq'},
+        {'command': 'health'},
+        {'qid': 3, 'query': 'streamed question', 'category': 'faq', 'stream': True},
+        {'qid': 4, 'query': 'another fast question', 'category': 'faq'},
+    ]
+    input_stream = io.StringIO('\n'.join(json.dumps(request) for request in requests) + '\nnot json\n')
+    output_stream = io.StringIO()
+
+    serve_stdio(serving_controller, input_stream, output_stream, timeout=5)
+
+    replies = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+    assert [reply.get('qid') for reply in replies[:2]] == [1, 2]
+    assert 'slow question' in replies[0]['response']
+    assert replies[2]['status'] == 'ok'
+    stream_replies = [reply for reply in replies[3:] if reply.get('qid') == 3]
+    assert [reply['type'] for reply in stream_replies][0] == 'sources' and stream_replies[-1]['type'] == 'done'
+    assert replies[3 + len(stream_replies)]['qid'] == 4
+    assert replies[-1]['error'].startswith('Invalid request')
+
+
+def test_http_answers_questions_and_streams_ndjson_events(serving_controller):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_request_handler(serving_controller, timeout=5))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+
+        connection.request('POST', '/question', json.dumps({'qid': 7, 'query': '保險金額是多少', 'category': 'insurance'}))
+        response = connection.getresponse()
+        body = json.loads(response.read())
+        assert response.status == 200
+        assert body['qid'] == 7 and body['retrieve'] == 0 and body['response'].startswith('[fake]')
+
+        connection.request('POST', '/question/stream', json.dumps({'qid': 8, 'query': '保險金額是多少', 'category': 'insurance'}))
+        response = connection.getresponse()
+        events = [json.loads(line) for line in response.read().decode('utf-8').splitlines()]
+        assert response.status == 200
+        assert events[0] == {'type': 'sources', 'sources': ['0'], 'qid': 8}
+        assert {event['type'] for event in events[1:-1]} == {'token'}
+        assert events[-1]['type'] == 'done'
+
+        connection.request('POST', '/question', json.dumps({'query': 1}))
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 400
+
+        connection.request('GET', '/metrics')
+        response = connection.getresponse()
+        metrics = json.loads(response.read())
+        assert metrics['requests']['requests'] == 2
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
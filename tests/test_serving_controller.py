@@ -0,0 +1,121 @@
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from controllers.QuestionController import QuestionController
+from controllers.ServingController import ServingController
+from models.FakeChatModel import FakeChatModel
+from models.LangChainModel import LangChainModel
+
+
+class FakeIndexManager:
+    """Records every `search_many` batch and returns one document per question."""
+    def __init__(self, delay:float=0.0, error:Exception=None):
+        self.delay = delay
+        self.error = error
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def search_many(self, queries:list, categories:list, sources_list:list):
+        with self._lock:
+            self.batches.append(list(queries))
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [(f'文件:{query}', ['1']) for query in queries]
+
+
+def make_serving_controller(index_manager=None, max_batch_size:int=32, max_wait_ms:float=200.0, **fake_options) -> ServingController:
+    llm_model = LangChainModel(chat_model=FakeChatModel(**fake_options), max_retries=0, use_cache=False)
+    question_controller = QuestionController(index_manager or FakeIndexManager(), llm_model)
+    return ServingController(question_controller, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, llm_workers=4)
+
+
+def test_concurrent_questions_are_retrieved_in_bounded_batches():
+    serving_controller = make_serving_controller(max_batch_size=3)
+    questions = [f'問題{i}是什麼' for i in range(5)]
+    try:
+        futures = [serving_controller.submit(question, 'faq') for question in questions]
+        results = [future.result(5) for future in futures]
+    finally:
+        serving_controller.close()
+
+    assert [len(batch) for batch in serving_controller.faiss_index_manager.batches] == [3, 2]
+    # 每題的回覆對應自己的問題
+    for question, (response, sources) in zip(questions, results):
+        assert question in response
+        assert sources == ['1']
+
+    stats = serving_controller._stats
+    assert stats['batches'] == 2 and stats['batched_questions'] == 5 and stats['max_batch_size'] == 3
+
+
+def test_a_slow_answer_times_out_for_the_caller_only():
+    serving_controller = make_serving_controller(max_wait_ms=1.0, latency_ms=300)
+    try:
+        with pytest.raises(TimeoutError):
+            serving_controller.handle_question('保險金額是多少', 'insurance', timeout=0.05)
+        # 逾時只影響呼叫端，答案仍會在背景完成
+        assert serving_controller.handle_question('保險金額是多少', 'insurance', timeout=5)[0].startswith('[fake]')
+    finally:
+        serving_controller.close()
+
+
+def test_a_stream_waits_for_retrieval_up_to_its_timeout():
+    serving_controller = make_serving_controller(FakeIndexManager(delay=0.3), max_wait_ms=1.0)
+    try:
+        events = serving_controller.stream_question('保險金額是多少', 'insurance', timeout=0.05)
+        with pytest.raises(TimeoutError):
+            next(events)
+    finally:
+        serving_controller.close()
+
+
+def test_streamed_answers_share_retrieval_batches_and_end_with_done():
+    serving_controller = make_serving_controller()
+    try:
+        streams = [serving_controller.stream_question(f'問題{i}是什麼', 'faq') for i in range(3)]
+        events = [list(stream) for stream in streams]
+    finally:
+        serving_controller.close()
+
+    assert [len(batch) for batch in serving_controller.faiss_index_manager.batches] == [3]
+    for stream_events in events:
+        assert [event['type'] for event in stream_events[:2]] == ['sources', 'token']
+        assert stream_events[-1]['type'] == 'done'
+    assert serving_controller.latency['ttft'].snapshot()['count'] == 3
+
+
+def test_retrieval_failures_are_counted_per_question():
+    serving_controller = make_serving_controller(FakeIndexManager(error=RuntimeError('index unavailable')))
+    try:
+        futures = [serving_controller.submit(f'問題{i}是什麼', 'faq') for i in range(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(5)
+    finally:
+        serving_controller.close()
+    assert serving_controller.get_health()['status'] == 'unavailable'
+    assert serving_controller._stats['errors'] == 2
+
+
+def test_close_answers_the_questions_already_queued():
+    serving_controller = make_serving_controller(max_wait_ms=50.0)
+    future = serving_controller.submit('保險金額是多少', 'insurance')
+    serving_controller.close()
+
+    assert future.result(0)[0].startswith('[fake]')
+    with pytest.raises(RuntimeError):
+        serving_controller.submit('保險金額是多少', 'insurance').result(0)
+
+
+def test_a_stream_failing_midway_is_counted_as_an_error():
+    serving_controller = make_serving_controller(error_after_chunks=1)
+    try:
+        with pytest.raises(Exception):
+            list(serving_controller.stream_question('保險金額是多少', 'insurance', timeout=5))
+    finally:
+        serving_controller.close()
+    assert serving_controller._stats['errors'] == 1
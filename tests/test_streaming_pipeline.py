@@ -0,0 +1,60 @@
+import threading
+import time
+
+from models.StreamingPipeline import PipelineStage, StreamingPipeline
+
+
+def test_a_slow_stage_holds_back_the_stages_before_it():
+    lock = threading.Lock()
+    counts = {'produced': 0, 'consumed': 0, 'max_in_flight': 0}
+
+    def produce(item):
+        with lock:
+            counts['produced'] += 1
+        return [item]
+
+    def consume(item):
+        time.sleep(0.005)
+        with lock:
+            counts['consumed'] += 1
+            counts['max_in_flight'] = max(counts['max_in_flight'], counts['produced'] - counts['consumed'])
+        return [item]
+
+    pipeline = StreamingPipeline([PipelineStage('produce', produce, queue_size=2), PipelineStage('consume', consume, queue_size=2)])
+    metrics = pipeline.run(range(50))
+
+    # 佇列中的 2 項、處理中的 1 項，以及上游阻塞在 put 的 1 項
+    assert counts['max_in_flight'] <= 4
+    assert metrics['stages']['consume']['max_queue_depth'] <= 2
+    assert metrics['stages']['consume']['items_out'] == 50
+
+
+def test_failing_items_are_counted_and_dropped():
+    def parse(item):
+        if item % 5 == 0:
+            raise ValueError(f'bad item {item}')
+        return [item]
+
+    collected = []
+    pipeline = StreamingPipeline([
+        PipelineStage('parse', parse, workers=3),
+        PipelineStage('collect', lambda batch: collected.extend(batch), batch_size=4),
+    ])
+    metrics = pipeline.run(range(20))
+
+    parse_metrics = metrics['stages']['parse']
+    assert parse_metrics['errors'] == 4
+    assert parse_metrics['items_in'] == 20 and parse_metrics['items_out'] == 16
+    assert sorted(collected) == [item for item in range(20) if item % 5]
+    assert metrics['stages']['collect']['items_in'] == 16
+
+
+def test_an_error_in_a_batch_counts_every_item_of_the_batch():
+    def write(batch):
+        raise OSError('disk full')
+
+    pipeline = StreamingPipeline([PipelineStage('write', write, batch_size=8)])
+    metrics = pipeline.run(range(10))
+
+    assert metrics['stages']['write']['errors'] == 10
+    assert metrics['stages']['write']['items_out'] == 0